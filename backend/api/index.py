@@ -1,75 +1,138 @@
-from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
 import os
 import sys
+import time
 import json
+import base64
+import asyncio
+import logging
 from urllib.parse import urlencode
 
+# 记录冷启动耗时：从入口模块开始加载到应用导入完成
+_import_started = time.perf_counter()
+
 # 添加后端目录到 Python 路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
 backend_dir = os.path.dirname(os.path.dirname(current_dir))
 sys.path.insert(0, backend_dir)
 
-from backend.app.main import app
+from backend.app.main import app  # CORS 中间件已在 main.py 中配置，这里不再重复添加
+
+logger = logging.getLogger(__name__)
+
+COLD_START_MS = round((time.perf_counter() - _import_started) * 1000, 1)
+logger.info(f"应用导入耗时: {COLD_START_MS}ms")
+
+# 首次请求在响应头中附带冷启动耗时，便于统计
+_cold_start_pending = True
+
+# 这些类型的响应体按文本返回，其余按 base64 编码的二进制返回
+TEXT_CONTENT_TYPES = ('text/', 'application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml')
+
+
+def _is_text_response(headers: dict) -> bool:
+    content_type = headers.get('content-type', '')
+    return content_type.startswith(TEXT_CONTENT_TYPES)
+
+
+def _build_scope(event: dict) -> dict:
+    """将 API Gateway 风格的事件转换为 ASGI HTTP scope"""
+    path = event.get('path', '') or '/'
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    query_params = event.get('queryStringParameters') or {}
+    multi_query = event.get('multiValueQueryStringParameters')
+    if multi_query:
+        query_string = urlencode([(k, v) for k, values in multi_query.items() for v in values])
+    else:
+        query_string = urlencode(query_params)
+
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0', 'spec_version': '2.3'},
+        'http_version': '1.1',
+        'method': event.get('httpMethod', 'GET').upper(),
+        'scheme': headers.get('x-forwarded-proto', 'https'),
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': query_string.encode(),
+        'headers': [[k.lower().encode('latin-1'), str(v).encode('latin-1')] for k, v in headers.items()],
+        'client': (headers.get('x-forwarded-for', '').split(',')[0].strip(), 0),
+        'server': (headers.get('host', ''), 443),
+    }
+
+
+def _decode_body(event: dict) -> bytes:
+    """按 isBase64Encoded 还原原始请求体（二进制上传必须保持字节不变）"""
+    body = event.get('body') or b''
+    if isinstance(body, str):
+        body = base64.b64decode(body) if event.get('isBase64Encoded') else body.encode('utf-8')
+    return body
+
+
+async def _run_asgi(scope: dict, body: bytes) -> dict:
+    """执行一次 ASGI 调用，收集状态码、响应头和完整响应体"""
+    request_messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {'status': 500, 'headers': [], 'body': bytearray()}
+    response_complete = asyncio.Event()
+
+    async def receive():
+        if request_messages:
+            return request_messages.pop(0)
+        # 请求体已发送完毕，等待响应结束后通知断开
+        await response_complete.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = message.get('headers', [])
+        elif message['type'] == 'http.response.body':
+            response['body'].extend(message.get('body', b''))
+            if not message.get('more_body', False):
+                response_complete.set()
+
+    await app(scope, receive, send)
+    response_complete.set()
+    return response
 
-# 配置 CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-# 使用简单的 lambda handler
 async def handler(event, context):
     """
     Vercel Serverless Function 处理器
-    处理来自 API Gateway 的请求并返回响应
+    将 API Gateway 事件转换为 ASGI 调用，并把响应转换回事件格式
     """
+    global _cold_start_pending
     try:
-        # 解析请求信息
-        path = event.get('path', '')
-        http_method = event.get('httpMethod', '')
-        headers = event.get('headers', {})
-        query_params = event.get('queryStringParameters', {})
-        body = event.get('body', '')
-        
-        # 如果body是JSON字符串，则解析它
-        if body and isinstance(body, str):
-            try:
-                body = json.loads(body)
-            except json.JSONDecodeError:
-                pass
-        
-        # 构建 ASGI scope
-        scope = {
-            'type': 'http',
-            'method': http_method,
-            'path': path,
-            'raw_path': path.encode(),
-            'headers': [[k.lower().encode(), v.encode()] for k, v in headers.items()],
-            'query_string': urlencode(query_params).encode() if query_params else b'',
-            'client': ('', 0),
-            'server': ('', 0),
-            'scheme': 'https',
-        }
-        
-        # 处理请求
-        response = await app(scope, lambda: body, lambda x: None)
-        
-        # 返回响应
+        response = await _run_asgi(_build_scope(event), _decode_body(event))
+
+        headers = {}
+        for key, value in response['headers']:
+            headers[key.decode('latin-1')] = value.decode('latin-1')
+        if _cold_start_pending:
+            _cold_start_pending = False
+            headers['x-cold-start-import-ms'] = str(COLD_START_MS)
+
+        body = bytes(response['body'])
+        if _is_text_response(headers):
+            return {
+                'statusCode': response['status'],
+                'headers': headers,
+                'body': body.decode('utf-8'),
+                'isBase64Encoded': False
+            }
         return {
-            'statusCode': response.status_code,
-            'headers': dict(response.headers),
-            'body': response.body.decode()
+            'statusCode': response['status'],
+            'headers': headers,
+            'body': base64.b64encode(body).decode('ascii'),
+            'isBase64Encoded': True
         }
-        
+
     except Exception as e:
         # 错误处理
+        logger.error(f"Serverless handler error: {str(e)}", exc_info=True)
         return {
             'statusCode': 500,
             'body': json.dumps({
                 'error': str(e)
             })
-        }
\ No newline at end of file
+        }
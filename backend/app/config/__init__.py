@@ -1 +1 @@
-from .prompts import SYSTEM_PROMPTS, POETRY_PROMPT 
\ No newline at end of file
+from .prompts import SYSTEM_PROMPTS, POETRY_PROMPT, PROMPT_VERSIONS, USER_TEMPLATES
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+import re
+import json
+import random
+import logging
+from typing import Dict, List, Optional, Tuple
+
+# 需要从日志中抹去的敏感配置项
+SECRET_ENV_VARS = ('IMGBB_API_KEY', 'DEEPSEEK_API_KEY', 'COZE_API_KEY', 'ADMIN_TOKEN', 'ADMISSION_API_KEYS')
+
+# 常见凭据格式：Bearer 令牌、Coze PAT、OpenAI 风格密钥、URL/表单中的 key 参数
+SECRET_PATTERNS = [
+    (re.compile(r'(Bearer\s+)[A-Za-z0-9._\-]+', re.IGNORECASE), r'\1***'),
+    (re.compile(r'\bpat_[A-Za-z0-9]+'), 'pat_***'),
+    (re.compile(r'\bsk-[A-Za-z0-9]{8,}'), 'sk-***'),
+    (re.compile(r'((?:api_)?key=)[^&\s\'"]+', re.IGNORECASE), r'\1***'),
+]
+
+# LogRecord 的内置属性，JSON 模式下其余属性作为附加字段输出
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class LazyJson:
+    """延迟序列化：只有日志真正输出时才执行 json.dumps"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self) -> str:
+        return json.dumps(self.value, ensure_ascii=False, default=str)
+
+
+class RedactingFilter(logging.Filter):
+    """抹去日志消息中的密钥、令牌等敏感信息
+
+    env_vars 中的密钥在过滤时读取，通过 /api/admin/reload-config 重新加载的密钥同样会被抹去；
+    逗号分隔的多值变量（如 ADMISSION_API_KEYS）逐项脱敏
+    """
+
+    def __init__(self, secrets: Optional[List[str]] = None, env_vars: Tuple[str, ...] = ()):
+        super().__init__()
+        self.static_secrets = [secret for secret in (secrets or []) if secret and len(secret) >= 6]
+        self.env_vars = env_vars
+        self._env_values: Optional[Tuple[str, ...]] = None
+        self._env_secrets: List[str] = []
+
+    @property
+    def secrets(self) -> List[str]:
+        values = tuple(os.environ.get(name, '') for name in self.env_vars)
+        if values != self._env_values:
+            self._env_secrets = [
+                secret for value in values for secret in (part.strip() for part in value.split(','))
+                if len(secret) >= 6
+            ]
+            self._env_values = values
+        return self.static_secrets + self._env_secrets
+
+    def redact(self, text: str) -> str:
+        for secret in self.secrets:
+            text = text.replace(secret, '***')
+        for pattern, replacement in SECRET_PATTERNS:
+            text = pattern.sub(replacement, text)
+        return text
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        redacted = self.redact(message)
+        if redacted != message:
+            record.msg, record.args = redacted, ()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """按 logger 名称前缀对低于 WARNING 的日志抽样输出，告警与错误始终保留"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # 前缀越长越优先匹配
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _rate(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + '.'):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """单行 JSON 日志，便于日志管道解析"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """解析 LOG_SAMPLE_RATES，如 app.services.image_service=0.1,uvicorn.access=0.01"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, rate = item.partition('=')
+        try:
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def setup_logging():
+    """按 LOG_LEVEL / LOG_FORMAT / LOG_SAMPLE_RATES 配置根日志：脱敏、抽样，可选 JSON 输出"""
+    handler = logging.StreamHandler()
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+
+    rates = parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', ''))
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+    # 抽样在前，被丢弃的日志不再做脱敏匹配
+    handler.addFilter(RedactingFilter(env_vars=SECRET_ENV_VARS))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
@@ -95,7 +95,21 @@ POETRY_PROMPT = """
     {你的点评内容}
 
     【SVG】
-    <svg width="96" height="120" xmlns="http://www.w3.org/2000/svg">
+    <svg viewBox="0 0 360 500" xmlns="http://www.w3.org/2000/svg">
     {你的SVG内容}
     </svg>
-""" 
\ No newline at end of file
+""" 
+
+# 提示词版本：修改提示词内容时递增，旧版本的生成缓存随之失效
+PROMPT_VERSIONS = {
+    'mood': 1,
+    'sarcastic': 1,
+    'story': 1,
+    'poetry': 2,
+}
+
+# 用户消息模板：可变数据统一放在末尾，系统提示词与模板前缀保持逐字不变，便于上游前缀缓存命中
+USER_TEMPLATES = {
+    'image': "请基于这张图片进行创作: {image_url}",
+    'poetry': "请为这段文字提供诗意点评和配图：{text}",
+}
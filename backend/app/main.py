@@ -1,23 +1,103 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Depends, Header
+from fastapi.responses import JSONResponse, StreamingResponse, Response, FileResponse
 import logging
 import os
+import time
+import asyncio
+import json
+import base64
+from typing import TYPE_CHECKING, List, Optional
+from urllib.parse import quote
 from dotenv import load_dotenv
-from .services.imgbb_service import ImgBBService
-from .services.coze_service import CozeService
-from .services.deepseek_service import DeepseekService
+from .config.log_config import setup_logging
+from .services.registry import ServiceRegistry, TEXT_PROVIDERS
+from .services.cache import content_hash
+from .services.generation_cache import normalize_text
+from .services.svg_pipeline import clean_svg, svg_precision
+from .services.upload_ingest import (
+    UploadLimits, UploadRejected, UploadSizeMiddleware, ingest_image, ingest_upload, read_spooled, spool_upload
+)
+from .services.job_queue import IdempotencyConflictError, JobQueue, QueueFullError, create_job_queue
+from .services.resilience import deadline_scope
+from .services.admission import AdmissionMiddleware, create_admission_controller
+from .services.metrics import (
+    HTTP_DURATION, HTTP_REQUESTS, format_metric, metrics, request_timings, server_timing, timed
+)
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+
+if TYPE_CHECKING:
+    # 服务模块依赖 PIL、httpx 等重型库，由注册表在首次使用时导入
+    from .services.imgbb_service import ImgBBService
+    from .services.image_service import PostcardEncoding
 
 # 加载环境变量
 load_dotenv()
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 配置日志：脱敏、按需抽样，LOG_FORMAT=json 时输出结构化日志
+setup_logging()
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时构建服务注册表及共享连接池，关闭时释放"""
+    registry = ServiceRegistry()
+    # 长驻进程在启动时预导入并构建服务，避免首个请求承担导入开销
+    if os.getenv('WARMUP_ON_STARTUP', 'true').lower() != 'false':
+        registry.warm_up()
+    app.state.registry = registry
+    app.state.job_queue = create_job_queue()
+    app.state.job_queue.start()
+    try:
+        yield
+    finally:
+        await app.state.job_queue.stop()
+        await registry.aclose()
+
+def get_registry(request: Request) -> ServiceRegistry:
+    """获取服务注册表（未经过 lifespan 时按需创建）"""
+    if not hasattr(request.app.state, 'registry'):
+        request.app.state.registry = ServiceRegistry()
+    return request.app.state.registry
+
+def get_job_queue(request: Request) -> JobQueue:
+    """获取后台任务队列"""
+    if not hasattr(request.app.state, 'job_queue'):
+        raise HTTPException(status_code=503, detail="任务队列未启动")
+    return request.app.state.job_queue
+
+def get_imgbb_service(registry: ServiceRegistry = Depends(get_registry)) -> 'ImgBBService':
+    """注入 ImgBB 服务"""
+    try:
+        return registry.imgbb
+    except ValueError as e:
+        logger.error("ImgBB 服务不可用: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
 # 创建 FastAPI 应用
-app = FastAPI(title="AI图片处理服务")
+app = FastAPI(title="AI图片处理服务", lifespan=lifespan)
+
+# 准入控制：按客户端限速、上游排队上限与接口并发上限，超限返回 429；先于 CORS 注册，拒绝响应同样带跨域头
+admission = create_admission_controller()
+
+# 上传接口：在解析 multipart 之前按实际接收的字节数拒绝超大请求（批量接口按总大小限制）
+SINGLE_UPLOAD_PATHS = {"/api/process-image", "/api/process-image/stream", "/api/jobs/process-image", "/api/resize-image"}
+MULTIPART_OVERHEAD = 64 * 1024
+
+def _upload_limit(scope: dict) -> Optional[int]:
+    """请求体的字节上限，不受限的接口返回 None"""
+    if scope.get('path') == "/api/process-images/batch":
+        return int(os.getenv('BATCH_MAX_BYTES', 200 * 1024 * 1024)) + MULTIPART_OVERHEAD
+    if scope.get('path') not in SINGLE_UPLOAD_PATHS:
+        return None
+    registry = getattr(scope['app'].state, 'registry', None) if 'app' in scope else None
+    limits = registry.upload_limits if registry is not None else UploadLimits.from_env()
+    return limits.max_bytes + MULTIPART_OVERHEAD
+
+# 中间件后注册者在外层：请求依次经过 CORS、准入控制、请求体大小限制
+app.add_middleware(UploadSizeMiddleware, limit_for=_upload_limit)
+app.add_middleware(AdmissionMiddleware, controller=admission)
 
 # CORS 中间件配置
 app.add_middleware(
@@ -28,6 +108,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 单个请求的总处理预算（秒），各上游阶段的超时不会超过剩余预算；批量接口按条目处理，不设总预算
+REQUEST_BUDGET = float(os.getenv('REQUEST_BUDGET', 90))
+DEADLINE_EXEMPT_PATHS = {"/api/process-images/batch"}
+
+@app.middleware("http")
+async def request_deadline(request: Request, call_next):
+    if request.url.path in DEADLINE_EXEMPT_PATHS:
+        return await call_next(request)
+    with deadline_scope(REQUEST_BUDGET):
+        return await call_next(request)
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    """记录请求数与耗时，并通过 Server-Timing 响应头返回各阶段耗时"""
+    started = time.perf_counter()
+    with request_timings() as timings:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    # 使用路由模板作为标签，避免路径参数导致标签基数膨胀
+    route = request.scope.get('route')
+    path = getattr(route, 'path', 'unmatched')
+    HTTP_REQUESTS.inc(method=request.method, path=path, status=response.status_code)
+    HTTP_DURATION.observe(elapsed, path=path)
+    response.headers['Server-Timing'] = server_timing(timings, elapsed)
+    return response
+
 # 确保 Vercel 可以找到应用实例
 app = module = app
 
@@ -35,6 +141,173 @@ app = module = app
 class PoetryRequest(BaseModel):
     text: str
     model: str = "deepseek"
+    # 可选 png / webp / jpeg：在服务端渲染整张卡片，返回短期有效的 card_url
+    render: Optional[str] = None
+
+class PoetryCardRequest(BaseModel):
+    comment: str
+    svg: str
+    format: str = "png"
+
+def _get_text_service(registry: ServiceRegistry, model: str):
+    """从注册表获取文本生成服务，配置缺失时返回 500"""
+    try:
+        return registry.text_service(model)
+    except ValueError as e:
+        logger.error("文本服务不可用: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 指定的模型失败或不可用时自动切换到另一个后端；model=auto 时按观测耗时与错误率选择
+MODEL_FALLBACK = os.getenv('MODEL_FALLBACK', 'true').lower() != 'false'
+
+def _provider_candidates(model: str, fallback: bool = True) -> List[str]:
+    """请求的模型对应的候选后端，指定模型时排在首位"""
+    if model == "auto":
+        return list(TEXT_PROVIDERS)
+    if model not in TEXT_PROVIDERS:
+        raise HTTPException(status_code=400, detail=f"不支持的模型: {model}")
+    if not (fallback and MODEL_FALLBACK):
+        return [model]
+    return [model] + [name for name in TEXT_PROVIDERS if name != model]
+
+def _select_provider(registry: ServiceRegistry, model: str) -> str:
+    """为无法中途切换的调用（流式输出）选定一个后端；均未配置时返回首个候选，由构建服务时报告配置错误"""
+    candidates = _provider_candidates(model)
+    ordered = registry.router.order(candidates, None if model == "auto" else model)
+    return ordered[0] if ordered else candidates[0]
+
+async def _route_text_call(registry: ServiceRegistry, model: str, call, fallback: bool = True):
+    """按模型选择文本后端并调用，首选后端失败时依次尝试其余候选"""
+    candidates = _provider_candidates(model, fallback)
+    if not any(registry.provider_available(name) for name in candidates):
+        raise HTTPException(status_code=503, detail="文本生成服务暂不可用")
+    _, result = await registry.router.run(candidates, call, preferred=None if model == "auto" else model)
+    return result
+
+async def _read_image_upload(file: UploadFile, registry: ServiceRegistry, downscale: bool = True) -> bytes:
+    """分块读取上传文件并按文件头校验图片，超限或非图片时返回 4xx"""
+    try:
+        with timed('upload_read'):
+            return await ingest_upload(file, registry.upload_limits, registry.image.run_in_executor, downscale)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+async def _prepare_image(
+    registry: ServiceRegistry,
+    imgbb_service: 'ImgBBService',
+    contents: bytes,
+    decode: bool
+) -> tuple:
+    """上传图片到 ImgBB 获取 URL；decode 为 True 时同时在线程池中解码原图
+
+    返回 (image_url, image, image_hash)，image 解码失败或未解码时为 None
+    """
+    # 本地渲染明信片时：上传的同时解码原图，渲染时不再从 ImgBB 回源下载
+    decode_task = asyncio.create_task(registry.image.load_image(contents)) if decode else None
+    
+    image_hash = content_hash(contents)
+    try:
+        image_url = await imgbb_service.upload_image(contents, image_hash=image_hash)
+    except BaseException:
+        if decode_task:
+            decode_task.cancel()
+        raise
+    
+    if not image_url:
+        if decode_task:
+            decode_task.cancel()
+        logger.error("图片上传失败")
+        raise HTTPException(status_code=400, detail="图片上传失败，请稍后重试")
+    
+    image = None
+    if decode_task:
+        try:
+            image = await decode_task
+        except Exception as e:
+            logger.warning("本地解码图片失败，回退为下载渲染: %s", e)
+    
+    return image_url, image, image_hash
+
+async def _run_image_pipeline(
+    registry: ServiceRegistry,
+    imgbb_service: 'ImgBBService',
+    contents: bytes,
+    workflow_type: str,
+    model: str,
+    encoding: Optional['PostcardEncoding'] = None,
+    binary: bool = False
+) -> dict:
+    """图片处理流程：上传 ImgBB 获取 URL，调用模型生成文案并渲染明信片"""
+    _provider_candidates(model)
+    prepared = await _prepare_image(
+        registry, imgbb_service, contents, decode=model != "coze"
+    )
+    return await _process_prepared(registry, model, prepared, workflow_type, encoding, binary)
+
+async def _process_prepared(
+    registry: ServiceRegistry,
+    model: str,
+    prepared: tuple,
+    workflow_type: str,
+    encoding: Optional['PostcardEncoding'] = None,
+    binary: bool = False,
+    candidate: int = 0
+) -> dict:
+    """基于已上传（及已解码）的图片生成文案和明信片，candidate 区分同一工作流的多个候选"""
+    image_url, image, image_hash = prepared
+    
+    async def call(provider: str):
+        service = registry.get(provider)
+        if provider == "deepseek":
+            return await service.process_image(
+                image_url, workflow_type, image=image, image_hash=image_hash,
+                encoding=encoding, binary=binary, candidate=candidate
+            )
+        result = await service.process_image(image_url, workflow_type)
+        if not result or model == "coze":
+            return result
+        # 作为替代后端时用 Coze 的文案在本地渲染明信片，返回格式与 DeepSeek 一致
+        if not result.get('comment'):
+            return None
+        return await registry.image.postcard_result(
+            result['comment'], image_url=image_url, image=image, encoding=encoding, binary=binary
+        )
+    
+    # 明确选择 Coze 时保持其原有返回格式（comment / svg），不切换到 DeepSeek
+    # 相同图片内容 + 工作流 + 候选序号 + 模型 + 输出编码的并发请求共享一次生成
+    encoding_key = (encoding.format, encoding.quality, encoding.max_dimension) if encoding else None
+    result = await registry.single_flight.do(
+        ('image', image_hash, workflow_type, candidate, model, encoding_key, binary),
+        lambda: _route_text_call(registry, model, call, fallback=model != "coze"),
+        kind='image'
+    )
+    
+    if not result:
+        raise HTTPException(status_code=400, detail="图片处理失败")
+    
+    return result
+
+def _sse_event(event: str, data: dict) -> str:
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _sse_response(events) -> StreamingResponse:
+    """将 (事件名, 数据) 异步迭代器包装为 SSE 响应，异常以 error 事件推送"""
+    async def generate():
+        try:
+            async for event, data in events:
+                yield _sse_event(event, data)
+        except HTTPException as he:
+            yield _sse_event('error', {'detail': he.detail})
+        except Exception as e:
+            logger.error("Streaming error: %s", e)
+            yield _sse_event('error', {'detail': str(e)})
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/")
 async def root():
@@ -49,77 +322,594 @@ async def test_route():
             "status": "ok"
         }
     except Exception as e:
-        logger.error(f"Test route error: {str(e)}")
+        logger.error("Test route error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+# 按 Accept 协商明信片格式时的优先顺序及各格式默认质量
+POSTCARD_FORMAT_PREFERENCE = ['avif', 'webp', 'jpeg']
+POSTCARD_DEFAULT_QUALITY = {'jpeg': 95, 'webp': 80, 'avif': 60, 'png': 100}
+
+def _negotiate_encoding(
+    accept: Optional[str],
+    format: Optional[str],
+    quality: Optional[int],
+    max_dimension: Optional[int]
+) -> 'PostcardEncoding':
+    """确定明信片编码：显式 format 优先，否则按 Accept 头选择客户端支持的最优格式"""
+    from .services.image_service import PostcardEncoding
+
+    if not format:
+        format = os.getenv('POSTCARD_FORMAT', 'jpeg')
+        accepted = [item.split(';')[0].strip().lower() for item in (accept or '').split(',')]
+        for candidate in POSTCARD_FORMAT_PREFERENCE:
+            if f"image/{candidate}" in accepted and PostcardEncoding.is_supported(candidate):
+                format = candidate
+                break
+    format = format.lower().replace('jpg', 'jpeg')
+    if format not in PostcardEncoding.FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的输出格式: {format}")
+    
+    if quality is None:
+        quality = int(os.getenv('POSTCARD_QUALITY', POSTCARD_DEFAULT_QUALITY[format]))
+    if max_dimension is None and os.getenv('POSTCARD_MAX_DIMENSION'):
+        max_dimension = int(os.getenv('POSTCARD_MAX_DIMENSION'))
+    return PostcardEncoding(format, quality=quality, max_dimension=max_dimension)
+
+async def _postcard_response(result: dict, response_mode: str, registry: ServiceRegistry):
+    """按响应模式返回明信片：binary 直接返回图片字节，url 返回短期有效的下载地址"""
+    if 'postcard_bytes' not in result:
+        return result
+    
+    if response_mode == "binary":
+        return Response(
+            content=result['postcard_bytes'],
+            media_type=result['media_type'],
+            headers={"X-Postcard-Text": quote(result['text'])}
+        )
+    
+    artifact_id = await registry.artifacts.save(result['postcard_bytes'], result['media_type'])
+    return {
+        "text": result['text'],
+        "postcard_url": f"/api/artifacts/{artifact_id}",
+        "media_type": result['media_type']
+    }
+
+def _parse_variants(workflow_type: str, workflow_types: List[str], n: int) -> List[tuple]:
+    """解析多结果请求：workflow_types 为多个工作流（可重复传入），n 为每个工作流的候选数
+
+    返回 [(工作流, 候选序号)]，总数受 MAX_VARIANTS 限制
+    """
+    types = list(dict.fromkeys(t.strip() for t in (workflow_types or [workflow_type]) if t.strip()))
+    max_variants = int(os.getenv('MAX_VARIANTS', 9))
+    if not types or n < 1 or len(types) * n > max_variants:
+        raise HTTPException(status_code=400, detail=f"单次请求最多生成 {max_variants} 个结果")
+    return [(t, candidate) for t in types for candidate in range(n)]
+
+async def _run_variants(
+    registry: ServiceRegistry,
+    imgbb_service: 'ImgBBService',
+    contents: bytes,
+    variants: List[tuple],
+    model: str,
+    encoding: 'PostcardEncoding',
+    response_mode: str
+) -> dict:
+    """多结果生成：图片只上传、解码一次，各工作流/候选的文案并发生成，并基于同一张原图渲染明信片"""
+    _provider_candidates(model)
+    prepared = await _prepare_image(registry, imgbb_service, contents, decode=model != "coze")
+    binary = response_mode != "json"
+    
+    async def run_variant(workflow_type: str, candidate: int) -> dict:
+        item = {"workflow_type": workflow_type, "candidate": candidate}
+        try:
+            result = await _process_prepared(registry, model, prepared, workflow_type, encoding, binary, candidate)
+            item.update(status="ok", result=await _postcard_response(result, response_mode, registry))
+        except HTTPException as he:
+            item.update(status="error", detail=he.detail)
+        except Exception as e:
+            logger.error("Variant %s#%s error: %s", workflow_type, candidate, e)
+            item.update(status="error", detail=str(e))
+        return item
+    
+    items = await asyncio.gather(*(run_variant(workflow_type, candidate) for workflow_type, candidate in variants))
+    if all(item["status"] == "error" for item in items):
+        raise HTTPException(status_code=400, detail=items[0]["detail"])
+    return {"image_url": prepared[0], "variants": items}
+
 @app.post("/api/process-image")
 async def process_image(
+    request: Request,
     file: UploadFile = File(...),
     workflow_type: str = Form("mood"),
-    model: str = Form("deepseek")
+    workflow_types: List[str] = Form([]),
+    n: int = Form(1),
+    model: str = Form("deepseek"),
+    response_mode: str = Form("json"),
+    format: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None),
+    max_dimension: Optional[int] = Form(None),
+    registry: ServiceRegistry = Depends(get_registry),
+    imgbb_service: 'ImgBBService' = Depends(get_imgbb_service)
 ):
-    """处理图片API"""
+    """处理图片API
+
+    response_mode: json（默认，base64 data URL）| binary（图片字节，文案在 X-Postcard-Text 头）| url（临时下载地址）
+    workflow_types / n: 一次生成多个工作流、每个工作流 n 个候选，结果在 variants 中（不支持 binary）
+    """
     try:
-        logger.info(f"Processing image with workflow: {workflow_type}, model: {model}")
-        
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="只支持图片文件")
+        variants = _parse_variants(workflow_type, workflow_types, n)
+        logger.info("Processing image with workflow: %s x %s, model: %s", workflow_types or workflow_type, n, model)
         
-        contents = await file.read()
+        if response_mode not in ("json", "binary", "url"):
+            raise HTTPException(status_code=400, detail=f"不支持的响应模式: {response_mode}")
+        multi = bool(workflow_types) or n > 1
+        if multi and response_mode == "binary":
+            raise HTTPException(status_code=400, detail="多结果请求请使用 json 或 url 响应模式")
         
-        imgbb_service = ImgBBService()
-        image_url = await imgbb_service.upload_image(contents)
+        # JSON 模式下 Accept 为 application/json，只有显式 format 才改变编码
+        accept = request.headers.get('accept') if response_mode != "json" else None
+        encoding = _negotiate_encoding(accept, format, quality, max_dimension)
+        binary = response_mode != "json"
         
-        if not image_url:
-            logger.error("图片上传失败")
-            raise HTTPException(status_code=400, detail="图片上传失败，请稍后重试")
+        contents = await _read_image_upload(file, registry)
         
-        # 根据选择的模型调用相应的服务
-        service = DeepseekService() if model == "deepseek" else CozeService()
-        result = await service.process_image(image_url, workflow_type)
+        if multi:
+            return await _run_variants(registry, imgbb_service, contents, variants, model, encoding, response_mode)
         
-        if not result:
-            raise HTTPException(status_code=400, detail="图片处理失败")
-        
-        return result
+        result = await _run_image_pipeline(
+            registry, imgbb_service, contents, workflow_type, model, encoding, binary
+        )
+        return await _postcard_response(result, response_mode, registry)
         
     except HTTPException as he:
         raise he
+    except asyncio.TimeoutError as e:
+        logger.error("Processing timeout: %s", e)
+        raise HTTPException(status_code=504, detail="处理超时，请稍后重试")
     except Exception as e:
-        logger.error(f"Processing error: {str(e)}")
+        logger.error("Processing error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _render_poetry_card(registry: ServiceRegistry, result: dict, encoding: 'PostcardEncoding') -> Optional[dict]:
+    """渲染诗意卡片并保存为产物，相同内容复用已渲染的产物；无法渲染时返回 None"""
+    key = content_hash(f"{encoding.format}\n{result['comment']}\n{result['svg']}".encode('utf-8'))
+    cache = registry.caches.get('card')
+    artifact_id = await cache.get(key) if cache else None
+    if artifact_id is None or registry.artifacts.get(artifact_id) is None:
+        card = await registry.image.render_poetry_card(result['comment'], result['svg'], encoding)
+        if card is None:
+            return None
+        artifact_id = await registry.artifacts.save(card, encoding.media_type)
+        if cache:
+            await cache.set(key, artifact_id)
+    return {"card_url": f"/api/artifacts/{artifact_id}", "media_type": encoding.media_type}
+
+async def _finalize_poetry(registry: ServiceRegistry, result: dict, encoding: Optional['PostcardEncoding']) -> dict:
+    """清理并压缩模型输出的 SVG；指定渲染格式时附带服务端渲染的卡片地址
+
+    模型给出了插图但无法修复时 svg_dropped 为 True，前端据此提示插图已省略
+    """
+    raw_svg = result.get('svg') or ''
+    svg = clean_svg(raw_svg, svg_precision())
+    result = dict(result, svg=svg, svg_dropped=bool(raw_svg.strip()) and not svg)
+    if encoding is not None and result['svg']:
+        card = await _render_poetry_card(registry, result, encoding)
+        if card:
+            result.update(card)
+    return result
+
+# 按需渲染诗意卡片时允许提交的点评与 SVG 长度上限（字符）
+POETRY_CARD_MAX_COMMENT = 2000
+POETRY_CARD_MAX_SVG = 20_000
+
+def _poetry_encoding(render: Optional[str]) -> Optional['PostcardEncoding']:
+    """解析诗意卡片的渲染格式，未指定时不渲染"""
+    if not render:
+        return None
+    return _negotiate_encoding(None, render, None, None)
+
 @app.post("/api/process-poetry")
-async def process_poetry(request: PoetryRequest):
+async def process_poetry(request: PoetryRequest, registry: ServiceRegistry = Depends(get_registry)):
     """处理诗歌生成请求"""
     try:
-        logger.info(f"Processing poetry with text: {request.text}")
+        logger.info("Processing poetry, text length: %d", len(request.text))
+        encoding = _poetry_encoding(request.render)
         
-        # 根据选择的模型调用相应的服务
-        service = DeepseekService() if request.model == "deepseek" else CozeService()
-        result = await service.process_poetry(request.text)
+        # 按模型选择后端，失败时切换到另一个后端；相同文本的并发请求共享一次生成
+        result = await registry.single_flight.do(
+            ('poetry', normalize_text(request.text), request.model),
+            lambda: _route_text_call(
+                registry, request.model, lambda provider: registry.get(provider).process_poetry(request.text)
+            ),
+            kind='poetry'
+        )
         
         if not result:
             raise HTTPException(status_code=400, detail="诗歌生成失败")
         
-        return result
+        return await _finalize_poetry(registry, result, encoding)
         
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError as e:
+        logger.error("Poetry processing timeout: %s", e)
+        raise HTTPException(status_code=504, detail="诗歌生成超时，请稍后重试")
     except Exception as e:
-        logger.error(f"Poetry processing error: {str(e)}")
+        logger.error("Poetry processing error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/process-image/stream")
+async def process_image_stream(
+    file: UploadFile = File(...),
+    workflow_type: str = Form("mood"),
+    model: str = Form("deepseek"),
+    registry: ServiceRegistry = Depends(get_registry),
+    imgbb_service: 'ImgBBService' = Depends(get_imgbb_service)
+):
+    """流式处理图片API（SSE）：uploaded -> token... -> text -> done"""
+    logger.info("Streaming image with workflow: %s, model: %s", workflow_type, model)
+    
+    contents = await _read_image_upload(file, registry)
+    # 流式输出开始后无法切换后端，只在开始前选定
+    model = _select_provider(registry, model)
+    service = _get_text_service(registry, model)
+    
+    async def events():
+        image_url, image, image_hash = await _prepare_image(
+            registry, imgbb_service, contents, decode=model == "deepseek"
+        )
+        yield 'uploaded', {'image_url': image_url}
+        
+        if model == "deepseek":
+            async for event in service.stream_image(image_url, workflow_type, image=image, image_hash=image_hash):
+                yield event
+        else:
+            # Coze 工作流不支持流式输出，完成后一次性推送
+            result = await service.process_image(image_url, workflow_type)
+            if not result:
+                raise HTTPException(status_code=400, detail="图片处理失败")
+            yield 'done', result
+    
+    return _sse_response(events())
+
+@app.post("/api/poetry-card")
+async def render_poetry_card(request: PoetryCardRequest, registry: ServiceRegistry = Depends(get_registry)):
+    """按页面上已生成的点评与 SVG 渲染诗意卡片，直接返回图片，供「查看图片」时按需调用"""
+    if len(request.comment) > POETRY_CARD_MAX_COMMENT or len(request.svg) > POETRY_CARD_MAX_SVG:
+        raise HTTPException(status_code=413, detail="卡片内容过长")
+    encoding = _poetry_encoding(request.format)
+    svg = clean_svg(request.svg, svg_precision())
+    card = await registry.image.render_poetry_card(request.comment, svg, encoding) if svg else None
+    if card is None:
+        raise HTTPException(status_code=503, detail="服务端暂不支持渲染诗意卡片")
+    return Response(content=card, media_type=encoding.media_type, headers={"Cache-Control": "no-store"})
+
+@app.post("/api/process-poetry/stream")
+async def process_poetry_stream(request: PoetryRequest, registry: ServiceRegistry = Depends(get_registry)):
+    """流式处理诗歌生成请求（SSE）：token... -> comment -> done [-> card]"""
+    logger.info("Streaming poetry, text length: %d", len(request.text))
+    encoding = _poetry_encoding(request.render)
+    model = _select_provider(registry, request.model)
+    service = _get_text_service(registry, model)
+    
+    async def generate():
+        if model == "deepseek":
+            async for event in service.stream_poetry(request.text):
+                yield event
+        else:
+            result = await service.process_poetry(request.text)
+            if not result:
+                raise HTTPException(status_code=400, detail="诗歌生成失败")
+            yield 'comment', {'comment': result['comment']}
+            yield 'done', result
+    
+    async def events():
+        async for name, data in generate():
+            if name != 'done':
+                yield name, data
+                continue
+            # 先推送清理后的文案与 SVG，卡片渲染完成后再单独推送
+            result = await _finalize_poetry(registry, data, None)
+            yield 'done', result
+            if encoding is not None and result['svg']:
+                card = await _render_poetry_card(registry, result, encoding)
+                if card:
+                    yield 'card', card
+    
+    return _sse_response(events())
+
+RESIZE_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'jpg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+def _parse_sizes(width: Optional[int], height: Optional[int], sizes: Optional[str]) -> list:
+    """解析目标尺寸：width/height，或 sizes（如 800x600,400x300）"""
+    parsed = []
+    try:
+        if sizes:
+            for item in sizes.split(','):
+                w, h = item.lower().strip().split('x')
+                parsed.append((int(w), int(h)))
+        elif width is not None and height is not None:
+            parsed.append((int(width), int(height)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"尺寸格式错误: {sizes}")
+    
+    if not parsed:
+        raise HTTPException(status_code=400, detail="请提供目标宽高")
+    max_sizes = int(os.getenv('RESIZE_MAX_SIZES', 8))
+    if len(parsed) > max_sizes:
+        raise HTTPException(status_code=400, detail=f"单次最多输出 {max_sizes} 个尺寸")
+    max_dimension = int(os.getenv('RESIZE_MAX_DIMENSION', 10000))
+    for w, h in parsed:
+        if not (0 < w <= max_dimension and 0 < h <= max_dimension):
+            raise HTTPException(status_code=400, detail=f"尺寸超出范围: {w}x{h}")
+    # 所有尺寸的输出同时驻留内存，按总像素数限制
+    max_pixels = int(os.getenv('RESIZE_MAX_TOTAL_PIXELS', 100_000_000))
+    if sum(w * h for w, h in parsed) > max_pixels:
+        raise HTTPException(status_code=400, detail=f"输出总像素超出上限 {max_pixels}")
+    return parsed
+
+@app.post("/api/resize-image")
+async def resize_image(
+    file: UploadFile = File(...),
+    width: Optional[int] = Form(None),
+    height: Optional[int] = Form(None),
+    sizes: Optional[str] = Form(None),
+    format: str = Form("png"),
+    quality: int = Form(90),
+    response_format: str = Form("base64"),
+    registry: ServiceRegistry = Depends(get_registry)
+):
+    """调整图片尺寸，支持一次输出多个尺寸；response_format=binary 时直接返回图片字节（仅限单个尺寸）"""
+    if format.lower() not in RESIZE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的输出格式: {format}")
+    
+    target_sizes = _parse_sizes(width, height, sizes)
+    if response_format == "binary" and len(target_sizes) > 1:
+        raise HTTPException(status_code=400, detail="binary 模式仅支持单个尺寸")
+    
+    pil_format, media_type = RESIZE_FORMATS[format.lower()]
+    contents = await _read_image_upload(file, registry, downscale=False)
+    
+    try:
+        outputs = await registry.image.resize_to_sizes(contents, target_sizes, pil_format, quality)
+    except Exception as e:
+        logger.error("Resize error: %s", e)
+        raise HTTPException(status_code=400, detail="图片调整失败，请确认文件为有效图片")
+    
+    if response_format == "binary":
+        return Response(content=outputs[0]['data'], media_type=media_type)
+    
+    images = [
+        {
+            "width": output['width'],
+            "height": output['height'],
+            "resized_image": f"data:{media_type};base64,{base64.b64encode(output['data']).decode()}"
+        }
+        for output in outputs
+    ]
+    return {
+        "resized_image": images[0]["resized_image"],
+        "images": images
+    }
+
+def _close_spooled(uploads: list):
+    for _, spooled in uploads:
+        spooled.close()
+
+@app.post("/api/process-images/batch")
+async def process_images_batch(
+    files: List[UploadFile] = File(...),
+    workflow_types: List[str] = Form(["mood"]),
+    model: str = Form("deepseek"),
+    registry: ServiceRegistry = Depends(get_registry),
+    imgbb_service: 'ImgBBService' = Depends(get_imgbb_service)
+):
+    """批量处理图片：每张图片只上传一次，按工作流并发生成，结果以 NDJSON 按完成顺序流式返回"""
+    max_items = int(os.getenv('BATCH_MAX_ITEMS', 600))
+    if len(files) * len(workflow_types) > max_items:
+        raise HTTPException(status_code=400, detail=f"单次批量任务最多 {max_items} 项")
+    logger.info("Processing batch: %s files x %s, model: %s", len(files), workflow_types, model)
+    
+    _provider_candidates(model)
+    # 响应开始流式发送前把各文件复制到独立的临时文件（请求结束后上传文件会被关闭），处理到该文件时才读入内存
+    max_total = int(os.getenv('BATCH_MAX_BYTES', 200 * 1024 * 1024))
+    uploads = []
+    try:
+        total = 0
+        for file in files:
+            spooled, size = await spool_upload(file, registry.upload_limits.max_bytes)
+            uploads.append((file.filename, spooled))
+            total += size
+            if total > max_total:
+                raise HTTPException(status_code=413, detail=f"批量上传总大小超过 {max_total // (1024 * 1024)}MB")
+    except UploadRejected as e:
+        _close_spooled(uploads)
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except BaseException:
+        _close_spooled(uploads)
+        raise
+    semaphore = asyncio.Semaphore(int(os.getenv('BATCH_CONCURRENCY', 8)))
+    # 同时处理中的图片数：一张图片从上传、解码到全部工作流完成才释放名额，避免整本相册的原图同时驻留内存
+    files_in_flight = asyncio.Semaphore(int(os.getenv('BATCH_FILES_IN_FLIGHT', 2)))
+    results: asyncio.Queue = asyncio.Queue()
+    
+    async def run_item(index: int, filename: str, prepared: tuple, workflow_type: str):
+        item = {"index": index, "filename": filename, "workflow_type": workflow_type}
+        try:
+            async with semaphore:
+                item["result"] = await _process_prepared(registry, model, prepared, workflow_type)
+            item["status"] = "ok"
+        except HTTPException as he:
+            item.update(status="error", detail=he.detail)
+        except Exception as e:
+            logger.error("Batch item %s (%s) error: %s", index, workflow_type, e)
+            item.update(status="error", detail=str(e))
+        await results.put(item)
+    
+    async def run_file(index: int, filename: str, spooled):
+        """流水线处理单张图片：读入、校验、上传并解码后立即运行其全部工作流，完成后释放原图"""
+        async with files_in_flight:
+            try:
+                with timed('upload_read'):
+                    contents = await read_spooled(spooled)
+                spooled.close()
+                try:
+                    contents = await ingest_image(contents, registry.upload_limits, registry.image.run_in_executor)
+                except UploadRejected as e:
+                    raise HTTPException(status_code=e.status_code, detail=e.detail)
+                prepared = await _prepare_image(registry, imgbb_service, contents, decode=model != "coze")
+                del contents
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                logger.error("Batch file %s prepare error: %s", index, detail)
+                for workflow_type in workflow_types:
+                    await results.put({
+                        "index": index, "filename": filename, "workflow_type": workflow_type,
+                        "status": "error", "detail": detail
+                    })
+                return
+            await asyncio.gather(*(
+                run_item(index, filename, prepared, workflow_type) for workflow_type in workflow_types
+            ))
+    
+    async def generate():
+        file_tasks = [
+            asyncio.create_task(run_file(index, filename, spooled))
+            for index, (filename, spooled) in enumerate(uploads)
+        ]
+        try:
+            for _ in range(len(uploads) * len(workflow_types)):
+                item = await results.get()
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消剩余工作并删除临时文件
+            for task in file_tasks:
+                task.cancel()
+            _close_spooled(uploads)
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/api/jobs/process-image", status_code=202)
+async def submit_process_image_job(
+    request: Request,
+    file: UploadFile = File(...),
+    workflow_type: str = Form("mood"),
+    model: str = Form("deepseek"),
+    idempotency_key: str = Header(None),
+    registry: ServiceRegistry = Depends(get_registry),
+    imgbb_service: 'ImgBBService' = Depends(get_imgbb_service),
+    job_queue: JobQueue = Depends(get_job_queue)
+):
+    """提交图片处理任务，立即返回任务 ID；同一客户端相同 Idempotency-Key 的重试不会重复执行，参数不同时返回 409"""
+    logger.info("Submitting image job with workflow: %s, model: %s", workflow_type, model)
+    
+    contents = await _read_image_upload(file, registry)
+    fingerprint = content_hash(f"{workflow_type}\n{model}\n".encode('utf-8') + contents)
+    
+    try:
+        job = job_queue.submit(
+            lambda: _run_image_pipeline(registry, imgbb_service, contents, workflow_type, model),
+            idempotency_key=idempotency_key,
+            client=admission.identify(request.scope),
+            fingerprint=fingerprint
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    """查询任务状态，完成后返回结果"""
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job.to_dict()
+
+@app.get("/api/artifacts/{artifact_id}")
+async def get_artifact(artifact_id: str, registry: ServiceRegistry = Depends(get_registry)):
+    """下载生成的临时产物"""
+    artifact = registry.artifacts.get(artifact_id)
+    if not artifact:
+        raise HTTPException(status_code=404, detail="文件不存在或已过期")
+    path, media_type = artifact
+    return FileResponse(path, media_type=media_type, headers={"Cache-Control": "private, max-age=600"})
+
+@app.get("/api/cache-stats")
+async def cache_stats(registry: ServiceRegistry = Depends(get_registry)):
+    """缓存命中统计"""
+    return registry.cache_stats()
+
+@app.get("/metrics")
+async def metrics_endpoint(request: Request, registry: ServiceRegistry = Depends(get_registry)):
+    """Prometheus 文本格式的运行指标"""
+    lines = [metrics.render().rstrip("\n")]
+    cache_stats = registry.cache_stats()
+    for field, label in (('hits', '命中'), ('misses', '未命中'), ('evictions', '淘汰')):
+        lines.extend(format_metric(
+            f'cache_{field}_total', f'缓存{label}次数', 'counter',
+            [({'cache': name}, stats[field]) for name, stats in cache_stats.items()]
+        ))
+    lines.extend(format_metric(
+        'upstream_circuit_open', '上游熔断状态（1 为熔断中）', 'gauge',
+        [({'upstream': name}, int(caller.breaker.state == 'open')) for name, caller in registry.resilience.items()]
+    ))
+    lines.extend(format_metric(
+        'provider_in_flight', '文本后端进行中的请求数', 'gauge',
+        [({'provider': name}, stats.in_flight) for name, stats in registry.router.stats.items()]
+    ))
+    lines.extend(format_metric(
+        'prompt_tokens', '系统提示词的估算 token 数', 'gauge',
+        [({'prompt': name, 'version': stats['version']}, stats['tokens']) for name, stats in registry.prompts.stats().items()]
+    ))
+    lines.extend(format_metric(
+        'single_flight_in_flight', '进行中的合并生成数（按输入去重）', 'gauge', [({}, len(registry.single_flight))]
+    ))
+    lines.extend(format_metric(
+        'upstream_waiting', '等待上游配额的调用数', 'gauge',
+        [({'upstream': name}, limiter.waiting) for name, limiter in registry.limiters.items()]
+    ))
+    lines.extend(format_metric(
+        'admission_active', '已准入且处理中的请求数', 'gauge',
+        [({'group': group}, active) for group, active in admission.active.items()]
+    ))
+    job_queue = getattr(request.app.state, 'job_queue', None)
+    if job_queue is not None:
+        lines.extend(format_metric('job_queue_depth', '排队中的后台任务数', 'gauge', [({}, job_queue.depth)]))
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.post("/api/admin/reload-config")
+async def reload_config(
+    x_admin_token: str = Header(None),
+    registry: ServiceRegistry = Depends(get_registry)
+):
+    """热加载配置：重新读取环境变量并重建服务，无需重启进程"""
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token or x_admin_token != admin_token:
+        raise HTTPException(status_code=403, detail="无权限")
+    registry.reload()
+    return {"status": "ok", "config_version": registry.config_version}
+
 # 全局错误处理
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    logger.error(f"HTTP error occurred: {exc.detail}")
+    logger.error("HTTP error occurred: %s", exc.detail)
     return JSONResponse(
         status_code=exc.status_code,
-        content={"detail": exc.detail}
+        content={"detail": exc.detail},
+        headers=exc.headers
     )
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Global error occurred: {str(exc)}", exc_info=True)
+    logger.error("Global error occurred: %s", exc, exc_info=True)
     return JSONResponse(
         status_code=500,
         content={"detail": "Internal server error"}
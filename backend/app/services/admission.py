@@ -0,0 +1,231 @@
+import os
+import math
+import logging
+import ipaddress
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Tuple, Union
+from starlette.responses import JSONResponse
+from .limits import TokenBucket, UpstreamLimiter
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+REJECTED = metrics.counter('admission_rejected_total', '被准入控制拒绝的请求数', ('group', 'reason'))
+
+# 受准入控制的接口分组：图片类请求持有解码后的原图和画布，内存占用远高于文本类
+ENDPOINT_GROUPS = {
+    "/api/process-image": 'image',
+    "/api/process-image/stream": 'image',
+    "/api/process-images/batch": 'image',
+    "/api/jobs/process-image": 'image',
+    "/api/resize-image": 'image',
+    "/api/process-poetry": 'text',
+    "/api/process-poetry/stream": 'text',
+    "/api/poetry-card": 'render',  # 不依赖上游，只做客户端限速
+}
+
+# 各分组依赖的上游：每一项中任一上游有余量即可（文本模型之间可以互相回退）
+GROUP_UPSTREAMS = {
+    'image': (('imgbb',), ('deepseek', 'coze')),
+    'text': (('deepseek', 'coze'),),
+}
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+CGROUP_MEMORY_FILES = ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+
+
+def available_memory_mb() -> Optional[float]:
+    """可用内存上限（MB）：优先读取容器 cgroup 限制，其次为物理内存"""
+    for path in CGROUP_MEMORY_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit() and int(value) < 1 << 60:
+                return int(value) / (1 << 20)
+        except OSError:
+            continue
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1 << 20)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class ClientRateLimiter:
+    """按客户端（已登记的 API Key 或 IP）分别计数的令牌桶，只保留最近活跃的客户端"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: OrderedDict = OrderedDict()
+
+    def check(self, client: str) -> float:
+        """取一个令牌，成功返回 0，否则返回需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket.try_acquire()
+
+
+def upstream_wait(limiters: Dict[str, UpstreamLimiter], group: str) -> float:
+    """分组依赖的上游排队已满时返回建议重试秒数，否则返回 0"""
+    wait = 0.0
+    for alternatives in GROUP_UPSTREAMS.get(group, ()):
+        waits = [limiters[name].saturated() for name in alternatives if name in limiters]
+        if waits and all(waits):
+            wait = max(wait, min(waits))
+    return wait
+
+
+def parse_networks(value: str) -> List[Network]:
+    """解析逗号分隔的 IP / CIDR 列表，忽略无效项"""
+    networks = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            logger.warning("忽略无效的代理地址: %s", item)
+    return networks
+
+
+class ClientIdentifier:
+    """客户端标识：只信任已登记的 API Key，只从可信代理转发的 X-Forwarded-For 中取客户端 IP，其余使用对端地址
+
+    客户端可以随意伪造请求头，若直接信任，每次更换请求头即可绕过限速
+    """
+
+    def __init__(self, api_keys: FrozenSet[str] = frozenset(), trusted_proxies: Optional[List[Network]] = None):
+        self.api_keys = api_keys
+        self.trusted_proxies = trusted_proxies or []
+
+    def _trusted(self, address: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.trusted_proxies)
+
+    def client_ip(self, peer: Optional[str], forwarded: Optional[str]) -> str:
+        """对端是可信代理时，从 X-Forwarded-For 右侧起跳过可信代理，取第一个不可信的地址"""
+        address = peer or 'unknown'
+        if not forwarded or not self._trusted(address):
+            return address
+        for hop in reversed([part.strip() for part in forwarded.split(',') if part.strip()]):
+            address = hop
+            if not self._trusted(hop):
+                break
+        return address
+
+    def __call__(self, scope: dict) -> str:
+        headers = dict(scope.get('headers') or [])
+        api_key = headers.get(b'x-api-key')
+        if api_key and api_key.decode('latin-1') in self.api_keys:
+            return 'key:' + api_key.decode('latin-1')
+        forwarded = headers.get(b'x-forwarded-for')
+        client = scope.get('client')
+        return 'ip:' + self.client_ip(client[0] if client else None, forwarded.decode('latin-1') if forwarded else None)
+
+
+class AdmissionController:
+    """准入控制：客户端限速、上游排队上限与各接口分组的全局并发上限"""
+
+    def __init__(
+        self,
+        client_limiter: ClientRateLimiter,
+        concurrency: Dict[str, int],
+        identify: Optional[ClientIdentifier] = None
+    ):
+        self.client_limiter = client_limiter
+        self.concurrency = concurrency
+        self.active = {group: 0 for group in concurrency}
+        self.identify = identify or ClientIdentifier()
+
+    def admit(self, group: str, client: str, limiters: Optional[Dict[str, UpstreamLimiter]] = None) -> Optional[Tuple[str, float]]:
+        """尝试准入，成功返回 None 并占用并发名额，拒绝时返回 (原因, 建议重试秒数)"""
+        wait = self.client_limiter.check(client)
+        if wait > 0:
+            return 'client_rate', wait
+        wait = upstream_wait(limiters or {}, group)
+        if wait > 0:
+            return 'upstream_quota', wait
+        limit = self.concurrency.get(group, 0)
+        if limit > 0 and self.active[group] >= limit:
+            return 'concurrency', 1.0
+        self.active[group] = self.active.get(group, 0) + 1
+        return None
+
+    def release(self, group: str):
+        self.active[group] -= 1
+
+
+class AdmissionMiddleware:
+    """ASGI 准入中间件：超限时直接返回 429 和 Retry-After，并发名额保持到响应（含流式）发送完毕"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        group = ENDPOINT_GROUPS.get(scope.get('path')) if scope['type'] == 'http' else None
+        if group is None or scope.get('method') != 'POST':
+            await self.app(scope, receive, send)
+            return
+
+        registry = getattr(scope['app'].state, 'registry', None) if 'app' in scope else None
+        limiters = registry.limiters if registry is not None else None
+        rejection = self.controller.admit(group, self.controller.identify(scope), limiters)
+        if rejection is not None:
+            reason, retry_after = rejection
+            REJECTED.inc(group=group, reason=reason)
+            detail = "请求过于频繁，请稍后重试" if reason == 'client_rate' else "服务繁忙，请稍后重试"
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": detail},
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(group)
+
+
+def create_admission_controller() -> AdmissionController:
+    """根据 ADMISSION_* 环境变量创建准入控制；图片类并发上限默认按可用内存估算"""
+    client_limiter = ClientRateLimiter(
+        rate=float(os.getenv('ADMISSION_CLIENT_RATE', 2)),
+        burst=float(os.getenv('ADMISSION_CLIENT_BURST', 10))
+    )
+
+    image_limit = os.getenv('ADMISSION_IMAGE_CONCURRENCY')
+    if image_limit is None:
+        memory_mb = available_memory_mb()
+        per_request_mb = float(os.getenv('ADMISSION_MB_PER_IMAGE_REQUEST', 64))
+        # 预留一半内存给进程本身、缓存与线程池
+        image_limit = max(1, int(memory_mb * 0.5 / per_request_mb)) if memory_mb else 0
+    concurrency = {
+        'image': int(image_limit),
+        'text': int(os.getenv('ADMISSION_TEXT_CONCURRENCY', 0)),
+    }
+    identify = ClientIdentifier(
+        api_keys=frozenset(key.strip() for key in os.getenv('ADMISSION_API_KEYS', '').split(',') if key.strip()),
+        trusted_proxies=parse_networks(os.getenv('ADMISSION_TRUSTED_PROXIES', ''))
+    )
+    logger.info(
+        f"准入控制: 客户端 {client_limiter.rate}/s (突发 {client_limiter.burst}), "
+        f"并发上限 image={concurrency['image'] or '不限'}, text={concurrency['text'] or '不限'}, "
+        f"已登记 API Key {len(identify.api_keys)} 个, 可信代理 {len(identify.trusted_proxies)} 个"
+    )
+    return AdmissionController(client_limiter, concurrency, identify)
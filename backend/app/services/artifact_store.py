@@ -0,0 +1,76 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import tempfile
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 媒体类型与文件扩展名的对应关系
+MEDIA_TYPE_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/webp': '.webp',
+    'image/avif': '.avif',
+    'image/png': '.png',
+}
+
+
+class ArtifactStore:
+    """本地临时产物存储：生成结果写入磁盘，通过短期有效的 URL 下载"""
+
+    def __init__(self, directory: Optional[str] = None, ttl: float = 600, prune_interval: float = 60):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'text2image_artifacts')
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._pruned_at = float('-inf')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _write(self, data: bytes, media_type: str, prune: bool) -> str:
+        if prune:
+            self.prune()
+        artifact_id = uuid.uuid4().hex + MEDIA_TYPE_EXTENSIONS.get(media_type, '.bin')
+        path = os.path.join(self.directory, artifact_id)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return artifact_id
+
+    async def save(self, data: bytes, media_type: str) -> str:
+        """在线程池中保存产物并返回产物 ID；距上次清理超过 prune_interval 秒时顺带清理过期产物"""
+        now = time.monotonic()
+        prune = now - self._pruned_at >= self.prune_interval
+        if prune:
+            self._pruned_at = now
+        return await asyncio.to_thread(self._write, data, media_type, prune)
+
+    def get(self, artifact_id: str) -> Optional[Tuple[str, str]]:
+        """返回 (文件路径, 媒体类型)，不存在或已过期时返回 None"""
+        name, ext = os.path.splitext(artifact_id)
+        if not name.isalnum():
+            return None
+        path = os.path.join(self.directory, artifact_id)
+        if not os.path.exists(path) or time.time() - os.path.getmtime(path) > self.ttl:
+            return None
+        media_type = next((mt for mt, e in MEDIA_TYPE_EXTENSIONS.items() if e == ext), 'application/octet-stream')
+        return path, media_type
+
+    def prune(self):
+        """删除过期产物"""
+        now = time.time()
+        try:
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+        except OSError as e:
+            logger.warning("清理产物目录失败: %s", e)
+
+
+def create_artifact_store() -> ArtifactStore:
+    """根据 ARTIFACT_* 环境变量创建产物存储"""
+    return ArtifactStore(
+        directory=os.getenv('ARTIFACT_DIR'),
+        ttl=float(os.getenv('ARTIFACT_TTL', 600)),
+        prune_interval=float(os.getenv('ARTIFACT_PRUNE_INTERVAL', 60))
+    )
@@ -0,0 +1,229 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data: bytes) -> str:
+    """计算内容哈希（BLAKE2b），用作内容寻址缓存的键"""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class CacheStats:
+    """缓存命中统计"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class MemoryCacheBackend:
+    """进程内缓存：按 TTL 过期，超过容量时按 LRU 淘汰"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at and expires_at < time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> int:
+        """写入缓存，返回被淘汰的条目数"""
+        expires_at = time.time() + ttl if ttl else 0
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        evicted = 0
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    async def close(self):
+        self._data.clear()
+
+
+class SQLiteCacheBackend:
+    """磁盘缓存：SQLite 持久化，多进程/重启后仍可命中"""
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+        self._conn.commit()
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at and expires_at < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def _set(self, key: str, value: str, ttl: Optional[float]) -> int:
+        now = time.time()
+        expires_at = now + ttl if ttl else 0
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            evicted = max(0, count - self.max_entries)
+            if evicted:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (evicted,)
+                )
+            self._conn.commit()
+            return evicted
+
+    def _delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> int:
+        return await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._delete, key)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisCacheBackend:
+    """Redis 兼容缓存：TTL 由 Redis 负责，容量淘汰依赖服务端 maxmemory-policy"""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ValueError("使用 Redis 缓存需要安装 redis 包")
+        self._client = redis.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> int:
+        await self._client.set(key, value, ex=int(ttl) if ttl else None)
+        return 0
+
+    async def delete(self, key: str):
+        await self._client.delete(key)
+
+    async def close(self):
+        await self._client.close()
+
+
+class Cache:
+    """带命名空间、TTL 与命中统计的缓存；后端异常时降级为未命中，不影响主流程"""
+
+    def __init__(self, backend, namespace: str, ttl: Optional[float] = None):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str, record_stats: bool = True) -> Optional[str]:
+        """读取缓存；record_stats 为 False 时不计入命中统计，由调用方自行判断是否命中"""
+        try:
+            value = await self.backend.get(self._key(key))
+        except Exception as e:
+            logger.error("读取缓存 %s 失败: %s", self.namespace, e)
+            value = None
+        if record_stats:
+            if value is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+        return value
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        try:
+            self.stats.evictions += await self.backend.set(self._key(key), value, ttl or self.ttl)
+        except Exception as e:
+            logger.error("写入缓存 %s 失败: %s", self.namespace, e)
+
+    async def delete(self, key: str):
+        try:
+            await self.backend.delete(self._key(key))
+        except Exception as e:
+            logger.error("删除缓存 %s 失败: %s", self.namespace, e)
+
+    async def close(self):
+        await self.backend.close()
+
+
+def create_cache(namespace: str, env_prefix: str, default_ttl: float = 86400, default_backend: str = 'memory') -> Optional[Cache]:
+    """根据环境变量创建缓存，如 UPLOAD_CACHE_BACKEND=memory|sqlite|redis|none"""
+    backend_name = os.getenv(f'{env_prefix}_BACKEND', default_backend).lower()
+    if backend_name in ('', 'none', 'off', 'false'):
+        return None
+    ttl = float(os.getenv(f'{env_prefix}_TTL', default_ttl))
+    max_entries = int(os.getenv(f'{env_prefix}_MAX_ENTRIES', 1024))
+
+    if backend_name == 'memory':
+        backend = MemoryCacheBackend(max_entries=max_entries)
+    elif backend_name == 'sqlite':
+        path = os.getenv(f'{env_prefix}_SQLITE_PATH', f'/tmp/{namespace}_cache.sqlite3')
+        backend = SQLiteCacheBackend(path, max_entries=max_entries)
+    elif backend_name == 'redis':
+        backend = RedisCacheBackend(os.getenv(f'{env_prefix}_REDIS_URL', 'redis://localhost:6379/0'))
+    else:
+        raise ValueError(f"未知缓存后端: {backend_name}")
+
+    logger.info("创建 %s 缓存: backend=%s, ttl=%s, max_entries=%s", namespace, backend_name, ttl, max_entries)
+    return Cache(backend, namespace, ttl)
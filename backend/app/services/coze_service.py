@@ -1,9 +1,13 @@
-import requests
 import os
 import json
 import logging
 from dotenv import load_dotenv
 import httpx
+from typing import Optional
+from .limits import UpstreamLimiter
+from ..config.log_config import LazyJson
+from .metrics import timed
+from .resilience import RETRYABLE_STATUSES, ResilientCaller, UpstreamError
 
 # 加载环境变量
 load_dotenv()
@@ -11,9 +15,17 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 
 class CozeService:
-    def __init__(self):
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        limiter: Optional[UpstreamLimiter] = None,
+        resilience: Optional[ResilientCaller] = None
+    ):
         """初始化CozeService，从环境变量获取配置"""
         logger.info("正在初始化 Coze 服务...")
+        self.client = client  # 共享连接池，未提供时每次请求临时创建
+        self.limiter = limiter or UpstreamLimiter('coze')  # 上游并发与速率限制
+        self.resilience = resilience or ResilientCaller('coze', timeout=30.0)  # 超时、重试与熔断
         
         # 从环境变量获取配置
         self.api_url = os.getenv('COZE_API_URL', 'https://api.coze.cn/v1/workflow/run')
@@ -30,6 +42,28 @@ class CozeService:
             
         logger.info("Coze 服务初始化成功")
     
+    async def _post(self, headers: dict, payload: dict) -> httpx.Response:
+        """发送工作流请求，优先复用共享连接池（直接使用完整 URL，不添加 /process）
+
+        超时、限流及 5xx 响应按弹性策略重试，其余状态码原样返回
+        """
+        timeout = self.resilience.timeout
+        
+        async def attempt() -> httpx.Response:
+            if self.client is not None:
+                response = await self.client.post(self.api_url, headers=headers, json=payload, timeout=timeout)
+            else:
+                async with httpx.AsyncClient() as client:
+                    response = await client.post(self.api_url, headers=headers, json=payload, timeout=timeout)
+            if response.status_code in RETRYABLE_STATUSES:
+                raise UpstreamError('coze', response.status_code, response.text)
+            return response
+        
+        # 排队等待不计入上游超时和熔断失败
+        async with self.limiter:
+            with timed('coze'):
+                return await self.resilience.call(attempt)
+    
     async def process_image(self, image_url: str, workflow_type: str = "mood") -> dict:
         """异步处理图片"""
         try:
@@ -41,7 +75,7 @@ class CozeService:
             
             workflow_id = self._get_workflow_id(workflow_type)
             if not workflow_id:
-                logger.error(f"未找到工作流类型: {workflow_type}")
+                logger.error("未找到工作流类型: %s", workflow_type)
                 return None
             
             payload = {
@@ -52,53 +86,45 @@ class CozeService:
                 "is_async": False
             }
             
-            logger.debug("Coze API请求信息:")
-            logger.debug(f"URL: {self.api_url}")
-            logger.debug(f"Headers: {headers}")
-            logger.debug(f"Payload: {json.dumps(payload, ensure_ascii=False)}")
+            # 请求头含令牌，不写入日志；请求体按需序列化
+            logger.debug("Coze API请求: url=%s, payload=%s", self.api_url, LazyJson(payload))
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.api_url,  # 直接使用完整 URL，不添加 /process
-                    headers=headers,
-                    json=payload,
-                    timeout=30.0
-                )
-                
-                logger.debug(f"Response status: {response.status_code}")
-                logger.debug(f"Response content: {response.text}")
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get('code') == 0:
-                        try:
-                            data = result.get('data')
-                            if isinstance(data, str):
-                                data = json.loads(data)
-                            
-                            logger.debug(f"解析后的数据: {data}")
-                            
-                            # 获取output中的内容
-                            comment = data.get('output', '')
-                            svg = data.get('output1', '')
-                            
-                            return {
-                                'comment': comment,
-                                'svg': svg,
-                                'debug_url': result.get('debug_url')
-                            }
-                        except json.JSONDecodeError as e:
-                            logger.error(f"JSON解析失败: {str(e)}, 原始数据: {data}")
-                            return None
-                    else:
-                        logger.error(f"Coze API返回错误码: {result.get('code')}, 消息: {result.get('msg')}")
+            response = await self._post(headers, payload)
+            
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Coze API响应: status=%s, content=%s", response.status_code, response.text)
+            
+            if response.status_code == 200:
+                result = response.json()
+                if result.get('code') == 0:
+                    try:
+                        data = result.get('data')
+                        if isinstance(data, str):
+                            data = json.loads(data)
+                        
+                        logger.debug("解析后的数据: %s", data)
+                        
+                        # 获取output中的内容
+                        comment = data.get('output', '')
+                        svg = data.get('output1', '')
+                        
+                        return {
+                            'comment': comment,
+                            'svg': svg,
+                            'debug_url': result.get('debug_url')
+                        }
+                    except json.JSONDecodeError as e:
+                        logger.error("JSON解析失败: %s, 原始数据: %s", e, data)
                         return None
                 else:
-                    logger.error(f"API请求失败: {response.status_code} - {response.text}")
+                    logger.error("Coze API返回错误码: %s, 消息: %s", result.get('code'), result.get('msg'))
                     return None
-                    
+            else:
+                logger.error("API请求失败: %s - %s", response.status_code, response.text)
+                return None
+                
         except Exception as e:
-            logger.error(f"处理图片时发生错误: {str(e)}")
+            logger.error("处理图片时发生错误: %s", e)
             return None
             
     def _get_workflow_id(self, workflow_type):
@@ -108,7 +134,7 @@ class CozeService:
             'sarcastic': self.workflow_id_sarcastic
         }
         workflow_id = workflow_map.get(workflow_type)
-        logger.debug(f"工作流类型: {workflow_type}, 对应ID: {workflow_id}")
+        logger.debug("工作流类型: %s, 对应ID: %s", workflow_type, workflow_id)
         return workflow_id
     
     async def process_poetry(self, text):
@@ -126,56 +152,45 @@ class CozeService:
                 }
             }
             
-            logger.info(f"发送请求到 Coze API:")
-            logger.info(f"URL: {self.api_url}")
-            logger.info(f"Workflow ID: {self.workflow_id_poetry}")
-            logger.info(f"Input text: {text}")
-            logger.info(f"Headers: {headers}")
-            logger.info(f"Payload: {json.dumps(payload, ensure_ascii=False)}")
+            logger.info("发送请求到 Coze API: workflow_id=%s, 文本长度=%d", self.workflow_id_poetry, len(text))
+            logger.debug("Coze API请求: url=%s, payload=%s", self.api_url, LazyJson(payload))
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.api_url,  # 直接使用完整 URL，不添加 /process
-                    headers=headers,
-                    json=payload,
-                    timeout=30.0
-                )
-                
-                # 添加详细的响应日志
-                logger.info(f"Coze API 响应状态码: {response.status_code}")
-                logger.info(f"Coze API 响应头: {dict(response.headers)}")
-                logger.info(f"Coze API 响应内容: {response.text}")
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get('code') == 0:
-                        try:
-                            data = result.get('data')
-                            if isinstance(data, str):
-                                data = json.loads(data)
-                            
-                            logger.debug(f"解析后的数据: {data}")
-                            
-                            # 获取output中的内容
-                            comment = data.get('output', '')
-                            svg = data.get('output1', '')
-                            
-                            return {
-                                'comment': comment,
-                                'svg': svg,
-                                'debug_url': result.get('debug_url')
-                            }
-                        except json.JSONDecodeError as e:
-                            logger.error(f"JSON解析失败: {str(e)}, 原始数据: {data}")
-                            return None
-                    else:
-                        logger.error(f"Coze API返回错误码: {result.get('code')}, 消息: {result.get('msg')}")
+            response = await self._post(headers, payload)
+            
+            logger.info("Coze API 响应状态码: %s", response.status_code)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Coze API 响应内容: %s", response.text)
+            
+            if response.status_code == 200:
+                result = response.json()
+                if result.get('code') == 0:
+                    try:
+                        data = result.get('data')
+                        if isinstance(data, str):
+                            data = json.loads(data)
+                        
+                        logger.debug("解析后的数据: %s", data)
+                        
+                        # 获取output中的内容
+                        comment = data.get('output', '')
+                        svg = data.get('output1', '')
+                        
+                        return {
+                            'comment': comment,
+                            'svg': svg,
+                            'debug_url': result.get('debug_url')
+                        }
+                    except json.JSONDecodeError as e:
+                        logger.error("JSON解析失败: %s, 原始数据: %s", e, data)
                         return None
                 else:
-                    error_msg = f"Coze API请求失败: HTTP {response.status_code}, 响应: {response.text}"
-                    logger.error(error_msg)
-                    raise Exception(error_msg)
-                
+                    logger.error("Coze API返回错误码: %s, 消息: %s", result.get('code'), result.get('msg'))
+                    return None
+            else:
+                error_msg = f"Coze API请求失败: HTTP {response.status_code}, 响应: {response.text}"
+                logger.error(error_msg)
+                raise Exception(error_msg)
+            
         except Exception as e:
-            logger.error(f"处理诗意文本时发生错误: {str(e)}")
+            logger.error("处理诗意文本时发生错误: %s", e)
             raise Exception(f"生成失败: {str(e)}")
\ No newline at end of file
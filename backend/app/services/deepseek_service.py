@@ -1,17 +1,33 @@
 from openai import AsyncOpenAI, APIConnectionError, APIError  # 使用 AsyncOpenAI
+import asyncio
 import logging
-import json
 import os
 from dotenv import load_dotenv
 import traceback
-from ..config.prompts import SYSTEM_PROMPTS, POETRY_PROMPT
-from .image_service import ImageService
+from .image_service import ImageService, PostcardEncoding
+from .generation_cache import GenerationCache, normalize_text
+from .prompt_registry import Prompt, PromptRegistry, create_prompt_registry
+from PIL import Image
 import httpx
+from typing import AsyncIterator, Optional, Tuple
+from .limits import UpstreamLimiter
+from ..config.log_config import LazyJson
+from .metrics import timed
+from .resilience import ResilientCaller
+from .poetry_parser import PoetryStreamParser, parse_poetry_content
 
 logger = logging.getLogger(__name__)
 
 class DeepseekService:
-    def __init__(self):
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        image_service: Optional[ImageService] = None,
+        cache: Optional[GenerationCache] = None,
+        limiter: Optional[UpstreamLimiter] = None,
+        resilience: Optional[ResilientCaller] = None,
+        prompts: Optional[PromptRegistry] = None
+    ):
         """初始化DeepseekService"""
         logger.info("正在初始化 DeepSeek 服务...")
         self.api_key = os.getenv('DEEPSEEK_API_KEY')
@@ -20,94 +36,184 @@ class DeepseekService:
         if not self.api_key:
             raise ValueError("DEEPSEEK_API_KEY 环境变量未设置")
             
-        logger.info(f"使用 API Base URL: {self.api_base}")
+        logger.info("使用 API Base URL: %s", self.api_base)
         
         try:
             # 使用 AsyncOpenAI 替代 OpenAI
             self.client = AsyncOpenAI(
                 api_key=self.api_key,
-                base_url=self.api_base
+                base_url=self.api_base,
+                http_client=http_client,  # 共享连接池，None 时由 SDK 自行创建
+                max_retries=0  # 重试由弹性策略统一处理
             )
             logger.info("DeepSeek 服务初始化成功")
         except Exception as e:
-            logger.error(f"DeepSeek 服务初始化失败: {str(e)}")
+            logger.error("DeepSeek 服务初始化失败: %s", e)
             raise
         
-        self.image_service = ImageService()
+        self.image_service = image_service or ImageService()
+        self.model_name = "deepseek-chat"
+        self.cache = cache  # 可选的生成结果缓存
+        self.limiter = limiter or UpstreamLimiter('deepseek')  # 上游并发与速率限制
+        self.resilience = resilience or ResilientCaller('deepseek')  # 超时、重试与熔断
+        self.prompts = prompts or create_prompt_registry()  # 预编译的提示词
+
+    async def _create_completion(self, messages: list) -> str:
+        """调用对话接口并返回生成文本（按弹性策略超时、重试与熔断）"""
+        async def attempt():
+            return await self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500,
+                stream=False
+            )
+        
+        # 在超时与熔断统计之外排队，排队等待不计入上游超时和失败
+        async with self.limiter:
+            with timed('llm'):
+                response = await self.resilience.call(attempt)
+        return response.choices[0].message.content
+
+    async def _stream_completion(self, messages: list) -> AsyncIterator[str]:
+        """以流式方式调用对话接口，逐段返回增量文本（整个流期间占用一个并发名额）"""
+        async with self.limiter:
+            # 只对建立连接阶段重试，已开始输出后不再重试；llm_first_byte 为首包耗时
+            with timed('llm_first_byte'):
+                stream = await self.resilience.call(lambda: self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=500,
+                    stream=True
+                ))
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    async def _cached_stream(self, cache_key_parts: tuple, messages: list) -> AsyncIterator[str]:
+        """带缓存的流式调用：命中缓存时一次性返回，否则流式生成并在结束后写入缓存"""
+        key = self.cache.make_key(*cache_key_parts) if self.cache is not None else None
+        if key is not None:
+            cached = await self.cache.lookup(key)
+            if cached is not None:
+                yield cached
+                return
+        
+        parts = []
+        async for delta in self._stream_completion(messages):
+            parts.append(delta)
+            yield delta
+        if key is not None:
+            await self.cache.add(key, "".join(parts))
+
+    def _image_messages(self, image_url: str, workflow_type: str) -> Tuple[Prompt, list]:
+        """构建图片文案请求的消息"""
+        prompt = self.prompts.image_prompt(workflow_type)
+        return prompt, self.prompts.messages(prompt, 'image', image_url=image_url)
+
+    def _image_cache_key(
+        self,
+        image_url: str,
+        workflow_type: str,
+        prompt: Prompt,
+        image_hash: Optional[str],
+        candidate: int = 0
+    ) -> tuple:
+        key = ('image', image_hash or image_url, workflow_type, self.model_name, prompt.fingerprint)
+        # 同一工作流的其余候选单独缓存，第一个候选沿用原有的缓存键
+        return key + (f'candidate:{candidate}',) if candidate else key
+
+    def _poetry_messages(self, text: str) -> list:
+        """构建诗意点评请求的消息"""
+        return self.prompts.messages(self.prompts.get('poetry'), 'poetry', text=text)
+
+    def _poetry_cache_key(self, text: str) -> tuple:
+        return ('poetry', normalize_text(text), self.model_name, self.prompts.get('poetry').fingerprint)
+
+    async def _cached_completion(self, cache_key_parts: tuple, messages: list) -> str:
+        """带缓存的对话调用，未启用缓存时直接调用模型"""
+        if self.cache is None:
+            return await self._create_completion(messages)
+        key = self.cache.make_key(*cache_key_parts)
+        return await self.cache.get_or_generate(key, lambda: self._create_completion(messages))
     
-    async def _get_image_description(self, image_url: str, workflow_type: str) -> str:
-        """获取图片描述"""
+    async def _get_image_description(
+        self,
+        image_url: str,
+        workflow_type: str,
+        image_hash: Optional[str] = None,
+        candidate: int = 0
+    ) -> str:
+        """获取图片描述，image_hash 用作缓存键（缺省时使用图片 URL），candidate 区分同一工作流的多个候选"""
         try:
-            system_prompt = SYSTEM_PROMPTS.get(workflow_type, SYSTEM_PROMPTS['mood'])
+            prompt, messages = self._image_messages(image_url, workflow_type)
             
-            messages = [
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": f"请基于这张图片进行创作: {image_url}"
-                }
-            ]
-            
-            logger.debug(f"API请求参数: {json.dumps(messages, ensure_ascii=False)}")
+            logger.debug("API请求参数: %s", LazyJson(messages))
             
             try:
-                response = await self.client.chat.completions.create(
-                    model="deepseek-chat",
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=500,
-                    stream=False
-                )
-                
-                description = response.choices[0].message.content
+                cache_key_parts = self._image_cache_key(image_url, workflow_type, prompt, image_hash, candidate)
+                description = await self._cached_completion(cache_key_parts, messages)
                 logger.info("成功获取图片描述")
                 return description
                 
+            except asyncio.TimeoutError:
+                raise
             except APIConnectionError as e:
-                logger.error(f"API 连接错误: {str(e)}")
+                logger.error("API 连接错误: %s", e)
                 raise Exception(f"DeepSeek API 连接失败: {str(e)}")
             except APIError as e:
-                logger.error(f"API 错误: {str(e)}")
+                logger.error("API 错误: %s", e)
                 raise Exception(f"DeepSeek API 错误: {str(e)}")
             except Exception as e:
-                logger.error(f"未知错误: {str(e)}")
+                logger.error("未知错误: %s", e)
                 raise
                 
+        except asyncio.TimeoutError:
+            logger.error("获取图片描述超时")
+            raise
         except Exception as e:
-            logger.error(f"获取图片描述失败: {str(e)}")
+            logger.error("获取图片描述失败: %s", e)
             logger.error(traceback.format_exc())
             raise Exception(f"获取图片描述失败: {str(e)}")
     
-    async def process_image(self, image_url: str, workflow_type: str = "mood") -> dict:
-        """处理图片"""
+    async def process_image(
+        self,
+        image_url: str,
+        workflow_type: str = "mood",
+        image: Optional[Image.Image] = None,
+        image_hash: Optional[str] = None,
+        encoding: Optional[PostcardEncoding] = None,
+        binary: bool = False,
+        candidate: int = 0
+    ) -> dict:
+        """处理图片，image 为已解码的原图时直接渲染，避免从 ImgBB 回源下载
+
+        binary 为 True 时返回编码后的字节（postcard_bytes / media_type），否则返回 data URL
+        """
         try:
             # 获取AI生成的描述文本
-            output_text = await self._get_image_description(image_url, workflow_type)
-            logger.info(f"生成的描述文本: {output_text}")
+            output_text = await self._get_image_description(image_url, workflow_type, image_hash, candidate)
+            logger.info("生成的描述文本长度: %d", len(output_text))
+            logger.debug("生成的描述文本: %s", output_text)
             
             # 调用图片服务生成明信片样式的图片
             try:
-                postcard_image = await self.image_service.create_postcard(
-                    image_url=image_url,
-                    text=output_text
+                result = await self.image_service.postcard_result(
+                    output_text, image_url=image_url, image=image, encoding=encoding, binary=binary
                 )
-                if not postcard_image:
-                    raise Exception("生成明信片图片失败: 返回为空")
                 logger.info("成功生成带文字的明信片图片")
             except Exception as e:
-                logger.error(f"生成明信片样式图片失败: {str(e)}")
+                logger.error("生成明信片样式图片失败: %s", e)
                 raise Exception(f"生成明信片样式图片失败: {str(e)}")
             
-            return {
-                "text": output_text,
-                "postcard_image": postcard_image
-            }
+            return result
             
+        except asyncio.TimeoutError:
+            # 超时原样抛出，由接口返回 504
+            raise
         except Exception as e:
-            logger.error(f"图片处理失败: {str(e)}")
+            logger.error("图片处理失败: %s", e)
             raise Exception(f"图片处理失败: {str(e)}")
     
     async def process_poetry(self, text):
@@ -115,54 +221,71 @@ class DeepseekService:
         try:
             logger.info("开始处理诗意文本...")
             
-            messages = [
-                {
-                    "role": "system",
-                    "content": POETRY_PROMPT
-                },
-                {
-                    "role": "user",
-                    "content": f"请为这段文字提供诗意点评和配图：{text}"
-                }
-            ]
+            messages = self._poetry_messages(text)
             
             try:
-                response = await self.client.chat.completions.create(
-                    model="deepseek-chat",
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=500,
-                    stream=False
-                )
-                
-                content = response.choices[0].message.content
-                
-                comment = ""
-                svg = ""
+                content = await self._cached_completion(self._poetry_cache_key(text), messages)
                 
-                if "【点评】" in content:
-                    comment = content.split("【点评】")[1].split("【SVG】")[0].strip()
-                if "【SVG】" in content:
-                    svg = content.split("【SVG】")[1].strip()
+                result = parse_poetry_content(content)
                     
-                logger.info(f"生成的点评: {comment}")
-                logger.debug(f"生成的SVG: {svg}")
+                logger.info("生成的点评长度: %d, SVG 长度: %d", len(result['comment']), len(result['svg']))
+                logger.debug("生成的点评: %s", result['comment'])
                 
-                return {
-                    'comment': comment,
-                    'svg': svg
-                }
+                return result
                 
+            except asyncio.TimeoutError:
+                logger.error("生成诗意点评超时")
+                raise
             except APIConnectionError as e:
-                logger.error(f"API 连接错误: {str(e)}")
+                logger.error("API 连接错误: %s", e)
                 return None
             except APIError as e:
-                logger.error(f"API 错误: {str(e)}")
+                logger.error("API 错误: %s", e)
                 return None
             except Exception as e:
-                logger.error(f"未知错误: {str(e)}")
+                logger.error("未知错误: %s", e)
                 return None
                 
+        except asyncio.TimeoutError:
+            # 超时原样抛出，由接口返回 504
+            raise
         except Exception as e:
-            logger.error(f"处理诗意文本时发生错误: {str(e)}", exc_info=True)
-            return None
\ No newline at end of file
+            logger.error("处理诗意文本时发生错误: %s", e, exc_info=True)
+            return None
+
+    async def stream_poetry(self, text: str) -> AsyncIterator[Tuple[str, dict]]:
+        """流式处理诗意文本，逐步产出 (事件名, 数据)：token / comment / done"""
+        logger.info("开始流式处理诗意文本...")
+        parser = PoetryStreamParser()
+        async for delta in self._cached_stream(self._poetry_cache_key(text), self._poetry_messages(text)):
+            for event in parser.feed(delta):
+                yield event
+        for event in parser.finish():
+            yield event
+
+    async def stream_image(
+        self,
+        image_url: str,
+        workflow_type: str = "mood",
+        image: Optional[Image.Image] = None,
+        image_hash: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """流式处理图片，逐步产出 token / text / done 事件，文案完成后再渲染明信片"""
+        prompt, messages = self._image_messages(image_url, workflow_type)
+        cache_key_parts = self._image_cache_key(image_url, workflow_type, prompt, image_hash)
+        
+        parts = []
+        async for delta in self._cached_stream(cache_key_parts, messages):
+            parts.append(delta)
+            yield 'token', {'text': delta}
+        output_text = "".join(parts)
+        yield 'text', {'text': output_text}
+        
+        postcard_image = await self.image_service.create_postcard(
+            text=output_text,
+            image_url=image_url,
+            image=image
+        )
+        if not postcard_image:
+            raise Exception("生成明信片图片失败: 返回为空")
+        yield 'done', {'text': output_text, 'postcard_image': postcard_image}
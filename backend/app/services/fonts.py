@@ -0,0 +1,161 @@
+import os
+import logging
+import platform
+import threading
+from typing import Dict, List, Optional, Tuple
+from PIL import ImageFont
+
+logger = logging.getLogger(__name__)
+
+# Linux 下常见的字体目录（与 fontconfig 默认配置一致）
+LINUX_FONT_DIRS = [
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    os.path.expanduser("~/.local/share/fonts"),
+    os.path.expanduser("~/.fonts"),
+]
+
+# 支持中文的字体文件名关键字，按优先级排列
+CJK_FONT_KEYWORDS = [
+    "notosanscjk",
+    "notosanssc",
+    "sourcehansans",
+    "wqy-microhei",
+    "wqy-zenhei",
+    "notoserifcjk",
+    "sourcehanserif",
+    "droidsansfallback",
+    "uming",
+    "ukai",
+]
+
+FONT_EXTENSIONS = ('.ttf', '.ttc', '.otf', '.otc')
+
+
+def _get_system_fonts() -> List[str]:
+    """获取系统预置的中文字体路径"""
+    system = platform.system()
+    if system == "Darwin":  # macOS
+        return [
+            "/System/Library/Fonts/PingFang.ttc",  # PingFang
+            "/System/Library/Fonts/STHeiti Light.ttc",  # Heiti
+            "/System/Library/Fonts/Hiragino Sans GB.ttc"  # Hiragino
+        ]
+    elif system == "Windows":
+        return [
+            "C:\\Windows\\Fonts\\msyh.ttc",  # Microsoft YaHei
+            "C:\\Windows\\Fonts\\simhei.ttf",  # SimHei
+            "C:\\Windows\\Fonts\\simsun.ttc"  # SimSun
+        ]
+    return _scan_linux_cjk_fonts()
+
+
+def _scan_linux_cjk_fonts() -> List[str]:
+    """扫描 Linux 字体目录，按关键字优先级返回中文字体"""
+    matches: List[Tuple[int, str]] = []
+    for font_dir in LINUX_FONT_DIRS:
+        if not os.path.isdir(font_dir):
+            continue
+        for root, _, files in os.walk(font_dir):
+            for filename in files:
+                lower = filename.lower()
+                if not lower.endswith(FONT_EXTENSIONS):
+                    continue
+                for priority, keyword in enumerate(CJK_FONT_KEYWORDS):
+                    if keyword in lower.replace(' ', ''):
+                        matches.append((priority, os.path.join(root, filename)))
+                        break
+    # 同优先级时优先常规字重
+    matches.sort(key=lambda item: (item[0], 'regular' not in item[1].lower(), item[1]))
+    return [path for _, path in matches]
+
+
+class FontRegistry:
+    """进程级字体注册表：字体路径只探测一次，每个 (路径, 字号) 只加载一次，并缓存字符宽度"""
+
+    def __init__(self, custom_font_path: Optional[str] = None):
+        self.custom_font_path = custom_font_path
+        self._font_path = None
+        self._resolved = False
+        self._fonts: Dict[int, ImageFont.ImageFont] = {}
+        self._advances: Dict[int, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def font_path(self) -> Optional[str]:
+        """首次访问时解析可用字体路径，找不到时为 None（使用默认字体）"""
+        if not self._resolved:
+            with self._lock:
+                if not self._resolved:
+                    self._font_path = self._resolve_font_path()
+                    self._resolved = True
+        return self._font_path
+
+    def _resolve_font_path(self) -> Optional[str]:
+        # 首先尝试使用自定义字体
+        if self.custom_font_path and os.path.exists(self.custom_font_path):
+            logger.info("使用自定义字体: %s", self.custom_font_path)
+            return self.custom_font_path
+
+        # 尝试系统字体
+        for font_path in _get_system_fonts():
+            if os.path.exists(font_path):
+                logger.info("使用系统字体: %s", font_path)
+                return font_path
+
+        logger.warning("未找到合适的字体，使用默认字体")
+        return None
+
+    def get_font(self, size: int = 20) -> ImageFont.ImageFont:
+        """获取指定字号的字体，已加载的直接复用"""
+        font = self._fonts.get(size)
+        if font is not None:
+            return font
+        font_path = self.font_path
+        with self._lock:
+            font = self._fonts.get(size)
+            if font is None:
+                font = self._load_font(font_path, size)
+                self._fonts[size] = font
+                self._advances[id(font)] = {}
+            return font
+
+    @staticmethod
+    def _load_font(font_path: Optional[str], size: int) -> ImageFont.ImageFont:
+        try:
+            if font_path:
+                return ImageFont.truetype(font_path, size)
+            try:
+                return ImageFont.load_default(size)
+            except TypeError:
+                # Pillow < 10.1 的默认字体不支持字号
+                return ImageFont.load_default()
+        except Exception as e:
+            logger.error("加载字体失败: %s", e)
+            return ImageFont.load_default()
+
+    def char_width(self, font: ImageFont.ImageFont, char: str) -> float:
+        """单个字符的前进宽度（带缓存）"""
+        advances = self._advances.setdefault(id(font), {})
+        width = advances.get(char)
+        if width is None:
+            width = font.getlength(char)
+            advances[char] = width
+        return width
+
+    def text_width(self, font: ImageFont.ImageFont, text: str) -> float:
+        """按缓存的字符宽度累加文本宽度（忽略字距调整）"""
+        return sum(self.char_width(font, char) for char in text)
+
+
+_registries: Dict[Optional[str], FontRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_font_registry(custom_font_path: Optional[str] = None) -> FontRegistry:
+    """获取进程级共享的字体注册表"""
+    registry = _registries.get(custom_font_path)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.setdefault(custom_font_path, FontRegistry(custom_font_path))
+    return registry
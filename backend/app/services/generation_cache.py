@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import logging
+from typing import Awaitable, Callable, Optional
+from .cache import Cache, create_cache, content_hash
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_fingerprint(prompt: str) -> str:
+    """提示词指纹，提示词修改后旧缓存自动失效"""
+    return content_hash(prompt.encode('utf-8'))[:16]
+
+
+def normalize_text(text: str) -> str:
+    """归一化用户输入：去除首尾空白并合并连续空白"""
+    return ' '.join(text.split())
+
+
+class GenerationCache:
+    """模型生成结果缓存
+
+    variety > 1 时为"多样"模式：同一输入最多缓存 variety 个候选，
+    未满时继续调用模型生成新候选，满后在候选之间轮换返回。
+    """
+
+    def __init__(self, cache: Cache, variety: int = 1):
+        self.cache = cache
+        self.variety = max(1, variety)
+
+    @property
+    def stats(self):
+        return self.cache.stats
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """由归一化后的输入、模型和提示词指纹组成缓存键"""
+        return content_hash('\x1f'.join(parts).encode('utf-8'))
+
+    async def _load(self, key: str) -> dict:
+        raw = await self.cache.get(key, record_stats=False)
+        if raw:
+            try:
+                return json.loads(raw)
+            except json.JSONDecodeError:
+                logger.warning("生成缓存条目损坏，已忽略: %s", key)
+        return {'candidates': [], 'cursor': 0}
+
+    async def _save(self, key: str, entry: dict):
+        """写回条目，沿用首次写入时的过期时间，轮换游标不会延长有效期"""
+        ttl = self.cache.ttl
+        if ttl:
+            now = time.time()
+            entry.setdefault('expires_at', now + ttl)
+            ttl = entry['expires_at'] - now
+            if ttl <= 0:
+                await self.cache.delete(key)
+                return
+        await self.cache.set(key, json.dumps(entry, ensure_ascii=False), ttl)
+
+    async def lookup(self, key: str) -> Optional[str]:
+        """候选已满时轮换返回一个缓存结果，否则返回 None 表示需要重新生成"""
+        entry = await self._load(key)
+        candidates = entry['candidates']
+        if len(candidates) < self.variety:
+            self.cache.stats.misses += 1
+            return None
+        self.cache.stats.hits += 1
+        value = candidates[entry['cursor'] % len(candidates)]
+        if len(candidates) > 1:
+            entry['cursor'] = (entry['cursor'] + 1) % len(candidates)
+            await self._save(key, entry)
+        return value
+
+    async def add(self, key: str, value: str):
+        """写入一个新生成的候选"""
+        if not value:
+            return
+        entry = await self._load(key)
+        if len(entry['candidates']) < self.variety:
+            entry['candidates'].append(value)
+            await self._save(key, entry)
+
+    async def get_or_generate(self, key: str, generate: Callable[[], Awaitable[str]]) -> str:
+        """命中缓存时返回缓存内容，否则调用 generate 生成并写入缓存"""
+        value = await self.lookup(key)
+        if value is not None:
+            return value
+        value = await generate()
+        await self.add(key, value)
+        return value
+
+    async def close(self):
+        await self.cache.close()
+
+
+def create_generation_cache() -> Optional[GenerationCache]:
+    """根据 LLM_CACHE_* 环境变量创建生成缓存，默认关闭"""
+    cache = create_cache('llm', 'LLM_CACHE', default_ttl=86400, default_backend='none')
+    if cache is None:
+        return None
+    return GenerationCache(cache, variety=int(os.getenv('LLM_CACHE_VARIETY', 1)))
@@ -0,0 +1,91 @@
+import os
+import logging
+from typing import TYPE_CHECKING, Dict
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整型环境变量"""
+    value = os.getenv(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        logger.warning("环境变量 %s=%s 不是有效整数，使用默认值 %s", name, value, default)
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """读取浮点型环境变量"""
+    value = os.getenv(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        logger.warning("环境变量 %s=%s 不是有效数字，使用默认值 %s", name, value, default)
+        return default
+
+
+def _http2_available() -> bool:
+    """检测是否安装了 HTTP/2 依赖 (h2)"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def build_limits(upstream: str) -> 'httpx.Limits':
+    """构建连接池限制，支持按上游覆盖，如 HTTP_IMGBB_MAX_CONNECTIONS"""
+    import httpx
+
+    prefix = f"HTTP_{upstream.upper()}_"
+    max_connections = _env_int(prefix + 'MAX_CONNECTIONS', _env_int('HTTP_MAX_CONNECTIONS', 20))
+    max_keepalive = _env_int(prefix + 'MAX_KEEPALIVE', _env_int('HTTP_MAX_KEEPALIVE', 10))
+    keepalive_expiry = _env_float(prefix + 'KEEPALIVE_EXPIRY', _env_float('HTTP_KEEPALIVE_EXPIRY', 30.0))
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+
+def create_client(upstream: str) -> 'httpx.AsyncClient':
+    """为指定上游创建带连接池的 AsyncClient（httpx 在首次创建时才导入）"""
+    import httpx
+
+    http2 = os.getenv('HTTP_ENABLE_HTTP2', 'true').lower() != 'false' and _http2_available()
+    limits = build_limits(upstream)
+    timeout = httpx.Timeout(_env_float('HTTP_TIMEOUT', 60.0), connect=_env_float('HTTP_CONNECT_TIMEOUT', 10.0))
+    logger.info(
+        f"创建 {upstream} 连接池: max_connections={limits.max_connections}, "
+        f"max_keepalive={limits.max_keepalive_connections}, http2={http2}"
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+
+class HttpClientManager:
+    """管理各上游共享的 httpx.AsyncClient，随应用生命周期创建和关闭"""
+
+    def __init__(self):
+        self._clients: Dict[str, 'httpx.AsyncClient'] = {}
+
+    def get(self, upstream: str) -> 'httpx.AsyncClient':
+        """获取上游对应的共享客户端，首次使用时创建"""
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            client = create_client(upstream)
+            self._clients[upstream] = client
+        return client
+
+    async def aclose(self):
+        """关闭所有客户端连接池"""
+        for upstream, client in self._clients.items():
+            try:
+                await client.aclose()
+                logger.info("已关闭 %s 连接池", upstream)
+            except Exception as e:
+                logger.error("关闭 %s 连接池失败: %s", upstream, e)
+        self._clients.clear()
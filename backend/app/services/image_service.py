@@ -1,138 +1,327 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, features
 import logging
-import textwrap
 import base64
-import requests
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from typing import List, Optional, Tuple
 import traceback
-import platform
 import os
+import httpx
+from .fonts import get_font_registry
+from .text_layout import TextLayoutEngine
+from .metrics import timed
+from .svg_pipeline import rasterize_svg
 
 logger = logging.getLogger(__name__)
 
+# 诗意卡片尺寸（9:16，与前端卡片一致），上 40% 为点评，下 60% 为插图
+POETRY_CARD_SIZE = (720, 1280)
+
+class PostcardEncoding:
+    """明信片输出编码：格式、质量与可选的最大边长"""
+    
+    FORMATS = {
+        'jpeg': ('JPEG', 'image/jpeg'),
+        'webp': ('WEBP', 'image/webp'),
+        'avif': ('AVIF', 'image/avif'),
+        'png': ('PNG', 'image/png'),
+    }
+    
+    def __init__(self, format: str = 'jpeg', quality: int = 95, max_dimension: Optional[int] = None):
+        format = format.lower().replace('jpg', 'jpeg')
+        if format not in self.FORMATS:
+            raise ValueError(f"不支持的输出格式: {format}")
+        if not self.is_supported(format):
+            logger.warning("当前 Pillow 不支持 %s 编码，回退为 JPEG", format)
+            format = 'jpeg'
+        self.format = format
+        self.quality = quality
+        self.max_dimension = max_dimension
+    
+    @property
+    def pil_format(self) -> str:
+        return self.FORMATS[self.format][0]
+    
+    @property
+    def media_type(self) -> str:
+        return self.FORMATS[self.format][1]
+    
+    @staticmethod
+    def is_supported(format: str) -> bool:
+        """检查 Pillow 是否支持该格式编码"""
+        if format in ('jpeg', 'png'):
+            return True
+        return bool(features.check(format))
+
 class ImageService:
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None, max_workers: Optional[int] = None):
         """初始化图片服务"""
         self.custom_font_path = os.getenv('CUSTOM_FONT_PATH')  # 可以通过环境变量配置自定义字体
         self.font_size = 30
-        self.system_fonts = self._get_system_fonts()
+        self.min_font_size = 16
+        self.fonts = get_font_registry(self.custom_font_path)
+        self.layout_engine = TextLayoutEngine(self.fonts)
+        self.http_client = http_client  # 共享连接池，用于下载图片
+        # Pillow 解码/绘制/编码在有界线程池中执行，避免阻塞事件循环
+        if max_workers is None:
+            max_workers = int(os.getenv('POSTCARD_WORKERS', min(4, os.cpu_count() or 1)))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='postcard')
         
-    def _get_system_fonts(self):
-        """获取系统字体列表"""
-        system = platform.system()
-        if system == "Darwin":  # macOS
-            return [
-                "/System/Library/Fonts/PingFang.ttc",  # PingFang
-                "/System/Library/Fonts/STHeiti Light.ttc",  # Heiti
-                "/System/Library/Fonts/Hiragino Sans GB.ttc"  # Hiragino
-            ]
-        elif system == "Windows":
-            return [
-                "C:\\Windows\\Fonts\\msyh.ttc",  # Microsoft YaHei
-                "C:\\Windows\\Fonts\\simhei.ttf",  # SimHei
-                "C:\\Windows\\Fonts\\simsun.ttc"  # SimSun
-            ]
-        return []  # 其他系统返回空列表
-
-    def _get_font(self, size=20):
-        """获取字体，优先使用配置的自定义字体，否则尝试系统字体"""
+    async def _download_image(self, image_url: str) -> bytes:
+        """异步下载图片"""
+        with timed('image_download'):
+            if self.http_client is not None:
+                response = await self.http_client.get(image_url)
+            else:
+                async with httpx.AsyncClient() as client:
+                    response = await client.get(image_url)
+        response.raise_for_status()
+        return response.content
+
+    async def run_in_executor(self, func, *args):
+        """在图片线程池中执行 CPU 密集型任务（携带当前上下文，阶段耗时可计入当前请求）"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, context.run, func, *args)
+
+    @staticmethod
+    def _decode_image(image_data: bytes) -> Image.Image:
+        """解码图片字节并完成像素加载"""
+        with timed('decode'):
+            image = Image.open(BytesIO(image_data))
+            image.load()
+        return image
+
+    async def load_image(self, image_data: bytes) -> Image.Image:
+        """在线程池中解码图片，供后续渲染复用"""
+        return await self.run_in_executor(self._decode_image, image_data)
+
+    async def create_postcard(
+        self,
+        text: str,
+        image_url: Optional[str] = None,
+        image: Optional[Image.Image] = None,
+        image_data: Optional[bytes] = None,
+        encoding: Optional[PostcardEncoding] = None
+    ) -> Optional[str]:
+        """创建明信片样式图片，返回 base64 data URL"""
+        encoding = encoding or PostcardEncoding()
+        postcard = await self.render_postcard(text, image_url, image, image_data, encoding)
+        if postcard is None:
+            return None
+        return f"data:{encoding.media_type};base64,{base64.b64encode(postcard).decode()}"
+
+    async def postcard_result(
+        self,
+        text: str,
+        image_url: Optional[str] = None,
+        image: Optional[Image.Image] = None,
+        encoding: Optional[PostcardEncoding] = None,
+        binary: bool = False
+    ) -> dict:
+        """渲染明信片并组装接口结果：binary 为 True 时返回 postcard_bytes / media_type，否则返回 data URL"""
+        encoding = encoding or PostcardEncoding()
+        render = self.render_postcard if binary else self.create_postcard
+        postcard = await render(text=text, image_url=image_url, image=image, encoding=encoding)
+        if not postcard:
+            raise Exception("生成明信片图片失败: 返回为空")
+        if binary:
+            return {
+                "text": text,
+                "postcard_bytes": postcard,
+                "media_type": encoding.media_type
+            }
+        return {
+            "text": text,
+            "postcard_image": postcard
+        }
+
+    async def render_postcard(
+        self,
+        text: str,
+        image_url: Optional[str] = None,
+        image: Optional[Image.Image] = None,
+        image_data: Optional[bytes] = None,
+        encoding: Optional[PostcardEncoding] = None
+    ) -> Optional[bytes]:
+        """创建明信片样式图片并返回编码后的字节，优先使用已解码图片或原始字节，最后才从 URL 下载"""
         try:
-            # 首先尝试使用自定义字体
-            if self.custom_font_path and os.path.exists(self.custom_font_path):
-                logger.info(f"使用自定义字体: {self.custom_font_path}")
-                return ImageFont.truetype(self.custom_font_path, size)
-            
-            # 尝试系统字体
-            for font_path in self.system_fonts:
-                if os.path.exists(font_path):
-                    logger.info(f"使用系统字体: {font_path}")
-                    return ImageFont.truetype(font_path, size)
+            logger.info("开始处理图片，文本长度: %s", len(text))
             
-            # 如果都失败了，使用默认字体
-            logger.warning("未找到合适的字体，使用默认字体")
-            return ImageFont.load_default()
+            # 获取图片
+            if image is None:
+                if image_data is None:
+                    image_data = await self._download_image(image_url)
+                image = await self.load_image(image_data)
+            return await self.run_in_executor(self._render_postcard, image, text, encoding or PostcardEncoding())
             
         except Exception as e:
-            logger.error(f"加载字体失败: {str(e)}")
-            return ImageFont.load_default()
+            logger.error("创建明信片失败: %s", e)
+            logger.error(traceback.format_exc())
+            return None
 
-    async def create_postcard(self, image_url: str, text: str) -> str:
-        """创建明信片样式图片"""
+    def _render_postcard(self, image: Image.Image, text: str, encoding: PostcardEncoding) -> bytes:
+        """绘制明信片并编码（同步，在线程池中运行）"""
         try:
-            logger.info(f"开始处理图片，文本长度: {len(text)}")
-            
-            # 获取图片
-            response = requests.get(image_url)
-            image = Image.open(BytesIO(response.content))
-            
-            # 计算新图片尺寸
-            text_height = max(200, len(text) * 2)  # 根据文本长度动态调整文本区域高度
-            new_height = image.height + text_height
-            new_image = Image.new('RGB', (image.width, new_height), 'white')
-            new_image.paste(image, (0, 0))
-            
-            # 创建绘图对象
-            draw = ImageDraw.Draw(new_image)
-            
-            # 获取字体
-            font = self._get_font(self.font_size)
+            with timed('render'):
+                # 文本排版：按缓存字宽断行，长文本自动缩小字号，文本区最多占原图高度的一半
+                margin = 40  # 左右边距
+                padding = 20  # 上下留白
+                spacing = 10  # 行间距
+                max_width = image.width - (margin * 2)
+                layout = self.layout_engine.fit(
+                    text,
+                    max_width=max_width,
+                    max_height=max(200, image.height // 2) - padding * 2,
+                    max_size=self.font_size,
+                    min_size=self.min_font_size,
+                    spacing=spacing
+                )
             
-            # 文本换行处理
-            margin = 40  # 左右边距
-            max_width = image.width - (margin * 2)
-            avg_char_width = font.getlength("测")  # 使用中文字符计算平均字符宽度
-            chars_per_line = int(max_width / avg_char_width)
-            wrapped_text = textwrap.fill(text, width=chars_per_line)
+                # 计算新图片尺寸
+                text_height = max(200, layout.height + padding * 2)
+                new_height = image.height + text_height
+                new_image = Image.new('RGB', (image.width, new_height), 'white')
+                new_image.paste(image, (0, 0))
             
-            # 获取文本尺寸
-            text_bbox = draw.textbbox((0, 0), wrapped_text, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_height_actual = text_bbox[3] - text_bbox[1]
+                # 创建绘图对象
+                draw = ImageDraw.Draw(new_image)
             
-            # 计算文本位置
-            x = (image.width - text_width) / 2
-            y = image.height + ((text_height - text_height_actual) / 2)
-            
-            # 绘制文本背景
-            padding = 20
-            background_bbox = (
-                x - padding,
-                y - padding,
-                x + text_width + padding,
-                y + text_height_actual + padding
-            )
-            draw.rectangle(background_bbox, fill='white')
-            
-            # 绘制文本
-            draw.multiline_text(
-                (x, y),
-                wrapped_text,
-                font=font,
-                fill='black',
-                align='center',
-                spacing=10
-            )
+                # 逐行居中绘制文本
+                y = image.height + (text_height - layout.height) / 2
+                for line, line_width in layout.lines:
+                    x = (image.width - line_width) / 2
+                    draw.text((x, y), line, font=layout.font, fill='black')
+                    y += layout.line_height + layout.spacing
             
             # 记录调试信息
-            logger.debug(f"图片尺寸: {image.width}x{image.height}")
-            logger.debug(f"新图片尺寸: {new_image.width}x{new_height}")
-            logger.debug(f"文本框尺寸: {text_bbox}")
-            logger.debug(f"计算的文本位置: x={x}, y={y}")
-            logger.debug(f"换行后的文本:\n{wrapped_text}")
+            logger.debug(
+                "图片尺寸: %dx%d, 新图片尺寸: %dx%d, 字号: %d, 行数: %d, 文本高度: %d",
+                image.width, image.height, new_image.width, new_height,
+                layout.font_size, len(layout.lines), layout.height
+            )
             
-            # 转换为base64
-            buffered = BytesIO()
-            new_image.save(buffered, format="JPEG", quality=95)
-            img_str = base64.b64encode(buffered.getvalue()).decode()
+            # 限制输出尺寸后编码
+            with timed('encode'):
+                if encoding.max_dimension and max(new_image.size) > encoding.max_dimension:
+                    new_image.thumbnail((encoding.max_dimension, encoding.max_dimension), Image.Resampling.LANCZOS)
+                buffered = BytesIO()
+                new_image.save(buffered, format=encoding.pil_format, quality=encoding.quality)
             
             logger.info("成功创建明信片样式图片")
-            return f"data:image/jpeg;base64,{img_str}"
+            return buffered.getvalue()
             
         except Exception as e:
-            logger.error(f"创建明信片失败: {str(e)}")
+            logger.error("创建明信片失败: %s", e)
             logger.error(traceback.format_exc())
             return None
     
+    async def render_poetry_card(self, comment: str, svg: str, encoding: PostcardEncoding) -> Optional[bytes]:
+        """渲染诗意卡片（点评 + SVG 插图）并编码，无法渲染 SVG 时返回 None"""
+        try:
+            return await self.run_in_executor(self._render_poetry_card, comment, svg, encoding)
+        except Exception as e:
+            logger.error("渲染诗意卡片失败: %s", e)
+            return None
+
+    def _render_poetry_card(self, comment: str, svg: str, encoding: PostcardEncoding) -> Optional[bytes]:
+        """绘制诗意卡片并编码（同步，在线程池中运行）"""
+        width, height = POETRY_CARD_SIZE
+        margin = 40
+        text_height = int(height * 0.4)
+
+        with timed('render'):
+            art_box = (width - margin * 2, height - text_height - margin * 2)
+            png = rasterize_svg(svg, art_box[0]) if svg else None
+            if png is None:
+                return None
+            art = Image.open(BytesIO(png)).convert('RGBA')
+            art.thumbnail(art_box, Image.Resampling.LANCZOS)
+
+            card = Image.new('RGB', POETRY_CARD_SIZE, 'white')
+            draw = ImageDraw.Draw(card)
+            layout = self.layout_engine.fit(
+                comment,
+                max_width=width - margin * 4,
+                max_height=text_height - margin * 2,
+                max_size=44,
+                min_size=self.min_font_size
+            )
+            y = (text_height - layout.height) / 2
+            for line, line_width in layout.lines:
+                draw.text(((width - line_width) / 2, y), line, font=layout.font, fill='#37352f')
+                y += layout.line_height + layout.spacing
+            # 分隔线
+            draw.line((width * 0.1, text_height, width * 0.9, text_height), fill='#e9e9e7', width=2)
+            card.paste(art, ((width - art.width) // 2, text_height + margin + (art_box[1] - art.height) // 2), art)
+
+        with timed('encode'):
+            buffered = BytesIO()
+            card.save(buffered, format=encoding.pil_format, quality=encoding.quality)
+        return buffered.getvalue()
+
+    @staticmethod
+    def working_mode(image: Image.Image, fmt: str) -> Image.Image:
+        """转换为 reduce() 与各输出格式都支持的 RGB / RGBA / L 模式
+
+        调色板（P）、二值（1）、16 位（I;16）、CMYK、浮点（F）等模式无法 reduce() 或无法保存为部分格式；
+        带透明度的图片保留 RGBA（JPEG 除外）
+        """
+        transparent = image.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La') or 'transparency' in image.info
+        if transparent and fmt != 'JPEG':
+            mode = 'RGBA'
+        elif image.mode in ('1', 'L'):
+            mode = 'L'
+        else:
+            mode = 'RGB'
+        return image if image.mode == mode else image.convert(mode)
+
     def resize_image(self, image: Image.Image, width: int, height: int) -> Image.Image:
-        """调整图片大小"""
-        return image.resize((width, height), Image.Resampling.LANCZOS)
\ No newline at end of file
+        """调整图片大小：大幅缩小时先用 reduce() 整数倍降采样，再用 LANCZOS 精确缩放"""
+        factor = min(image.width // width, image.height // height)
+        if factor >= 2:
+            if image.mode not in ('RGB', 'RGBA', 'L'):
+                image = self.working_mode(image, 'PNG')
+            # 保留约 2 倍余量给 LANCZOS，兼顾速度与质量
+            image = image.reduce(max(1, factor // 2))
+        return image.resize((width, height), Image.Resampling.LANCZOS)
+
+    def _resize_to_sizes(self, image_data: bytes, sizes: List[Tuple[int, int]], fmt: str, quality: int) -> List[dict]:
+        """解码一次并输出多个尺寸（同步，在线程池中运行）"""
+        image = Image.open(BytesIO(image_data))
+        if image.format == 'JPEG':
+            # JPEG 按最大目标尺寸在解码阶段做 DCT 缩放，避免完整分辨率解码
+            max_width = max(width for width, _ in sizes)
+            max_height = max(height for _, height in sizes)
+            image.draft('RGB', (max_width, max_height))
+        image.load()
+        image = self.working_mode(image, fmt)
+        
+        outputs = []
+        for width, height in sizes:
+            resized = self.resize_image(image, width, height)
+            buffered = BytesIO()
+            save_kwargs = {'quality': quality} if fmt in ('JPEG', 'WEBP') else {'optimize': False}
+            resized.save(buffered, format=fmt, **save_kwargs)
+            outputs.append({
+                'width': width,
+                'height': height,
+                'data': buffered.getvalue()
+            })
+        return outputs
+
+    async def resize_to_sizes(
+        self,
+        image_data: bytes,
+        sizes: List[Tuple[int, int]],
+        fmt: str = 'PNG',
+        quality: int = 90
+    ) -> List[dict]:
+        """在线程池中将图片缩放为一个或多个尺寸，返回 [{width, height, data}]"""
+        return await self.run_in_executor(self._resize_to_sizes, image_data, sizes, fmt, quality)
+
+    def close(self):
+        """关闭线程池"""
+        self.executor.shutdown(wait=False)
@@ -4,81 +4,99 @@ import httpx
 import base64
 import asyncio
 from typing import Optional
+from .cache import Cache, content_hash
+from .limits import UpstreamLimiter
+from .metrics import timed
+from .resilience import CircuitOpenError, ResilientCaller, UpstreamError
 
 logger = logging.getLogger(__name__)
 
 class ImgBBService:
-    def __init__(self):
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[Cache] = None,
+        limiter: Optional[UpstreamLimiter] = None,
+        resilience: Optional[ResilientCaller] = None
+    ):
+        self.client = client  # 共享连接池，未提供时每次请求临时创建
+        self.limiter = limiter or UpstreamLimiter('imgbb')  # 上游并发与速率限制
+        self.resilience = resilience or ResilientCaller('imgbb')  # 超时、重试与熔断
+        self.cache = cache  # 内容寻址缓存：图片哈希 -> 托管 URL
         self.api_key = os.getenv('IMGBB_API_KEY')
         if not self.api_key:
             raise ValueError("IMGBB_API_KEY environment variable is not set")
         self.upload_url = "https://api.imgbb.com/1/upload"
-        self.max_retries = 3
-        self.timeout = 60.0  # 增加超时时间到60秒
     
     async def _try_upload(self, client: httpx.AsyncClient, data: dict) -> Optional[str]:
         """单次尝试上传"""
-        response = await client.post(
-            self.upload_url,
-            data=data,
-            timeout=self.timeout
-        )
+        response = await client.post(self.upload_url, data=data, timeout=self.resilience.timeout)
         
         if response.status_code != 200:
-            logger.error(f"ImgBB API返回错误状态码: {response.status_code}")
-            logger.error(f"错误响应: {response.text}")
-            return None
+            logger.error("ImgBB API返回错误状态码: %s", response.status_code)
+            logger.error("错误响应: %s", response.text)
+            # 抛出异常，由弹性策略判断是否重试（429/5xx）
+            raise UpstreamError('imgbb', response.status_code, response.text)
         
         result = response.json()
-        logger.debug(f"ImgBB响应: {result}")
+        logger.debug("ImgBB响应: %s", result)
         
         if result.get('success'):
             image_url = result['data']['url']
-            logger.info(f"图片上传成功: {image_url}")
+            logger.info("图片上传成功: %s", image_url)
             return image_url
         else:
-            logger.error(f"ImgBB上传失败: {result.get('error', {}).get('message', '未知错误')}")
+            logger.error("ImgBB上传失败: %s", result.get('error', {}).get('message', '未知错误'))
             return None
     
-    async def upload_image(self, image_data: bytes) -> Optional[str]:
-        """异步上传图片到ImgBB，带重试机制"""
+    async def _upload_with_retries(self, client: httpx.AsyncClient, data: dict) -> Optional[str]:
+        """按弹性策略上传：可重试错误带抖动退避重试，上游持续失败时熔断"""
         try:
-            # 转换图片数据为base64
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            
-            # 准备请求数据
-            data = {
-                'key': self.api_key,
-                'image': image_base64
-            }
-            
-            logger.info("开始上传图片到ImgBB...")
+            # 排队等待不计入上游超时和熔断失败
+            async with self.limiter:
+                return await self.resilience.call(lambda: self._try_upload(client, data))
+        except CircuitOpenError as e:
+            logger.error(str(e))
+        except asyncio.TimeoutError:
+            logger.error("上传超时，尝试次数已达上限")
+        except Exception as e:
+            logger.error("上传失败: %s", e)
+        return None
+
+    async def upload_image(self, image_data: bytes, image_hash: Optional[str] = None) -> Optional[str]:
+        """异步上传图片到ImgBB，带重试机制；相同内容命中缓存时直接返回已托管的 URL"""
+        try:
+            if self.cache is not None:
+                image_hash = image_hash or content_hash(image_data)
+                cached_url = await self.cache.get(image_hash)
+                if cached_url:
+                    logger.info("命中上传缓存: %s", cached_url)
+                    return cached_url
             
-            async with httpx.AsyncClient() as client:
-                for attempt in range(self.max_retries):
-                    try:
-                        if attempt > 0:
-                            logger.info(f"第 {attempt + 1} 次重试上传...")
-                            # 重试前等待一段时间
-                            await asyncio.sleep(2 ** attempt)  # 指数退避
-                            
-                        result = await self._try_upload(client, data)
-                        if result:
-                            return result
-                            
-                    except httpx.TimeoutException:
-                        logger.warning(f"第 {attempt + 1} 次上传超时")
-                        if attempt == self.max_retries - 1:
-                            logger.error("上传尝试次数已达上限")
-                            return None
-                        continue
-                    except httpx.RequestError as e:
-                        logger.error(f"请求错误: {str(e)}")
-                        return None
-                        
-            logger.error("所有上传尝试均失败")
-            return None
+            with timed('imgbb_upload'):
+                image_url = await self._upload(image_data)
+            if image_url and self.cache is not None:
+                await self.cache.set(image_hash, image_url)
+            return image_url
                 
         except Exception as e:
-            logger.error(f"ImgBB上传发生未知错误: {str(e)}")
-            return None
\ No newline at end of file
+            logger.error("ImgBB上传发生未知错误: %s", e)
+            return None
+
+    async def _upload(self, image_data: bytes) -> Optional[str]:
+        """执行实际上传"""
+        # 转换图片数据为base64
+        image_base64 = base64.b64encode(image_data).decode('utf-8')
+        
+        # 准备请求数据
+        data = {
+            'key': self.api_key,
+            'image': image_base64
+        }
+        
+        logger.info("开始上传图片到ImgBB...")
+        
+        if self.client is not None:
+            return await self._upload_with_retries(self.client, data)
+        async with httpx.AsyncClient() as client:
+            return await self._upload_with_retries(client, data)
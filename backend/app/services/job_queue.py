@@ -0,0 +1,159 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+
+class IdempotencyConflictError(Exception):
+    """同一客户端以相同幂等键提交了参数不同的任务"""
+
+
+class Job:
+    """后台任务及其状态：queued -> running -> succeeded / failed"""
+
+    def __init__(self, idempotency_key: Optional[Tuple[str, str]] = None, fingerprint: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.idempotency_key = idempotency_key
+        self.fingerprint = fingerprint
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('succeeded', 'failed')
+
+    def to_dict(self) -> dict:
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.status == 'succeeded':
+            data['result'] = self.result
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+
+class JobQueue:
+    """有界任务队列与 asyncio 工作协程池
+
+    队列满时 submit 抛出 QueueFullError（由接口转换为 429）；
+    幂等键按客户端隔离，同一客户端相同幂等键的重复提交直接返回已有任务，不会重复执行（已失败的任务除外）；
+    参数指纹不一致时抛出 IdempotencyConflictError（由接口转换为 409）。
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 100, result_ttl: float = 3600):
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._jobs: Dict[str, Job] = {}
+        self._idempotency: Dict[Tuple[str, str], str] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        """当前排队中的任务数"""
+        return self._queue.qsize()
+
+    def start(self):
+        """启动工作协程"""
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+        logger.info("任务队列已启动: workers=%s, max_queue=%s", self.workers, self._queue.maxsize)
+
+    async def stop(self):
+        """停止工作协程，未完成的任务将被取消"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(
+        self,
+        func: Callable[[], Awaitable],
+        idempotency_key: Optional[str] = None,
+        client: str = '',
+        fingerprint: Optional[str] = None
+    ) -> Job:
+        """提交任务，func 为返回协程的无参可调用对象；client 为客户端标识，fingerprint 为请求参数指纹"""
+        self._prune()
+        key = (client, idempotency_key) if idempotency_key else None
+        if key:
+            existing = self._jobs.get(self._idempotency.get(key))
+            if existing and existing.status != 'failed':
+                if existing.fingerprint != fingerprint:
+                    raise IdempotencyConflictError("幂等键已用于参数不同的任务")
+                logger.info("幂等键命中已有任务: %s", existing.id)
+                return existing
+
+        job = Job(key, fingerprint)
+        try:
+            self._queue.put_nowait((job, func))
+        except asyncio.QueueFull:
+            raise QueueFullError("任务队列已满，请稍后重试")
+
+        self._jobs[job.id] = job
+        if key:
+            self._idempotency[key] = job.id
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def _prune(self):
+        """清理过期的已完成任务"""
+        now = time.time()
+        expired = [
+            job for job in self._jobs.values()
+            if job.done and now - job.finished_at > self.result_ttl
+        ]
+        for job in expired:
+            del self._jobs[job.id]
+            if job.idempotency_key:
+                self._idempotency.pop(job.idempotency_key, None)
+
+    async def _worker(self, index: int):
+        while True:
+            job, func = await self._queue.get()
+            job.status = 'running'
+            job.started_at = time.time()
+            try:
+                job.result = await func()
+                job.status = 'succeeded'
+            except asyncio.CancelledError:
+                job.status = 'failed'
+                job.error = '任务已取消'
+                job.finished_at = time.time()
+                raise
+            except Exception as e:
+                logger.error("任务 %s 执行失败: %s", job.id, e)
+                job.status = 'failed'
+                job.error = getattr(e, 'detail', None) or str(e)
+            finally:
+                if job.finished_at is None:
+                    job.finished_at = time.time()
+                self._queue.task_done()
+
+
+def create_job_queue() -> JobQueue:
+    """根据 JOB_* 环境变量创建任务队列"""
+    return JobQueue(
+        workers=int(os.getenv('JOB_WORKERS', 4)),
+        max_queue=int(os.getenv('JOB_MAX_QUEUE', 100)),
+        result_ttl=float(os.getenv('JOB_RESULT_TTL', 3600))
+    )
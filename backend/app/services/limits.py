@@ -0,0 +1,86 @@
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，capacity 为突发容量；rate <= 0 表示不限速"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """尝试取令牌，成功返回 0，否则返回需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1.0):
+        """等待直到取得令牌"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class UpstreamLimiter:
+    """上游调用限制：并发上限 + 请求速率，作为异步上下文管理器使用；max_queue 为排队上限，供准入控制提前拒绝"""
+
+    def __init__(self, name: str, concurrency: int = 0, rate: float = 0, max_queue: int = 0):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.bucket = TokenBucket(rate)
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+
+    def saturated(self) -> float:
+        """排队已满时返回建议重试秒数，否则返回 0"""
+        if self.max_queue <= 0 or self.waiting < self.max_queue:
+            return 0.0
+        if self.bucket.rate > 0:
+            return self.waiting / self.bucket.rate
+        return 1.0
+
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            await self.bucket.acquire()
+            if self._semaphore is not None:
+                await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+def create_upstream_limiter(name: str, default_concurrency: int = 0, default_rate: float = 0) -> UpstreamLimiter:
+    """根据 UPSTREAM_<NAME>_CONCURRENCY / _RATE / _MAX_QUEUE 环境变量创建上游限制"""
+    prefix = f"UPSTREAM_{name.upper()}_"
+    concurrency = int(os.getenv(prefix + 'CONCURRENCY', default_concurrency))
+    rate = float(os.getenv(prefix + 'RATE', default_rate))
+    max_queue = int(os.getenv(prefix + 'MAX_QUEUE', 0))
+    logger.info(
+        f"上游 {name} 限制: concurrency={concurrency or '不限'}, rate={rate or '不限'}/s, "
+        f"max_queue={max_queue or '不限'}"
+    )
+    return UpstreamLimiter(name, concurrency=concurrency, rate=rate, max_queue=max_queue)
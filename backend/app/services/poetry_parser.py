@@ -0,0 +1,47 @@
+from typing import List, Tuple
+
+COMMENT_MARKER = "【点评】"
+SVG_MARKER = "【SVG】"
+
+
+def parse_poetry_content(content: str) -> dict:
+    """从模型输出中解析【点评】与【SVG】两部分"""
+    comment = ""
+    svg = ""
+
+    if COMMENT_MARKER in content:
+        comment = content.split(COMMENT_MARKER)[1].split(SVG_MARKER)[0].strip()
+    if SVG_MARKER in content:
+        svg = content.split(SVG_MARKER)[1].strip()
+
+    return {
+        'comment': comment,
+        'svg': svg
+    }
+
+
+class PoetryStreamParser:
+    """增量解析流式输出：【SVG】标记出现时点评即已完整，可立即推送"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.comment_sent = False
+
+    def feed(self, delta: str) -> List[Tuple[str, dict]]:
+        """追加一段增量文本，返回可以推送的事件列表"""
+        self.buffer += delta
+        events = [('token', {'text': delta})]
+        if not self.comment_sent and COMMENT_MARKER in self.buffer and SVG_MARKER in self.buffer:
+            self.comment_sent = True
+            events.append(('comment', {'comment': parse_poetry_content(self.buffer)['comment']}))
+        return events
+
+    def finish(self) -> List[Tuple[str, dict]]:
+        """流结束，补发未推送的点评并返回完整结果"""
+        result = parse_poetry_content(self.buffer)
+        events = []
+        if not self.comment_sent:
+            self.comment_sent = True
+            events.append(('comment', {'comment': result['comment']}))
+        events.append(('done', result))
+        return events
@@ -0,0 +1,102 @@
+import re
+import math
+import logging
+from typing import Dict, List
+from ..config.prompts import SYSTEM_PROMPTS, POETRY_PROMPT, PROMPT_VERSIONS, USER_TEMPLATES
+from .generation_cache import prompt_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# 按 DeepSeek 文档的经验值估算 token：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token
+CJK_TOKEN_RATIO = 0.6
+OTHER_TOKEN_RATIO = 0.3
+CJK_CHARS = re.compile(r'[　-〿㐀-鿿＀-￯]')
+
+DEFAULT_WORKFLOW = 'mood'
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数"""
+    cjk = len(CJK_CHARS.findall(text))
+    other = len(text) - cjk
+    return math.ceil(cjk * CJK_TOKEN_RATIO + other * OTHER_TOKEN_RATIO)
+
+
+def compile_prompt(text: str) -> str:
+    """规整提示词：去掉每行的缩进与行尾空白，合并连续空行"""
+    lines: List[str] = []
+    for line in text.strip().splitlines():
+        line = line.strip()
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+class Prompt:
+    """编译后的提示词：规整后的文本、版本、指纹与估算的 token 数"""
+
+    __slots__ = ('name', 'version', 'text', 'fingerprint', 'tokens', 'source_tokens')
+
+    def __init__(self, name: str, text: str, version: int = 1):
+        self.name = name
+        self.version = version
+        self.text = compile_prompt(text)
+        self.fingerprint = prompt_fingerprint(f"{name}:v{version}\n{self.text}")
+        self.tokens = estimate_tokens(self.text)
+        self.source_tokens = estimate_tokens(text)
+
+
+class PromptRegistry:
+    """提示词注册表：启动时一次性编译，按名称取用
+
+    消息布局固定为「系统提示词 + 用户模板」，可变数据只出现在最后，
+    相同工作流的请求共享逐字相同的前缀，上游的前缀缓存可以命中
+    """
+
+    def __init__(self):
+        self._prompts: Dict[str, Prompt] = {}
+
+    def register(self, name: str, text: str, version: int = 1) -> Prompt:
+        prompt = self._prompts[name] = Prompt(name, text, version)
+        return prompt
+
+    def get(self, name: str) -> Prompt:
+        return self._prompts[name]
+
+    def image_prompt(self, workflow_type: str) -> Prompt:
+        """图片文案的系统提示词，未知工作流使用默认工作流"""
+        return self._prompts.get(f'image.{workflow_type}') or self._prompts[f'image.{DEFAULT_WORKFLOW}']
+
+    @staticmethod
+    def messages(prompt: Prompt, template: str, **values) -> list:
+        """构建对话消息：系统提示词在前，填充了可变数据的用户消息在后"""
+        return [
+            {"role": "system", "content": prompt.text},
+            {"role": "user", "content": USER_TEMPLATES[template].format(**values)}
+        ]
+
+    def stats(self) -> Dict[str, dict]:
+        """各提示词的版本、指纹与估算 token 数"""
+        return {
+            name: {
+                'version': prompt.version,
+                'fingerprint': prompt.fingerprint,
+                'tokens': prompt.tokens,
+                'saved_tokens': prompt.source_tokens - prompt.tokens,
+            }
+            for name, prompt in self._prompts.items()
+        }
+
+
+def create_prompt_registry() -> PromptRegistry:
+    """编译内置提示词并记录各提示词的 token 数"""
+    registry = PromptRegistry()
+    for workflow_type, text in SYSTEM_PROMPTS.items():
+        registry.register(f'image.{workflow_type}', text, PROMPT_VERSIONS.get(workflow_type, 1))
+    registry.register('poetry', POETRY_PROMPT, PROMPT_VERSIONS.get('poetry', 1))
+
+    for name, stats in registry.stats().items():
+        logger.info(
+            f"提示词 {name} v{stats['version']}: 约 {stats['tokens']} tokens（规整节省 {stats['saved_tokens']}）"
+        )
+    return registry
@@ -0,0 +1,208 @@
+import logging
+import threading
+import importlib
+from typing import TYPE_CHECKING
+from dotenv import load_dotenv
+from .http_client import HttpClientManager
+from .cache import create_cache
+from .generation_cache import create_generation_cache
+from .limits import create_upstream_limiter
+from .resilience import create_resilient_caller
+from .router import create_provider_router
+from .single_flight import create_single_flight
+from .prompt_registry import create_prompt_registry
+from .artifact_store import create_artifact_store
+from .upload_ingest import UploadLimits
+
+if TYPE_CHECKING:
+    from .imgbb_service import ImgBBService
+    from .image_service import ImageService
+
+logger = logging.getLogger(__name__)
+
+# 可互相替代的文本生成后端
+TEXT_PROVIDERS = ('deepseek', 'coze')
+
+# 延迟导入的服务模块，长驻进程可在启动时通过 preload_modules 预先导入
+SERVICE_MODULES = ('.image_service', '.imgbb_service', '.deepseek_service', '.coze_service')
+
+
+class ServiceRegistry:
+    """服务注册表：每个服务只构建一次，在请求间复用"""
+
+    def __init__(self, http_clients: HttpClientManager = None):
+        self.http_clients = http_clients or HttpClientManager()
+        self.config_version = 0
+        self._services = {}
+        # 因配置缺失无法构建的服务及其错误，本配置版本内不再重复构建
+        self._config_errors = {}
+        # 可重入：构建服务时会获取其依赖的服务（如 DeepSeek 依赖图片服务）
+        self._lock = threading.RLock()
+        # 缓存跨配置重载保留
+        self.caches = {
+            'upload': self._create_cache('upload', lambda: create_cache('upload', 'UPLOAD_CACHE', default_ttl=7 * 86400)),
+            'llm': self._create_cache('llm', create_generation_cache),
+            # 诗意卡片渲染结果：内容哈希 -> 产物 ID
+            'card': self._create_cache('card', lambda: create_cache('card', 'CARD_CACHE', default_ttl=600)),
+        }
+        self.artifacts = create_artifact_store()
+        self.upload_limits = UploadLimits.from_env()
+        # 上游限制跨配置重载保留，保证限额在所有请求间共享
+        self.limiters = {
+            name: create_upstream_limiter(name)
+            for name in ('imgbb', 'deepseek', 'coze')
+        }
+        # 熔断状态与耗时统计同样跨请求共享
+        self.resilience = {
+            'imgbb': create_resilient_caller('imgbb', default_timeout=60.0),
+            'deepseek': create_resilient_caller('deepseek', default_timeout=60.0),
+            'coze': create_resilient_caller('coze', default_timeout=30.0),
+        }
+        # 文本后端的耗时/错误率统计与并发上限，跨请求共享
+        self.router = create_provider_router(
+            list(TEXT_PROVIDERS), is_available=self.provider_available, is_configured=self.provider_configured
+        )
+        # 相同输入的并发生成只调用一次上游
+        self.single_flight = create_single_flight()
+        # 提示词只在启动时编译一次，跨配置重载保留
+        self.prompts = create_prompt_registry()
+        # 服务模块（openai、PIL、httpx 等）在首次构建服务时才导入
+        self._factories = {
+            'image': self._create_image,
+            'imgbb': self._create_imgbb,
+            'deepseek': self._create_deepseek,
+            'coze': self._create_coze,
+        }
+
+    def _create_image(self):
+        from .image_service import ImageService
+        return ImageService(http_client=self.http_clients.get('images'))
+
+    def _create_imgbb(self):
+        from .imgbb_service import ImgBBService
+        return ImgBBService(
+            client=self.http_clients.get('imgbb'),
+            cache=self.caches['upload'],
+            limiter=self.limiters['imgbb'],
+            resilience=self.resilience['imgbb']
+        )
+
+    def _create_deepseek(self):
+        from .deepseek_service import DeepseekService
+        return DeepseekService(
+            http_client=self.http_clients.get('deepseek'),
+            image_service=self.image,
+            cache=self.caches['llm'],
+            limiter=self.limiters['deepseek'],
+            resilience=self.resilience['deepseek'],
+            prompts=self.prompts
+        )
+
+    def _create_coze(self):
+        from .coze_service import CozeService
+        return CozeService(
+            client=self.http_clients.get('coze'),
+            limiter=self.limiters['coze'],
+            resilience=self.resilience['coze']
+        )
+
+    @staticmethod
+    def _create_cache(namespace: str, factory):
+        """创建缓存，配置错误时记录日志并禁用该缓存"""
+        try:
+            return factory()
+        except Exception as e:
+            logger.error("创建 %s 缓存失败，已禁用: %s", namespace, e)
+            return None
+
+    def cache_stats(self) -> dict:
+        """各缓存的命中统计"""
+        return {name: cache.stats.as_dict() for name, cache in self.caches.items() if cache is not None}
+
+    def get(self, name: str):
+        """获取服务实例，首次访问时构建；配置缺失时抛出 ValueError（结果保留到下次重载配置）"""
+        service = self._services.get(name)
+        if service is not None:
+            return service
+        error = self._config_errors.get(name)
+        if error is not None:
+            raise ValueError(error)
+        with self._lock:
+            service = self._services.get(name)
+            if service is None:
+                if name not in self._factories:
+                    raise KeyError(f"未知服务: {name}")
+                error = self._config_errors.get(name)
+                if error is not None:
+                    raise ValueError(error)
+                try:
+                    service = self._factories[name]()
+                except ValueError as e:
+                    self._config_errors[name] = str(e)
+                    raise
+                self._services[name] = service
+            return service
+
+    @property
+    def image(self) -> 'ImageService':
+        return self.get('image')
+
+    @property
+    def imgbb(self) -> 'ImgBBService':
+        return self.get('imgbb')
+
+    def text_service(self, model: str):
+        """根据模型名称返回文本生成服务"""
+        return self.get('deepseek' if model == "deepseek" else 'coze')
+
+    def provider_configured(self, name: str) -> bool:
+        """后端是否已正确配置（服务可以构建）"""
+        try:
+            self.get(name)
+        except ValueError:
+            return False
+        return True
+
+    def provider_available(self, name: str) -> bool:
+        """后端是否可用：已正确配置且熔断器放行请求（冷却期结束后视为可用）"""
+        return self.resilience[name].breaker.allows_request() and self.provider_configured(name)
+
+    @staticmethod
+    def preload_modules():
+        """预先导入所有服务模块及其重型依赖，即使对应服务因配置缺失无法构建"""
+        for module in SERVICE_MODULES:
+            try:
+                importlib.import_module(module, __package__)
+            except Exception as e:
+                logger.warning("预导入 %s 失败: %s", module, e)
+
+    def warm_up(self):
+        """启动时预先构建所有服务，配置缺失的服务留待首次使用时再报错"""
+        self.preload_modules()
+        for name in self._factories:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.warning("服务 %s 预构建失败: %s", name, e)
+
+    def reload(self):
+        """重新加载环境变量并重建服务，连接池保持不变"""
+        load_dotenv(override=True)
+        # 旧服务实例可能仍被进行中的请求使用，不主动关闭，交由垃圾回收
+        with self._lock:
+            self._services = {}
+            self._config_errors = {}
+            self.upload_limits = UploadLimits.from_env()
+            self.config_version += 1
+        logger.info("配置已重新加载，版本: %s", self.config_version)
+        self.warm_up()
+
+    async def aclose(self):
+        """释放注册表持有的资源"""
+        services, self._services = self._services, {}
+        if 'image' in services:
+            services['image'].close()
+        for cache in self.caches.values():
+            if cache is not None:
+                await cache.close()
+        await self.http_clients.aclose()
@@ -0,0 +1,316 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional, TypeVar
+from .metrics import UPSTREAM_CALLS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# 可重试的 HTTP 状态码（限流、超时及服务端错误）
+RETRYABLE_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# 连接类错误的类名（httpx.TransportError、openai.APIConnectionError），避免为判断而导入对应库
+CONNECTION_ERROR_TYPES = {'TransportError', 'APIConnectionError'}
+
+# 对冲延迟按 p95 计算时所需的最少样本数
+MIN_LATENCY_SAMPLES = 20
+
+
+class UpstreamError(Exception):
+    """上游返回了错误状态码"""
+
+    def __init__(self, upstream: str, status_code: int, detail: str = ""):
+        super().__init__(f"{upstream} 返回 HTTP {status_code}: {detail[:200]}")
+        self.upstream = upstream
+        self.status_code = status_code
+
+
+class CircuitOpenError(Exception):
+    """上游熔断中，直接失败而不发出请求"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} 暂时不可用（熔断中），请 {retry_after:.0f}s 后重试")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """请求总预算已耗尽"""
+
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar('request_deadline', default=None)
+
+
+@contextmanager
+def deadline_scope(budget: float):
+    """为当前上下文设置请求总预算（秒），嵌套时取更早的截止时间；budget <= 0 表示不限"""
+    if budget <= 0:
+        yield
+        return
+    deadline = time.monotonic() + budget
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """请求剩余预算（秒），未设置预算时为 None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def stage_timeout(default: Optional[float]) -> Optional[float]:
+    """单阶段超时：取阶段默认超时与请求剩余预算中较小者，预算耗尽时抛出 DeadlineExceeded"""
+    remaining = remaining_budget()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        raise DeadlineExceeded("请求处理超时")
+    return remaining if default is None else min(default, remaining)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """判断错误是否值得重试：超时、连接错误及可重试状态码"""
+    if isinstance(exc, (DeadlineExceeded, CircuitOpenError)):
+        return False
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status_code = getattr(exc, 'status_code', None)
+    if status_code is None:
+        status_code = getattr(getattr(exc, 'response', None), 'status_code', None)
+    if isinstance(status_code, int):
+        return status_code in RETRYABLE_STATUSES
+    return any(cls.__name__ in CONNECTION_ERROR_TYPES for cls in type(exc).__mro__)
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却期结束后放行一个试探请求（半开）"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allows_request(self) -> bool:
+        """当前是否会放行请求（冷却期已过视为放行），不改变熔断状态"""
+        if self.failure_threshold <= 0 or self.state != 'open':
+            return True
+        return time.monotonic() >= self.opened_at + self.reset_timeout
+
+    def before_call(self):
+        """发起请求前检查，熔断中抛出 CircuitOpenError"""
+        if self.failure_threshold <= 0:
+            return
+        if self.state == 'open':
+            wait = self.opened_at + self.reset_timeout - time.monotonic()
+            if wait > 0:
+                raise CircuitOpenError(self.name, wait)
+            self.state = 'half_open'
+            self._probe_in_flight = False
+        if self.state == 'half_open':
+            if self._probe_in_flight:
+                raise CircuitOpenError(self.name, self.reset_timeout)
+            self._probe_in_flight = True
+
+    def record_success(self):
+        if self.state != 'closed':
+            logger.info("上游 %s 已恢复，关闭熔断", self.name)
+        self.state = 'closed'
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.failure_threshold <= 0:
+            return
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                logger.warning("上游 %s 连续失败 %s 次，熔断 %.0fs", self.name, self.failures, self.reset_timeout)
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """请求被取消（如对冲落败）时释放试探名额，不计入成功或失败"""
+        self._probe_in_flight = False
+
+
+class LatencyTracker:
+    """记录最近的成功调用耗时，用于估算对冲延迟"""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientCaller:
+    """上游调用的统一弹性策略：阶段超时、带抖动的重试、熔断，以及可选的对冲请求"""
+
+    def __init__(
+        self,
+        name: str,
+        timeout: Optional[float] = 60.0,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge: bool = False,
+        hedge_delay: float = 0
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker(name)
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.latency = LatencyTracker()
+
+    def backoff(self, attempt: int) -> float:
+        """全抖动指数退避：在 [0, min(max_delay, base_delay * 2^attempt)] 中随机取值"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _current_hedge_delay(self) -> Optional[float]:
+        if not self.hedge:
+            return None
+        if self.hedge_delay > 0:
+            return self.hedge_delay
+        return self.latency.percentile(0.95)
+
+    async def _attempt(self, func: Callable[[], Awaitable[T]], timeout: Optional[float]) -> T:
+        """单次调用：经过熔断器检查，并记录耗时与结果"""
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            UPSTREAM_CALLS.inc(upstream=self.name, outcome='circuit_open')
+            raise
+        # 超时被请求剩余预算截短时，超时说明的是预算耗尽而不是上游故障
+        budget_bound = timeout is not None and (self.timeout is None or timeout < self.timeout)
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(), timeout) if timeout else await func()
+        except asyncio.CancelledError:
+            self.breaker.release()
+            UPSTREAM_CALLS.inc(upstream=self.name, outcome='cancelled')
+            raise
+        except asyncio.TimeoutError as e:
+            if not budget_bound and not isinstance(e, DeadlineExceeded):
+                self.breaker.record_failure()
+                UPSTREAM_CALLS.inc(upstream=self.name, outcome='timeout')
+                raise
+            # 不计入熔断失败，也不再重试
+            self.breaker.release()
+            UPSTREAM_CALLS.inc(upstream=self.name, outcome='deadline')
+            if isinstance(e, DeadlineExceeded):
+                raise
+            raise DeadlineExceeded("请求处理超时") from e
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.record_failure()
+            else:
+                # 上游正常应答（如参数错误），说明服务可用
+                self.breaker.record_success()
+            UPSTREAM_CALLS.inc(upstream=self.name, outcome='error')
+            raise
+        self.latency.observe(time.monotonic() - started)
+        self.breaker.record_success()
+        UPSTREAM_CALLS.inc(upstream=self.name, outcome='ok')
+        return result
+
+    async def _hedged_attempt(self, func: Callable[[], Awaitable[T]], timeout: Optional[float]) -> T:
+        """超过对冲延迟仍未返回时再发出一个请求，取先成功者并取消另一个"""
+        delay = self._current_hedge_delay()
+        if delay is None or (timeout is not None and delay >= timeout):
+            return await self._attempt(func, timeout)
+
+        tasks = {asyncio.ensure_future(self._attempt(func, timeout))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                logger.info("上游 %s 超过 %.2fs 未响应，发出对冲请求", self.name, delay)
+                tasks.add(asyncio.ensure_future(self._attempt(func, stage_timeout(self.timeout))))
+
+            error = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        """执行上游调用；func 每次被调用都应发起一次新的请求"""
+        attempt = 0
+        while True:
+            timeout = stage_timeout(self.timeout)
+            try:
+                return await self._hedged_attempt(func, timeout)
+            except Exception as e:
+                attempt += 1
+                if attempt >= self.max_attempts or not is_retryable(e):
+                    raise
+                delay = self.backoff(attempt)
+                remaining = remaining_budget()
+                if remaining is not None and delay >= remaining:
+                    raise
+                logger.warning(
+                    "上游 %s 第 %s 次调用失败（%s: %s），%.2fs 后重试",
+                    self.name, attempt, type(e).__name__, e, delay
+                )
+                await asyncio.sleep(delay)
+
+
+def create_resilient_caller(name: str, default_timeout: float = 60.0) -> ResilientCaller:
+    """根据 UPSTREAM_<NAME>_TIMEOUT / _RETRIES / _BREAKER_* / _HEDGE* 环境变量创建弹性调用策略"""
+    prefix = f"UPSTREAM_{name.upper()}_"
+    timeout = float(os.getenv(prefix + 'TIMEOUT', default_timeout))
+    max_attempts = int(os.getenv(prefix + 'RETRIES', 3))
+    breaker = CircuitBreaker(
+        name,
+        failure_threshold=int(os.getenv(prefix + 'BREAKER_THRESHOLD', 5)),
+        reset_timeout=float(os.getenv(prefix + 'BREAKER_RESET', 30))
+    )
+    hedge = os.getenv(prefix + 'HEDGE', 'false').lower() == 'true'
+    hedge_delay = float(os.getenv(prefix + 'HEDGE_DELAY', 0))
+    logger.info(
+        f"上游 {name} 弹性策略: timeout={timeout}s, attempts={max_attempts}, "
+        f"breaker={breaker.failure_threshold}/{breaker.reset_timeout}s, hedge={hedge}"
+    )
+    return ResilientCaller(
+        name,
+        timeout=timeout or None,
+        max_attempts=max_attempts,
+        breaker=breaker,
+        hedge=hedge,
+        hedge_delay=hedge_delay
+    )
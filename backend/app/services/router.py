@@ -0,0 +1,136 @@
+import os
+import math
+import time
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# 失败一次相当于多少秒的耗时惩罚，用于在耗时与错误率之间折算
+ERROR_PENALTY_SECONDS = 30.0
+
+
+class ProviderStats:
+    """单个后端的运行统计：EWMA 耗时、随时间衰减的错误率以及进行中的请求数"""
+
+    def __init__(self, name: str, max_in_flight: int = 0, alpha: float = 0.2, recovery_time: float = 60.0):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.alpha = alpha
+        self.recovery_time = recovery_time
+        self.latency: Optional[float] = None
+        self._error_rate = 0.0
+        self._updated_at = time.monotonic()
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def error_rate(self) -> float:
+        """错误率随时间衰减，长时间未被选中的后端会逐渐恢复"""
+        elapsed = time.monotonic() - self._updated_at
+        return self._error_rate * math.exp(-elapsed / self.recovery_time)
+
+    @property
+    def saturated(self) -> bool:
+        return self.max_in_flight > 0 and self.in_flight >= self.max_in_flight
+
+    @property
+    def score(self) -> float:
+        """越小越优：未知耗时按 0 计，以便新后端也能获得流量"""
+        return (self.latency or 0.0) + ERROR_PENALTY_SECONDS * self.error_rate
+
+    def observe(self, seconds: float, ok: bool):
+        self.requests += 1
+        if ok:
+            self.latency = seconds if self.latency is None else self.alpha * seconds + (1 - self.alpha) * self.latency
+        else:
+            self.failures += 1
+        self._error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self.error_rate
+        self._updated_at = time.monotonic()
+
+
+class ProviderRouter:
+    """在多个文本生成后端之间路由：按观测耗时与错误率排序，失败时切换到下一个，达到并发上限时分流"""
+
+    def __init__(
+        self,
+        max_in_flight: Dict[str, int],
+        is_available: Optional[Callable[[str], bool]] = None,
+        error_threshold: float = 0.5,
+        is_configured: Optional[Callable[[str], bool]] = None
+    ):
+        self.stats = {name: ProviderStats(name, limit) for name, limit in max_in_flight.items()}
+        self.is_available = is_available or (lambda name: True)
+        self.is_configured = is_configured or (lambda name: True)
+        self.error_threshold = error_threshold
+
+    def _healthy(self, name: str) -> bool:
+        stats = self.stats[name]
+        return stats.error_rate < self.error_threshold and not stats.saturated and self.is_available(name)
+
+    def order(self, candidates: List[str], preferred: Optional[str] = None) -> List[str]:
+        """候选后端的尝试顺序：健康的在前（指定的首选后端优先，其余按得分），不健康的按得分垫后；未配置的后端不参与"""
+        ranked = sorted(
+            (name for name in candidates if self.is_configured(name)),
+            key=lambda name: self.stats[name].score
+        )
+        healthy = [name for name in ranked if self._healthy(name)]
+        degraded = [name for name in ranked if name not in healthy]
+        if preferred in healthy:
+            healthy.remove(preferred)
+            healthy.insert(0, preferred)
+        return healthy + degraded
+
+    async def run(
+        self,
+        candidates: List[str],
+        call: Callable[[str], Awaitable[T]],
+        preferred: Optional[str] = None
+    ) -> Tuple[str, T]:
+        """依次尝试候选后端直到成功，返回 (后端名称, 结果)；结果为空视为失败"""
+        last_error: Optional[Exception] = None
+        provider, result = None, None
+        for provider in self.order(candidates, preferred):
+            stats = self.stats[provider]
+            stats.in_flight += 1
+            started = time.monotonic()
+            try:
+                result = await call(provider)
+            except Exception as e:
+                stats.observe(time.monotonic() - started, ok=False)
+                last_error = e
+                logger.warning("后端 %s 调用失败: %s", provider, e)
+                continue
+            finally:
+                stats.in_flight -= 1
+
+            stats.observe(time.monotonic() - started, ok=bool(result))
+            if result:
+                if preferred and provider != preferred:
+                    logger.info("已由 %s 切换到后端 %s", preferred, provider)
+                return provider, result
+            logger.warning("后端 %s 返回空结果", provider)
+
+        if last_error is not None:
+            raise last_error
+        return provider, result
+
+
+def create_provider_router(
+    providers: List[str],
+    is_available: Optional[Callable[[str], bool]] = None,
+    is_configured: Optional[Callable[[str], bool]] = None
+) -> ProviderRouter:
+    """根据 PROVIDER_<NAME>_MAX_IN_FLIGHT 与 PROVIDER_ERROR_THRESHOLD 环境变量创建路由"""
+    max_in_flight = {
+        name: int(os.getenv(f"PROVIDER_{name.upper()}_MAX_IN_FLIGHT", 0))
+        for name in providers
+    }
+    error_threshold = float(os.getenv('PROVIDER_ERROR_THRESHOLD', 0.5))
+    logger.info("文本后端路由: max_in_flight=%s, error_threshold=%s", max_in_flight, error_threshold)
+    return ProviderRouter(
+        max_in_flight, is_available=is_available, error_threshold=error_threshold, is_configured=is_configured
+    )
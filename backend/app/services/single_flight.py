@@ -0,0 +1,69 @@
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+COALESCED = metrics.counter('single_flight_coalesced_total', '与进行中的相同请求合并的调用数', ('kind',))
+
+
+class _Flight:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合并相同键的并发调用：同一时刻只执行一次上游调用，其余调用方等待并共享结果
+
+    共享任务与调用方隔离（shield），单个调用方断开不会取消共享任务；
+    所有调用方都离开后才取消，避免无人等待的上游调用继续占用配额
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def _finish(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]], kind: str = 'default') -> T:
+        """执行 func，若已有相同 key 的调用在进行中则等待其结果"""
+        if not self.enabled:
+            return await func()
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+        else:
+            COALESCED.inc(kind=kind)
+            logger.info("合并进行中的相同请求: %s", kind)
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # 先移出表，之后到达的相同请求重新发起调用，而不是等待即将取消的任务
+                self._finish(key, flight)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+
+def create_single_flight() -> SingleFlight:
+    """根据 SINGLE_FLIGHT 环境变量创建请求合并层（默认开启）"""
+    return SingleFlight(enabled=os.getenv('SINGLE_FLIGHT', 'true').lower() != 'false')
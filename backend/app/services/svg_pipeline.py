@@ -0,0 +1,290 @@
+import os
+import re
+import logging
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+
+logger = logging.getLogger(__name__)
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+
+# 诗意卡片插图的标准画布尺寸，与 POETRY_PROMPT 保持一致
+CARD_WIDTH, CARD_HEIGHT = 360, 500
+
+# 允许保留的元素，其余元素（script、foreignObject、image 等）连同子节点一起删除
+ALLOWED_ELEMENTS = {
+    'svg', 'g', 'defs', 'title', 'desc', 'symbol', 'use',
+    'path', 'rect', 'circle', 'ellipse', 'line', 'polyline', 'polygon', 'text', 'tspan',
+    'linearGradient', 'radialGradient', 'stop', 'clipPath', 'mask', 'pattern', 'style',
+    'filter', 'feGaussianBlur', 'feOffset', 'feBlend', 'feColorMatrix', 'feMerge', 'feMergeNode',
+    'feFlood', 'feComposite', 'feTurbulence', 'feDisplacementMap',
+}
+
+# 可继承的表现属性：与祖先元素取值相同时可省略
+INHERITED_ATTRS = {
+    'fill', 'fill-opacity', 'fill-rule', 'stroke', 'stroke-width', 'stroke-opacity',
+    'stroke-linecap', 'stroke-linejoin', 'stroke-dasharray', 'font-family', 'font-size',
+    'font-weight', 'text-anchor',
+}
+
+# 取默认值时可省略的属性
+DEFAULT_ATTRS = {'opacity': '1', 'fill-opacity': '1', 'stroke-opacity': '1', 'fill-rule': 'nonzero'}
+ZERO_DEFAULT_ELEMENTS = {'rect', 'text', 'use'}
+
+# 需要压缩数值精度的属性
+NUMERIC_ATTRS = {
+    'x', 'y', 'width', 'height', 'cx', 'cy', 'r', 'rx', 'ry', 'x1', 'y1', 'x2', 'y2',
+    'fx', 'fy', 'stroke-width', 'opacity', 'fill-opacity', 'stroke-opacity', 'offset',
+    'd', 'points', 'transform', 'stdDeviation', 'dx', 'dy',
+}
+
+# 不随输出保留的元数据属性
+DROPPED_ATTRS = {'version', 'baseProfile', 'xml:space', 'enable-background'}
+
+UNSAFE_STYLE = re.compile(r'javascript:|expression\s*\(|@import|url\(\s*[\'"]?(?!#)', re.IGNORECASE)
+NUMBER = re.compile(r'-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+SVG_BLOCK = re.compile(r'<svg\b(?:.*</svg>|[^>]*/>)', re.DOTALL | re.IGNORECASE)
+SVG_START = re.compile(r'<svg\b', re.IGNORECASE)
+# XML 预定义实体与数字字符引用之外的 &（如 "A & B"、&nbsp;）
+STRAY_AMPERSAND = re.compile(r'&(?!(?:amp|lt|gt|quot|apos|#\d+|#x[0-9a-fA-F]+);)')
+TAG = re.compile(r'<(/?)([A-Za-z][\w:.-]*)[^>]*?(/?)>')
+DOCTYPE = re.compile(r'<!DOCTYPE|<!ENTITY', re.IGNORECASE)
+
+# 根据位置属性估算内容范围，用于修正与绘制内容不符的声明尺寸
+X_EXTENTS = (('x', 'width'), ('cx', 'r'), ('cx', 'rx'), ('x1', None), ('x2', None))
+Y_EXTENTS = (('y', 'height'), ('cy', 'r'), ('cy', 'ry'), ('y1', None), ('y2', None))
+
+
+def _local_name(name: str) -> str:
+    return name.rsplit('}', 1)[-1]
+
+
+def _attr_name(name: str) -> str:
+    """去掉命名空间；xlink:href 统一为 SVG 2 的 href"""
+    if name.startswith('{'):
+        namespace, local = name[1:].split('}', 1)
+        if namespace == 'http://www.w3.org/XML/1998/namespace':
+            return 'xml:' + local
+        return local
+    return name
+
+
+def _format_number(value: float, precision: int) -> str:
+    text = f"{round(value, precision):.{precision}f}".rstrip('0').rstrip('.') if precision > 0 else str(int(round(value)))
+    return '0' if text in ('-0', '') else text
+
+
+def round_numbers(value: str, precision: int) -> str:
+    """压缩字符串中小数的精度（整数原样保留，避免破坏路径中紧凑书写的弧线标志），并保证相邻数值之间仍有分隔"""
+    result = ''
+    position = 0
+    for match in NUMBER.finditer(value):
+        number = match.group()
+        if '.' in number or 'e' in number.lower():
+            number = _format_number(float(number), precision)
+        result += value[position:match.start()]
+        if result and (result[-1].isdigit() or result[-1] == '.') and not number.startswith('-'):
+            result += ' '
+        result += number
+        position = match.end()
+    return result + value[position:]
+
+
+def _parse_length(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    match = re.fullmatch(r'\s*([\d.]+)\s*(px)?\s*', value)
+    return float(match.group(1)) if match else None
+
+
+def _is_safe(name: str, value: str) -> bool:
+    if name.lower().startswith('on'):
+        return False
+    if name == 'href':
+        return value.strip().startswith('#')
+    if name == 'style' or 'url(' in value:
+        return not UNSAFE_STYLE.search(value)
+    return True
+
+
+def _sanitize(element: ET.Element):
+    """删除不允许的元素与危险属性（事件处理、外部链接、脚本化样式）"""
+    for child in list(element):
+        if not isinstance(child.tag, str) or _local_name(child.tag) not in ALLOWED_ELEMENTS:
+            element.remove(child)
+            continue
+        if _local_name(child.tag) == 'style' and UNSAFE_STYLE.search(child.text or ''):
+            element.remove(child)
+            continue
+        _sanitize(child)
+    for name in list(element.attrib):
+        value = element.attrib.pop(name)
+        local = _attr_name(name)
+        if local not in DROPPED_ATTRS and _is_safe(local, value):
+            element.attrib[local] = value
+
+
+def _minify(element: ET.Element, inherited: Dict[str, str], precision: int):
+    """压缩数值精度，删除默认值及与祖先重复的可继承属性"""
+    tag = _local_name(element.tag)
+    for name in list(element.attrib):
+        value = element.attrib[name].strip()
+        if name in NUMERIC_ATTRS:
+            value = round_numbers(value, precision)
+        if (
+            DEFAULT_ATTRS.get(name) == value
+            or (name in ('x', 'y') and tag in ZERO_DEFAULT_ELEMENTS and value == '0')
+            or (name in INHERITED_ATTRS and inherited.get(name) == value)
+        ):
+            del element.attrib[name]
+        else:
+            element.attrib[name] = value
+
+    # defs、渐变等定义内的元素会在引用处渲染，不按当前位置的继承关系去重
+    if tag in ('defs', 'clipPath', 'mask', 'pattern', 'symbol', 'linearGradient', 'radialGradient', 'filter'):
+        inherited = {}
+    else:
+        inherited = dict(inherited, **{name: element.attrib[name] for name in INHERITED_ATTRS if name in element.attrib})
+    for child in element:
+        _minify(child, inherited, precision)
+
+
+def _axis_extent(element: ET.Element, pairs) -> float:
+    extent = 0.0
+    for position, size in pairs:
+        start = _parse_length(element.get(position))
+        if start is not None:
+            extent = max(extent, start + ((_parse_length(element.get(size)) or 0) if size else 0))
+    return extent
+
+
+def _content_extent(root: ET.Element) -> Tuple[float, float]:
+    """粗略估算内容的最大横纵坐标"""
+    max_x = max((_axis_extent(element, X_EXTENTS) for element in root.iter()), default=0.0)
+    max_y = max((_axis_extent(element, Y_EXTENTS) for element in root.iter()), default=0.0)
+    return max_x, max_y
+
+
+def _normalize_viewbox(root: ET.Element, precision: int):
+    """保证存在有效 viewBox，并去掉固定宽高，由容器控制显示尺寸
+
+    模型常按提示词中的 360x500 作画、却声明 96x120 之类的尺寸；
+    没有 viewBox 时若内容明显超出声明尺寸，改用内容范围或标准画布作为 viewBox
+    """
+    try:
+        box = [float(part) for part in re.split(r'[\s,]+', root.get('viewBox', '').strip()) if part]
+    except ValueError:
+        box = []
+    if len(box) != 4 or box[2] <= 0 or box[3] <= 0:
+        width, height = _parse_length(root.get('width')), _parse_length(root.get('height'))
+        extent_x, extent_y = _content_extent(root)
+        if width and height and extent_x <= width * 1.1 and extent_y <= height * 1.1:
+            box = [0, 0, width, height]
+        elif extent_x <= CARD_WIDTH * 1.1 and extent_y <= CARD_HEIGHT * 1.1:
+            box = [0, 0, CARD_WIDTH, CARD_HEIGHT]
+        else:
+            box = [0, 0, extent_x, extent_y]
+    root.attrib.pop('width', None)
+    root.attrib.pop('height', None)
+    root.set('viewBox', ' '.join(_format_number(value, precision) for value in box))
+
+
+def _serialize(element: ET.Element) -> str:
+    tag = _local_name(element.tag)
+    attrs = ''.join(f' {name}={quoteattr(value)}' for name, value in element.attrib.items())
+    text = (element.text or '').strip()
+    children = ''.join(_serialize(child) + escape((child.tail or '').strip()) for child in element)
+    if not text and not children:
+        return f'<{tag}{attrs}/>'
+    return f'<{tag}{attrs}>{escape(text)}{children}</{tag}>'
+
+
+def repair_svg(svg: str) -> str:
+    """修复常见的模型输出错误：转义多余的 &，补全被 max_tokens 截断的元素"""
+    svg = STRAY_AMPERSAND.sub('&amp;', svg.replace('&nbsp;', '&#160;'))
+    if '</svg>' in svg.lower():
+        return svg
+    # 截断处可能停在标签或属性中间，只保留到最后一个完整标签
+    svg = svg[:svg.rfind('>') + 1]
+    stack = []
+    for match in TAG.finditer(svg):
+        closing, name, self_closing = match.groups()
+        if self_closing:
+            continue
+        if not closing:
+            stack.append(name)
+        elif name in stack:
+            del stack[len(stack) - 1 - stack[::-1].index(name):]
+    return svg + ''.join(f'</{name}>' for name in reversed(stack))
+
+
+def _parse(svg: str) -> Optional[ET.Element]:
+    """解析 SVG，失败时尝试修复后再解析一次，仍失败返回 None"""
+    try:
+        return ET.fromstring(svg)
+    except ET.ParseError as e:
+        error = e
+    try:
+        root = ET.fromstring(repair_svg(svg))
+    except ET.ParseError:
+        logger.warning("SVG 解析失败，已丢弃插图（长度 %d）: %s", len(svg), error)
+        return None
+    logger.info("SVG 解析失败（%s），已修复", error)
+    return root
+
+
+@lru_cache(maxsize=256)
+def clean_svg(svg: str, precision: int = 1) -> str:
+    """校验、清理并压缩模型输出的 SVG，修复后仍无法使用时返回空字符串"""
+    svg = svg or ''
+    if DOCTYPE.search(svg):
+        logger.warning("SVG 含有 DOCTYPE 或实体声明，已丢弃插图")
+        return ''
+    match = SVG_BLOCK.search(svg)
+    if match:
+        svg = match.group()
+    else:
+        # 没有结束标签：输出被截断，从 <svg 起尝试修复
+        start = SVG_START.search(svg)
+        if not start:
+            return ''
+        svg = svg[start.start():]
+    root = _parse(svg)
+    if root is None:
+        return ''
+    if _local_name(root.tag) != 'svg':
+        logger.warning("SVG 根元素为 %s，已丢弃插图", _local_name(root.tag))
+        return ''
+
+    _sanitize(root)
+    _minify(root, {}, precision)
+    _normalize_viewbox(root, precision)
+    root.attrib.pop('xmlns', None)
+    root.attrib = dict({'xmlns': SVG_NS}, **root.attrib)
+    return _serialize(root)
+
+
+def svg_precision() -> int:
+    """SVG 数值保留的小数位数"""
+    return int(os.getenv('SVG_PRECISION', 1))
+
+
+@lru_cache(maxsize=1)
+def _load_cairosvg():
+    """可选依赖 cairosvg（需要系统 cairo 库），不可用时只提示一次"""
+    try:
+        import cairosvg
+        return cairosvg
+    except (ImportError, OSError) as e:
+        logger.warning("cairosvg 不可用，服务端不渲染诗意卡片: %s", e)
+        return None
+
+
+def rasterize_svg(svg: str, width: int) -> Optional[bytes]:
+    """将 SVG 按指定宽度（等比）渲染为 PNG 字节；cairosvg 不可用时返回 None"""
+    cairosvg = _load_cairosvg()
+    if cairosvg is None:
+        return None
+    return cairosvg.svg2png(bytestring=svg.encode('utf-8'), output_width=width)
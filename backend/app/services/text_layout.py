@@ -0,0 +1,136 @@
+import unicodedata
+from typing import List, Tuple
+from .fonts import FontRegistry
+
+# 禁则：不能出现在行首的标点
+NO_LINE_START = set("，。、；：？！）》」』】〕〉”’…—～·,.;:?!)]}%")
+# 禁则：不能出现在行尾的标点
+NO_LINE_END = set("（《「『【〔〈“‘([{")
+
+
+def _is_wide(char: str) -> bool:
+    """CJK 等宽字符，任意两个之间都可以断行"""
+    return unicodedata.east_asian_width(char) in ('W', 'F')
+
+
+def _tokenize(paragraph: str) -> List[str]:
+    """切分为断行单元：CJK 字符单独成词，连续的拉丁字符/数字成词，空白单独成词"""
+    tokens = []
+    word = ""
+    for char in paragraph:
+        if char.isspace() or _is_wide(char) or char in NO_LINE_START or char in NO_LINE_END:
+            if word:
+                tokens.append(word)
+                word = ""
+            tokens.append(char)
+        else:
+            word += char
+    if word:
+        tokens.append(word)
+    return tokens
+
+
+class TextLayout:
+    """排版结果：各行文本与宽度，以及整块文本的精确高度"""
+
+    def __init__(self, font, font_size: int, lines: List[Tuple[str, float]], line_height: int, spacing: int):
+        self.font = font
+        self.font_size = font_size
+        self.lines = lines
+        self.line_height = line_height
+        self.spacing = spacing
+
+    @property
+    def height(self) -> int:
+        if not self.lines:
+            return 0
+        return len(self.lines) * self.line_height + (len(self.lines) - 1) * self.spacing
+
+
+class TextLayoutEngine:
+    """基于缓存字宽的断行引擎，支持中英混排与中文禁则"""
+
+    def __init__(self, fonts: FontRegistry):
+        self.fonts = fonts
+
+    def _break_paragraph(self, font, paragraph: str, max_width: float) -> List[Tuple[str, float]]:
+        width_of = lambda text: self.fonts.text_width(font, text)
+        lines: List[Tuple[str, float]] = []
+        line, line_width = "", 0.0
+
+        for token in _tokenize(paragraph):
+            token_width = width_of(token)
+
+            # 行首禁则字符直接挂在当前行末尾，允许轻微超出
+            if line and (line_width + token_width <= max_width or token in NO_LINE_START):
+                line += token
+                line_width += token_width
+                continue
+
+            if token.isspace():
+                # 行尾空白直接丢弃
+                if line:
+                    lines.append((line.rstrip(), width_of(line.rstrip())))
+                    line, line_width = "", 0.0
+                continue
+
+            if token_width > max_width:
+                # 超长单词按字符拆分
+                for char in token:
+                    char_width = width_of(char)
+                    if line and line_width + char_width > max_width:
+                        lines.append((line, line_width))
+                        line, line_width = "", 0.0
+                    line += char
+                    line_width += char_width
+                continue
+
+            if line:
+                # 行尾禁则字符移到下一行
+                carry = ""
+                while line and line[-1] in NO_LINE_END:
+                    carry = line[-1] + carry
+                    line = line[:-1]
+                if line:
+                    lines.append((line.rstrip(), width_of(line.rstrip())))
+                line, line_width = carry, width_of(carry)
+            line += token
+            line_width += token_width
+
+        if line:
+            lines.append((line.rstrip(), width_of(line.rstrip())))
+        return lines
+
+    def layout(self, text: str, font_size: int, max_width: float, spacing: int = 10) -> TextLayout:
+        """按指定字号排版"""
+        font = self.fonts.get_font(font_size)
+        ascent, descent = font.getmetrics()
+        lines: List[Tuple[str, float]] = []
+        for paragraph in text.strip().splitlines():
+            lines.extend(self._break_paragraph(font, paragraph.strip(), max_width))
+        return TextLayout(font, font_size, lines, ascent + descent, spacing)
+
+    def fit(
+        self,
+        text: str,
+        max_width: float,
+        max_height: float,
+        max_size: int,
+        min_size: int = 16,
+        spacing: int = 10
+    ) -> TextLayout:
+        """自适应字号：在 [min_size, max_size] 中选取高度不超过 max_height 的最大字号"""
+        layout = self.layout(text, max_size, max_width, spacing)
+        if layout.height <= max_height or max_size <= min_size:
+            return layout
+
+        best = self.layout(text, min_size, max_width, spacing)
+        low, high = min_size + 1, max_size - 1
+        while low <= high:
+            size = (low + high) // 2
+            candidate = self.layout(text, size, max_width, spacing)
+            if candidate.height <= max_height:
+                best, low = candidate, size + 1
+            else:
+                high = size - 1
+        return best
@@ -0,0 +1,221 @@
+import os
+import asyncio
+import logging
+import tempfile
+import warnings
+from io import BytesIO
+from typing import IO, Callable, Optional, Tuple
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# 允许上传的图片格式（以文件头识别，而不是信任 Content-Type）
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF', 'BMP', 'MPO'}
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class UploadRejected(Exception):
+    """上传内容被拒绝，带有对应的 HTTP 状态码"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class UploadLimits:
+    """上传限制：字节上限、像素上限，以及上传前的可选缩放"""
+
+    def __init__(
+        self,
+        max_bytes: int = 20 * 1024 * 1024,
+        max_pixels: int = 50_000_000,
+        max_dimension: int = 0,
+        reencode_quality: int = 90
+    ):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.max_dimension = max_dimension
+        self.reencode_quality = reencode_quality
+
+    @classmethod
+    def from_env(cls) -> 'UploadLimits':
+        return cls(
+            max_bytes=int(os.getenv('UPLOAD_MAX_BYTES', 20 * 1024 * 1024)),
+            max_pixels=int(os.getenv('UPLOAD_MAX_PIXELS', 50_000_000)),
+            max_dimension=int(os.getenv('UPLOAD_MAX_DIMENSION', 0)),
+            reencode_quality=int(os.getenv('UPLOAD_REENCODE_QUALITY', 90))
+        )
+
+
+async def read_limited(file, max_bytes: int) -> bytes:
+    """分块读取上传文件，超过上限立即中止"""
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise UploadRejected(413, f"文件过大，最大支持 {max_bytes // (1024 * 1024)}MB")
+    if not buffer:
+        raise UploadRejected(400, "上传文件为空")
+    return bytes(buffer)
+
+
+def sniff_image(data: bytes, max_pixels: int) -> Tuple[str, int, int]:
+    """只解析文件头识别图片格式与尺寸（不解码像素），拒绝非图片和解压炸弹"""
+    from PIL import Image
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(BytesIO(data)) as image:
+                image_format, (width, height) = image.format, image.size
+    except Image.DecompressionBombError:
+        raise UploadRejected(413, "图片像素过多")
+    except Exception:
+        raise UploadRejected(400, "只支持图片文件")
+
+    if image_format not in ALLOWED_FORMATS:
+        raise UploadRejected(400, f"不支持的图片格式: {image_format}")
+    if width * height > max_pixels:
+        raise UploadRejected(413, f"图片像素过多: {width}x{height}")
+    return image_format, width, height
+
+
+def downscale_image(data: bytes, image_format: str, max_dimension: int, quality: int) -> bytes:
+    """将超过最大边长的图片缩小并重新编码为 JPEG（同步，在线程池中运行）"""
+    from PIL import Image, ImageOps
+
+    image = Image.open(BytesIO(data))
+    if image_format == 'JPEG':
+        image.draft('RGB', (max_dimension, max_dimension))
+    # 重新编码会丢失 EXIF，先按方向信息旋转
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffered = BytesIO()
+    image.save(buffered, format='JPEG', quality=quality)
+    return buffered.getvalue()
+
+
+def _spool(source: IO[bytes], max_bytes: int) -> Tuple[IO[bytes], int]:
+    spooled = tempfile.TemporaryFile()
+    size = 0
+    try:
+        source.seek(0)
+        while True:
+            chunk = source.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadRejected(413, f"文件过大，最大支持 {max_bytes // (1024 * 1024)}MB")
+            spooled.write(chunk)
+        if not size:
+            raise UploadRejected(400, "上传文件为空")
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled, size
+
+
+async def spool_upload(file, max_bytes: int) -> Tuple[IO[bytes], int]:
+    """在线程中将上传文件复制到独立的临时文件（不常驻内存），返回 (临时文件, 字节数)
+
+    上传文件在请求结束后会被关闭，需要在响应之后继续使用（如批量流式处理）时先复制出来
+    """
+    return await asyncio.to_thread(_spool, file.file, max_bytes)
+
+
+async def read_spooled(spooled: IO[bytes]) -> bytes:
+    """读出临时文件的全部内容"""
+    def read() -> bytes:
+        spooled.seek(0)
+        return spooled.read()
+    return await asyncio.to_thread(read)
+
+
+async def ingest_upload(file, limits: UploadLimits, run_in_executor, downscale: bool = True) -> bytes:
+    """读取并校验上传图片；配置了最大边长时在上传 ImgBB 前先缩小"""
+    data = await read_limited(file, limits.max_bytes)
+    return await ingest_image(data, limits, run_in_executor, downscale)
+
+
+async def ingest_image(data: bytes, limits: UploadLimits, run_in_executor, downscale: bool = True) -> bytes:
+    """校验已读入的图片；配置了最大边长时在上传 ImgBB 前先缩小"""
+    image_format, width, height = sniff_image(data, limits.max_pixels)
+
+    if downscale and limits.max_dimension and max(width, height) > limits.max_dimension:
+        original_size = len(data)
+        data = await run_in_executor(
+            downscale_image, data, image_format, limits.max_dimension, limits.reencode_quality
+        )
+        logger.info("上传图片已缩小: %sx%s, %s -> %s 字节", width, height, original_size, len(data))
+    return data
+
+
+class BodyTooLarge(Exception):
+    """请求体超过上限，用于中止仍在读取请求体的应用"""
+
+
+class UploadSizeMiddleware:
+    """ASGI 请求体大小限制：Content-Length 超限时直接拒绝，否则边接收边计数，超限立即返回 413
+
+    分块传输（无 Content-Length）的请求同样受限；注册在 CORS 之内，拒绝响应带跨域头
+    """
+
+    def __init__(self, app, limit_for: Callable[[dict], Optional[int]]):
+        self.app = app
+        self.limit_for = limit_for
+
+    @staticmethod
+    async def _reject(scope, receive, send):
+        response = JSONResponse(status_code=413, content={"detail": "文件过大"})
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limit_for(scope) if scope['type'] == 'http' and scope.get('method') == 'POST' else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope.get('headers') or []).get(b'content-length', b'')
+        if content_length.isdigit() and int(content_length) > limit:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    if not started and not rejected:
+                        rejected = True
+                        await self._reject(scope, receive, send)
+                    raise BodyTooLarge()
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            # 已返回 413 后丢弃应用自身的错误响应
+            if rejected:
+                return
+            if message['type'] == 'http.response.start':
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except BodyTooLarge:
+            if not rejected:
+                raise
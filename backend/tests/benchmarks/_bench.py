@@ -0,0 +1,38 @@
+"""基准脚本的公共部分：导入路径与耗时统计"""
+import os
+import sys
+import statistics
+from typing import Dict, List
+
+TESTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.dirname(TESTS_DIR)
+for path in (BACKEND_DIR, TESTS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """以毫秒为单位的 p50 / p95 / 最大值 / 平均值"""
+    return {
+        'p50_ms': percentile(samples, 0.5) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'max_ms': max(samples) * 1000,
+        'mean_ms': statistics.mean(samples) * 1000,
+    }
+
+
+def print_table(title: str, rows: Dict[str, Dict[str, float]]):
+    """按行打印 before / after 的各项指标"""
+    columns = list(next(iter(rows.values())))
+    print(title)
+    print(f"{'':<12}" + ''.join(f"{column:>13}" for column in columns))
+    for name, values in rows.items():
+        print(f"{name:<12}" + ''.join(
+            f"{values[column]:>13.2f}" if isinstance(values[column], float) else f"{values[column]:>13}"
+            for column in columns
+        ))
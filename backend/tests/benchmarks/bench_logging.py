@@ -0,0 +1,109 @@
+"""热路径日志开销基准：改造前与改造后一次 Coze 诗意请求的日志调用对比
+
+before 复现改造前的日志调用（INFO 级别输出请求头、载荷、完整响应，f-string 与 json.dumps 立即求值，
+basicConfig 输出）；after 为现在的调用（%s 延迟格式化、LazyJson、DEBUG 级别的大字段，
+setup_logging 的脱敏过滤器）。日志写入计数流，不受终端速度影响。
+在 backend 目录下运行：python tests/benchmarks/bench_logging.py [--requests 20000]
+"""
+import os
+import json
+import time
+import logging
+import argparse
+
+import _bench  # noqa: F401  设置导入路径
+from _bench import print_table
+
+from app.config.log_config import LazyJson, setup_logging
+
+API_URL = 'https://api.coze.cn/v1/workflow/run'
+API_KEY = 'pat_' + 'x' * 60
+WORKFLOW_ID = '7440000000000000000'
+TEXT = '春天的风吹过山岗，吹过河流，也吹过我的窗台。' * 4
+RESPONSE_TEXT = json.dumps({
+    'code': 0, 'msg': '',
+    'data': json.dumps({'output': '好一个春天' * 20, 'output1': '<svg>' + '<path d="M0 0L10 10"/>' * 40 + '</svg>'}),
+}, ensure_ascii=False)
+RESPONSE_HEADERS = {'content-type': 'application/json', 'x-tt-logid': '2024' * 8, 'server': 'coze'}
+
+logger = logging.getLogger('bench.coze_service')
+
+
+class CountingStream:
+    """丢弃写入内容，只统计字节数"""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, text: str):
+        self.bytes += len(text.encode('utf-8'))
+
+    def flush(self):
+        pass
+
+
+def before_request():
+    headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
+    payload = {"workflow_id": WORKFLOW_ID, "parameters": {"BOT_USER_INPUT": TEXT}}
+    logger.info(f"发送请求到 Coze API:")
+    logger.info(f"URL: {API_URL}")
+    logger.info(f"Workflow ID: {WORKFLOW_ID}")
+    logger.info(f"Input text: {TEXT}")
+    logger.info(f"Headers: {headers}")
+    logger.info(f"Payload: {json.dumps(payload, ensure_ascii=False)}")
+    logger.info(f"Coze API 响应状态码: {200}")
+    logger.info(f"Coze API 响应头: {dict(RESPONSE_HEADERS)}")
+    logger.info(f"Coze API 响应内容: {RESPONSE_TEXT}")
+    data = json.loads(json.loads(RESPONSE_TEXT)['data'])
+    logger.debug(f"解析后的数据: {data}")
+
+
+def after_request():
+    payload = {"workflow_id": WORKFLOW_ID, "parameters": {"BOT_USER_INPUT": TEXT}}
+    logger.info("发送请求到 Coze API: workflow_id=%s, 文本长度=%d", WORKFLOW_ID, len(TEXT))
+    logger.debug("Coze API请求: url=%s, payload=%s", API_URL, LazyJson(payload))
+    logger.info("Coze API 响应状态码: %s", 200)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Coze API 响应内容: %s", RESPONSE_TEXT)
+    data = json.loads(json.loads(RESPONSE_TEXT)['data'])
+    logger.debug("解析后的数据: %s", data)
+
+
+def _configure(kind: str, level: str) -> CountingStream:
+    stream = CountingStream()
+    if kind == 'before':
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root = logging.getLogger()
+        root.handlers = [handler]
+        root.setLevel(level)
+    else:
+        os.environ['LOG_LEVEL'] = level
+        os.environ['COZE_API_KEY'] = API_KEY
+        setup_logging()
+        logging.getLogger().handlers[0].setStream(stream)
+    return stream
+
+
+def _measure(kind: str, level: str, requests: int) -> dict:
+    stream = _configure(kind, level)
+    request = before_request if kind == 'before' else after_request
+    started = time.perf_counter()
+    for _ in range(requests):
+        request()
+    elapsed = time.perf_counter() - started
+    return {'us/req': elapsed / requests * 1e6, 'bytes/req': stream.bytes // requests}
+
+
+def main(requests: int):
+    for level in ('INFO', 'WARNING'):
+        rows = {kind: _measure(kind, level, requests) for kind in ('before', 'after')}
+        print_table(f"LOG_LEVEL={level}，{requests} 次请求", rows)
+        print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+    main(args.requests)
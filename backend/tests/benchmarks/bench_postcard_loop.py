@@ -0,0 +1,80 @@
+"""明信片渲染的事件循环延迟基准：在事件循环上同步渲染（改造前）与线程池渲染（改造后）对比
+
+同时发起 N 个明信片渲染，另一个协程每 10ms 醒来一次并记录实际的唤醒延迟；
+事件循环被阻塞时唤醒延迟随之变大，其他请求同样会被卡住。
+在 backend 目录下运行：python tests/benchmarks/bench_postcard_loop.py [--concurrency 8] [--size 2000x1500]
+"""
+import time
+import asyncio
+import argparse
+from io import BytesIO
+
+import _bench  # noqa: F401  设置导入路径
+from _bench import print_table, summarize
+
+from PIL import Image
+from app.services.image_service import ImageService, PostcardEncoding
+
+TICK = 0.01
+CAPTION = "清晨的阳光穿过薄雾，落在安静的湖面上，The morning light settles on the quiet lake. " * 2
+
+
+def _sample_image(width: int, height: int) -> bytes:
+    image = Image.linear_gradient('L').convert('RGB').resize((width, height))
+    buffered = BytesIO()
+    image.save(buffered, format='JPEG', quality=90)
+    return buffered.getvalue()
+
+
+async def _measure(render, concurrency: int) -> dict:
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append(time.perf_counter() - started - TICK)
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(TICK * 2)
+    started = time.perf_counter()
+    await asyncio.gather(*(render() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticker_task
+    stats = summarize(lags)
+    return {'lag_p50_ms': stats['p50_ms'], 'lag_p95_ms': stats['p95_ms'],
+            'lag_max_ms': stats['max_ms'], 'wall_ms': elapsed * 1000}
+
+
+async def main(concurrency: int, width: int, height: int):
+    image_data = _sample_image(width, height)
+    service = ImageService()
+    encoding = PostcardEncoding()
+
+    async def on_loop():
+        # 改造前：解码、排版、绘制与编码都在事件循环线程上执行
+        image = service._decode_image(image_data)
+        return service._render_postcard(image, CAPTION, encoding)
+
+    async def in_executor():
+        return await service.render_postcard(CAPTION, image_data=image_data, encoding=encoding)
+
+    try:
+        rows = {
+            'before': await _measure(on_loop, concurrency),
+            'after': await _measure(in_executor, concurrency),
+        }
+    finally:
+        service.close()
+    print_table(f"{concurrency} 个并发明信片，原图 {width}x{height}，线程池 {service.executor._max_workers} 线程", rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--size', default='2000x1500')
+    args = parser.parse_args()
+    width, height = (int(value) for value in args.size.lower().split('x'))
+    asyncio.run(main(args.concurrency, width, height))
@@ -0,0 +1,91 @@
+"""明信片文案排版微基准：textwrap 估算断行（改造前）与缓存字宽的断行引擎（改造后）对比
+
+对随机生成的中英混排文案语料逐条排版，统计每张明信片的排版耗时，以及超出可用宽度的行数（overflow）。
+在 backend 目录下运行：python tests/benchmarks/bench_text_layout.py [--captions 500] [--width 1080]
+"""
+import time
+import random
+import argparse
+import textwrap
+
+import _bench  # noqa: F401  设置导入路径
+from _bench import print_table, summarize
+
+from PIL import Image, ImageDraw
+from app.services.fonts import get_font_registry
+from app.services.text_layout import NO_LINE_START, TextLayoutEngine
+
+FONT_SIZE = 30
+MIN_FONT_SIZE = 16
+MARGIN = 40
+CJK = "春风十里不如你山川湖海日落黄昏清晨的阳光穿过薄雾落在安静湖面上城市灯火温柔"
+LATIN = ["coffee", "sunset", "weekend", "Monday", "vibes", "OK", "2024", "city", "walk", "lol"]
+PUNCTUATION = "，。！？、：；“”（）"
+
+
+def generate_captions(count: int, seed: int = 42) -> list:
+    """生成长度 20~200 字、中英混排并带标点的文案"""
+    rng = random.Random(seed)
+    captions = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(20, 200)):
+            roll = rng.random()
+            if roll < 0.75:
+                parts.append(rng.choice(CJK))
+            elif roll < 0.88:
+                parts.append(f" {rng.choice(LATIN)} ")
+            else:
+                parts.append(rng.choice(PUNCTUATION))
+        captions.append(''.join(parts).strip())
+    return captions
+
+
+def textwrap_layout(draw, font, text: str, max_width: float):
+    """改造前 create_postcard 的写法：按「测」的宽度估算每行字数，textwrap 断行后整体测量"""
+    avg_char_width = font.getlength("测")
+    wrapped = textwrap.fill(text, width=int(max_width / avg_char_width))
+    bbox = draw.textbbox((0, 0), wrapped, font=font)
+    return wrapped.split('\n'), bbox[3] - bbox[1]
+
+
+def _overflowing(font, lines, max_width: float) -> int:
+    """超出可用宽度的行数；按禁则悬挂在行尾的标点不计"""
+    return sum(1 for line in lines if font.getlength(line.rstrip(''.join(NO_LINE_START))) > max_width + 1)
+
+
+def main(count: int, width: int):
+    captions = generate_captions(count)
+    fonts = get_font_registry()
+    font = fonts.get_font(FONT_SIZE)
+    engine = TextLayoutEngine(fonts)
+    draw = ImageDraw.Draw(Image.new('RGB', (width, 10)))
+    max_width = width - MARGIN * 2
+    max_height = width // 2 - 40
+
+    before, before_overflow = [], 0
+    for caption in captions:
+        started = time.perf_counter()
+        lines, _ = textwrap_layout(draw, font, caption, max_width)
+        before.append(time.perf_counter() - started)
+        before_overflow += _overflowing(font, lines, max_width)
+
+    rows = {'before': dict(summarize(before), overflow=before_overflow)}
+    for name in ('after_cold', 'after'):
+        samples, overflow = [], 0
+        for caption in captions:
+            started = time.perf_counter()
+            layout = engine.fit(caption, max_width, max_height, FONT_SIZE, MIN_FONT_SIZE)
+            samples.append(time.perf_counter() - started)
+            overflow += _overflowing(layout.font, [line for line, _ in layout.lines], max_width)
+        rows[name] = dict(summarize(samples), overflow=overflow)
+
+    print_table(f"{count} 条文案，画布宽 {width}px，字体 {fonts.font_path or 'Pillow 默认字体'}", rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--captions', type=int, default=500)
+    parser.add_argument('--width', type=int, default=1080)
+    args = parser.parse_args()
+    main(args.captions, args.width)
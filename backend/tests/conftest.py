@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 以 backend 为根导入 app 包，无论从哪个目录运行 pytest
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
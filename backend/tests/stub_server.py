@@ -0,0 +1,91 @@
+"""本地桩 HTTP 服务：在测试与基准脚本中代替 ImgBB、DeepSeek 等上游
+
+只实现 HTTP/1.1 keep-alive 与 Content-Length 请求体，足以服务 httpx 与 openai SDK。
+"""
+import json
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
+
+Body = Union[bytes, dict, list, str]
+Handler = Callable[[str, str, bytes], Awaitable[Tuple[int, Body]]]
+
+
+async def ok_handler(method: str, path: str, body: bytes) -> Tuple[int, Body]:
+    return 200, {'ok': True}
+
+
+def chat_completion(content: str) -> dict:
+    """OpenAI 兼容的对话补全响应"""
+    return {
+        'id': 'stub', 'object': 'chat.completion', 'created': 0, 'model': 'stub',
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+        'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+    }
+
+
+class StubServer:
+    """监听 127.0.0.1 随机端口的桩服务，记录请求与连接数
+
+    handshake_delay 在每个新连接的首个请求前等待，用于模拟公网上 TCP + TLS 握手的往返耗时
+    """
+
+    def __init__(self, handler: Handler = ok_handler, handshake_delay: float = 0.0, latency: float = 0.0):
+        self.handler = handler
+        self.handshake_delay = handshake_delay
+        self.latency = latency
+        self.requests: List[Tuple[str, str, bytes]] = []
+        self.connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def __aenter__(self) -> 'StubServer':
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        first = True
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                self.requests.append((method, path, body))
+
+                if first and self.handshake_delay:
+                    await asyncio.sleep(self.handshake_delay)
+                first = False
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                status, payload = await self.handler(method, path, body)
+                if isinstance(payload, (dict, list)):
+                    payload = json.dumps(payload, ensure_ascii=False)
+                if isinstance(payload, str):
+                    payload = payload.encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode('latin-1') + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
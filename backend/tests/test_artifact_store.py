@@ -0,0 +1,46 @@
+"""临时产物存储：在线程池中写入，按间隔清理过期产物"""
+import os
+import time
+import asyncio
+
+from app.services.artifact_store import ArtifactStore
+
+
+def _expire(store: ArtifactStore, artifact_id: str):
+    path = os.path.join(store.directory, artifact_id)
+    old = time.time() - store.ttl - 1
+    os.utime(path, (old, old))
+
+
+def test_save_and_get(tmp_path):
+    store = ArtifactStore(str(tmp_path), ttl=60)
+    artifact_id = asyncio.run(store.save(b'data', 'image/png'))
+    path, media_type = store.get(artifact_id)
+    assert artifact_id.endswith('.png') and media_type == 'image/png'
+    with open(path, 'rb') as f:
+        assert f.read() == b'data'
+
+
+def test_expired_artifact_not_served(tmp_path):
+    store = ArtifactStore(str(tmp_path), ttl=60)
+    artifact_id = asyncio.run(store.save(b'data', 'image/jpeg'))
+    _expire(store, artifact_id)
+    assert store.get(artifact_id) is None
+    assert store.get('../etc/passwd') is None
+
+
+def test_prune_runs_at_most_once_per_interval(tmp_path):
+    store = ArtifactStore(str(tmp_path), ttl=60, prune_interval=3600)
+
+    async def main():
+        first = await store.save(b'1', 'image/png')
+        _expire(store, first)
+        # 距上次清理未满间隔，过期文件暂时保留
+        await store.save(b'2', 'image/png')
+        assert os.path.exists(os.path.join(store.directory, first))
+        store._pruned_at -= 3600
+        await store.save(b'3', 'image/png')
+        assert not os.path.exists(os.path.join(store.directory, first))
+
+    asyncio.run(main())
+    assert len(os.listdir(tmp_path)) == 2
@@ -0,0 +1,121 @@
+"""模型生成缓存：以本地桩服务代替 DeepSeek，验证重复请求只调用一次模型"""
+import json
+import time
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.cache import Cache, MemoryCacheBackend
+from app.services.deepseek_service import DeepseekService
+from app.services.generation_cache import GenerationCache
+from app.services.resilience import ResilientCaller
+from stub_server import StubServer, chat_completion
+
+
+def _counting_model():
+    """每次调用返回编号递增的点评，便于区分不同候选"""
+    calls = []
+
+    async def handler(method, path, body):
+        calls.append(json.loads(body))
+        return 200, chat_completion(f"【点评】第{len(calls)}次生成")
+
+    return calls, handler
+
+
+def _run(monkeypatch, scenario, variety: int = 1, ttl: float = 3600):
+    calls, handler = _counting_model()
+    cache = GenerationCache(Cache(MemoryCacheBackend(), 'llm', ttl), variety=variety)
+
+    async def main():
+        async with StubServer(handler) as server, httpx.AsyncClient() as client:
+            monkeypatch.setenv('DEEPSEEK_API_KEY', 'test-key')
+            monkeypatch.setenv('DEEPSEEK_API_BASE', server.url)
+            service = DeepseekService(http_client=client, cache=cache)
+            return await scenario(service, server)
+
+    return calls, cache, asyncio.run(main())
+
+
+def test_repeated_request_hits_model_once(monkeypatch):
+    async def scenario(service, server):
+        first = await service.process_poetry('春风又绿江南岸')
+        # 归一化后相同的输入命中同一缓存条目
+        second = await service.process_poetry('  春风又绿江南岸 ')
+        assert server.requests[0][1].endswith('/chat/completions')
+        return first, second
+
+    calls, cache, (first, second) = _run(monkeypatch, scenario)
+    assert len(calls) == 1
+    assert first == second == {'comment': '第1次生成', 'svg': ''}
+    assert cache.stats.as_dict()['hits'] == 1
+    assert cache.stats.as_dict()['misses'] == 1
+
+
+def test_variety_rotates_candidates(monkeypatch):
+    async def scenario(service, server):
+        return [(await service.process_poetry('明月'))['comment'] for _ in range(5)]
+
+    calls, cache, comments = _run(monkeypatch, scenario, variety=2)
+    # 前两次填满候选，之后在候选之间轮换，不再调用模型
+    assert len(calls) == 2
+    assert comments == ['第1次生成', '第2次生成', '第1次生成', '第2次生成', '第1次生成']
+    assert cache.stats.hits == 3
+    assert cache.stats.misses == 2
+
+
+def test_rotation_keeps_original_expiry(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: clock[0])
+
+    async def scenario(service, server):
+        expiries = []
+        for _ in range(4):
+            await service.process_poetry('明月')
+            expiries.append(next(iter(service.cache.cache.backend._data.values()))[0])
+            clock[0] += 30
+        return expiries
+
+    calls, cache, expiries = _run(monkeypatch, scenario, variety=2, ttl=100)
+    # 轮换游标写回时沿用首次写入的过期时间，不因每次命中而续期
+    assert expiries == [1100.0] * 4
+
+
+def test_failed_generation_is_not_cached(monkeypatch):
+    calls = []
+
+    async def handler(method, path, body):
+        calls.append(body)
+        return 500, {'error': {'message': 'boom'}}
+
+    cache = GenerationCache(Cache(MemoryCacheBackend(), 'llm', 3600))
+
+    async def main():
+        async with StubServer(handler) as server, httpx.AsyncClient() as client:
+            monkeypatch.setenv('DEEPSEEK_API_KEY', 'test-key')
+            monkeypatch.setenv('DEEPSEEK_API_BASE', server.url)
+            resilience = ResilientCaller('deepseek', max_attempts=1)
+            service = DeepseekService(http_client=client, cache=cache, resilience=resilience)
+            return [await service.process_poetry('明月') for _ in range(2)]
+
+    assert asyncio.run(main()) == [None, None]
+    assert len(calls) == 2
+    assert cache.stats.hits == 0
+
+
+def test_poetry_timeout_propagates(monkeypatch):
+    async def handler(method, path, body):
+        await asyncio.sleep(1)
+        return 200, chat_completion("【点评】太迟了")
+
+    async def main():
+        async with StubServer(handler) as server, httpx.AsyncClient() as client:
+            monkeypatch.setenv('DEEPSEEK_API_KEY', 'test-key')
+            monkeypatch.setenv('DEEPSEEK_API_BASE', server.url)
+            service = DeepseekService(http_client=client, resilience=ResilientCaller('deepseek', timeout=0.05, max_attempts=1))
+            # 超时不再被吞掉返回 None，由接口映射为 504
+            with pytest.raises(asyncio.TimeoutError):
+                await service.process_poetry('明月')
+
+    asyncio.run(main())
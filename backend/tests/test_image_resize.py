@@ -0,0 +1,63 @@
+"""多尺寸缩放：各种输入模式在大幅缩小与各输出格式下都能正常编码"""
+from io import BytesIO
+
+import pytest
+from PIL import Image, features
+
+from app.services.image_service import ImageService
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    buffered = BytesIO()
+    image.save(buffered, format=fmt)
+    return buffered.getvalue()
+
+
+def _palette_png() -> bytes:
+    image = Image.new('RGB', (800, 600), 'red').convert('P', palette=Image.Palette.ADAPTIVE)
+    return _encode(image, 'PNG')
+
+
+def _transparent_gif() -> bytes:
+    image = Image.new('P', (800, 600), 0)
+    image.info['transparency'] = 0
+    return _encode(image, 'GIF')
+
+
+def _cmyk_jpeg() -> bytes:
+    return _encode(Image.new('CMYK', (800, 600), (0, 255, 255, 0)), 'JPEG')
+
+
+def _bilevel_png() -> bytes:
+    return _encode(Image.new('1', (800, 600), 1), 'PNG')
+
+
+def _sixteen_bit_png() -> bytes:
+    return _encode(Image.new('I;16', (800, 600), 4000), 'PNG')
+
+
+@pytest.fixture(scope='module')
+def service():
+    service = ImageService(max_workers=1)
+    yield service
+    service.close()
+
+
+@pytest.mark.parametrize('source', [_palette_png, _transparent_gif, _cmyk_jpeg, _bilevel_png, _sixteen_bit_png])
+@pytest.mark.parametrize('fmt', ['PNG', 'WEBP', 'JPEG'])
+def test_downscale_any_mode(service, source, fmt):
+    if fmt == 'WEBP' and not features.check('webp'):
+        pytest.skip('当前 Pillow 不支持 WEBP 编码')
+    outputs = service._resize_to_sizes(source(), [(100, 75), (40, 30)], fmt, 85)
+    assert [(item['width'], item['height']) for item in outputs] == [(100, 75), (40, 30)]
+    for item in outputs:
+        decoded = Image.open(BytesIO(item['data']))
+        assert decoded.format == fmt
+        assert decoded.size == (item['width'], item['height'])
+
+
+def test_transparency_kept_except_jpeg(service):
+    png = service._resize_to_sizes(_transparent_gif(), [(100, 75)], 'PNG', 85)[0]
+    jpeg = service._resize_to_sizes(_transparent_gif(), [(100, 75)], 'JPEG', 85)[0]
+    assert Image.open(BytesIO(png['data'])).mode == 'RGBA'
+    assert Image.open(BytesIO(jpeg['data'])).mode == 'RGB'
@@ -0,0 +1,46 @@
+"""冷启动回归测试：导入应用时不应加载重型依赖，导入耗时不超过预算
+
+在 backend 目录下运行：python -m pytest tests
+"""
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只应在首次使用对应服务时才导入的重型依赖
+HEAVY_MODULES = ('PIL', 'openai', 'httpx')
+
+# app.main 的累计导入耗时预算（毫秒），较慢的机器可通过环境变量放宽
+IMPORT_TIME_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', 1500))
+
+
+def _import_app():
+    """在新的解释器中以 -X importtime 导入 app.main，返回 (已加载的重型模块, app.main 累计耗时毫秒)"""
+    code = (
+        "import sys, app.main; "
+        f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))"
+    )
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, LOG_LEVEL='WARNING')
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60, check=True
+    )
+    loaded = [name for name in completed.stdout.strip().split(',') if name]
+
+    # importtime 输出格式：import time: self [us] | cumulative | imported package
+    cumulative_us = None
+    for line in completed.stderr.splitlines():
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == 'app.main':
+            cumulative_us = int(parts[1])
+    assert cumulative_us is not None, completed.stderr[-2000:]
+    return loaded, cumulative_us / 1000
+
+
+def test_import_app_main():
+    loaded, elapsed_ms = _import_app()
+    assert loaded == [], f"导入 app.main 时加载了重型依赖: {loaded}"
+    assert elapsed_ms < IMPORT_TIME_BUDGET_MS, (
+        f"导入 app.main 耗时 {elapsed_ms:.0f}ms，超过预算 {IMPORT_TIME_BUDGET_MS:.0f}ms"
+    )
@@ -0,0 +1,68 @@
+"""后台任务队列：幂等键按客户端隔离，参数不一致时拒绝"""
+import asyncio
+
+import pytest
+
+from app.services.job_queue import IdempotencyConflictError, JobQueue
+
+
+async def _result():
+    return 'ok'
+
+
+def _run(scenario):
+    async def main():
+        queue = JobQueue(workers=1)
+        try:
+            return await scenario(queue)
+        finally:
+            await queue.stop()
+
+    return asyncio.run(main())
+
+
+def test_same_client_same_key_returns_existing_job():
+    async def scenario(queue):
+        first = queue.submit(_result, 'key', client='ip:1.2.3.4', fingerprint='a')
+        second = queue.submit(_result, 'key', client='ip:1.2.3.4', fingerprint='a')
+        return first, second
+
+    first, second = _run(scenario)
+    assert first is second
+
+
+def test_keys_are_scoped_by_client():
+    async def scenario(queue):
+        first = queue.submit(_result, 'key', client='ip:1.2.3.4', fingerprint='a')
+        # 其他客户端使用相同幂等键时得到自己的任务，不会读到别人的结果
+        second = queue.submit(_result, 'key', client='ip:5.6.7.8', fingerprint='a')
+        return first, second
+
+    first, second = _run(scenario)
+    assert first.id != second.id
+
+
+def test_mismatched_parameters_conflict():
+    async def scenario(queue):
+        queue.submit(_result, 'key', client='ip:1.2.3.4', fingerprint='a')
+        with pytest.raises(IdempotencyConflictError):
+            queue.submit(_result, 'key', client='ip:1.2.3.4', fingerprint='b')
+
+    _run(scenario)
+
+
+def test_failed_job_can_be_resubmitted():
+    async def fail():
+        raise RuntimeError('boom')
+
+    async def scenario(queue):
+        queue.start()
+        first = queue.submit(fail, 'key', client='ip:1.2.3.4', fingerprint='a')
+        while not first.done:
+            await asyncio.sleep(0)
+        second = queue.submit(_result, 'key', client='ip:1.2.3.4', fingerprint='b')
+        return first, second
+
+    first, second = _run(scenario)
+    assert first.status == 'failed'
+    assert second.id != first.id
@@ -0,0 +1,34 @@
+"""诗意接口：上游超时返回 504，而不是参数错误的 400"""
+from starlette.testclient import TestClient
+
+from app.main import app
+from app.services.registry import ServiceRegistry
+from app.services.resilience import DeadlineExceeded
+
+
+class TimeoutService:
+    async def process_poetry(self, text):
+        raise DeadlineExceeded("请求处理超时")
+
+
+class EmptyService:
+    async def process_poetry(self, text):
+        return None
+
+
+def _client(monkeypatch, deepseek) -> TestClient:
+    registry = ServiceRegistry()
+    registry._services['deepseek'] = deepseek
+    registry._config_errors['coze'] = "COZE_API_KEY 环境变量未设置"
+    monkeypatch.setattr(app.state, 'registry', registry, raising=False)
+    return TestClient(app)
+
+
+def test_poetry_timeout_returns_504(monkeypatch):
+    response = _client(monkeypatch, TimeoutService()).post('/api/process-poetry', json={'text': '明月'})
+    assert response.status_code == 504
+
+
+def test_poetry_empty_result_returns_400(monkeypatch):
+    response = _client(monkeypatch, EmptyService()).post('/api/process-poetry', json={'text': '明月'})
+    assert response.status_code == 400
@@ -0,0 +1,160 @@
+"""上游弹性策略：熔断器状态切换、重试与请求预算"""
+import time
+import asyncio
+
+import pytest
+
+from app.services.resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResilientCaller, UpstreamError, deadline_scope
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allows_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allows_request()
+    # allows_request 只查询，不改变状态
+    assert breaker.state == 'open'
+
+    breaker.before_call()
+    assert breaker.state == 'half_open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allows_request()
+
+
+def test_breaker_release_frees_probe(clock):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == 'half_open'
+
+
+def _flaky(errors):
+    """依次抛出 errors 中的异常，之后返回 'ok'"""
+    calls = []
+
+    async def func():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return 'ok'
+
+    return calls, func
+
+
+def test_retries_retryable_errors():
+    caller = ResilientCaller('test', base_delay=0, max_attempts=3)
+    calls, func = _flaky([UpstreamError('test', 503), asyncio.TimeoutError()])
+    assert asyncio.run(caller.call(func)) == 'ok'
+    assert len(calls) == 3
+    assert caller.breaker.failures == 0
+
+
+def test_does_not_retry_client_errors():
+    caller = ResilientCaller('test', base_delay=0, max_attempts=3)
+    calls, func = _flaky([UpstreamError('test', 400)])
+    with pytest.raises(UpstreamError):
+        asyncio.run(caller.call(func))
+    assert len(calls) == 1
+    # 上游正常应答了参数错误，不计为故障
+    assert caller.breaker.state == 'closed'
+    assert caller.breaker.failures == 0
+
+
+def test_gives_up_after_max_attempts():
+    caller = ResilientCaller('test', base_delay=0, max_attempts=2, breaker=CircuitBreaker('test', 2))
+    calls, func = _flaky([UpstreamError('test', 502)] * 5)
+    with pytest.raises(UpstreamError):
+        asyncio.run(caller.call(func))
+    assert len(calls) == 2
+    assert caller.breaker.state == 'open'
+    # 熔断后直接失败，不再发出请求
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(caller.call(func))
+    assert len(calls) == 2
+
+
+def test_stage_timeout_is_retried():
+    caller = ResilientCaller('test', timeout=0.01, base_delay=0, max_attempts=2)
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(caller.call(slow))
+    assert len(calls) == 2
+    assert caller.breaker.failures == 2
+
+
+def test_exhausted_budget_fails_without_calling():
+    caller = ResilientCaller('test', base_delay=0)
+    calls, func = _flaky([])
+
+    async def main():
+        with deadline_scope(0.01):
+            await asyncio.sleep(0.02)
+            return await caller.call(func)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+    assert calls == []
+
+
+def test_budget_timeout_not_counted_as_failure():
+    caller = ResilientCaller('test', timeout=10, base_delay=0, max_attempts=3, breaker=CircuitBreaker('test', 1))
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(1)
+
+    async def main():
+        # 阶段超时被剩余预算截短为 0.05s：超时归因于预算耗尽，不熔断、不重试
+        with deadline_scope(0.05):
+            await caller.call(slow)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+    assert len(calls) == 1
+    assert caller.breaker.state == 'closed'
+    assert caller.breaker.failures == 0
@@ -0,0 +1,22 @@
+"""缩放尺寸解析：尺寸个数与总像素受限"""
+import pytest
+from fastapi import HTTPException
+
+from app.main import _parse_sizes
+
+
+def test_parse_sizes():
+    assert _parse_sizes(None, None, '800x600, 400X300') == [(800, 600), (400, 300)]
+    assert _parse_sizes(100, 50, None) == [(100, 50)]
+
+
+@pytest.mark.parametrize('sizes', [
+    ','.join(['10x10'] * 9),
+    '10000x10000,10000x10000',
+    '0x10',
+    'abc',
+])
+def test_parse_sizes_rejects(sizes):
+    with pytest.raises(HTTPException) as error:
+        _parse_sizes(None, None, sizes)
+    assert error.value.status_code == 400
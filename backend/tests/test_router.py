@@ -0,0 +1,114 @@
+"""文本后端路由：排序、跳过未配置的后端、失败时切换"""
+import asyncio
+
+import pytest
+
+from app.services.router import ProviderRouter
+
+PROVIDERS = ['deepseek', 'coze']
+
+
+def _router(**kwargs) -> ProviderRouter:
+    return ProviderRouter({name: 0 for name in PROVIDERS}, **kwargs)
+
+
+def test_order_prefers_lower_latency():
+    router = _router()
+    router.stats['deepseek'].observe(2.0, ok=True)
+    router.stats['coze'].observe(0.5, ok=True)
+    assert router.order(PROVIDERS) == ['coze', 'deepseek']
+    # 指定的首选后端健康时排在最前
+    assert router.order(PROVIDERS, preferred='deepseek') == ['deepseek', 'coze']
+
+
+def test_order_demotes_failing_backend():
+    router = _router()
+    for _ in range(5):
+        router.stats['deepseek'].observe(0.1, ok=False)
+    assert router.order(PROVIDERS, preferred='deepseek') == ['coze', 'deepseek']
+
+
+def test_order_demotes_unavailable_and_saturated():
+    router = _router(is_available=lambda name: name != 'deepseek')
+    assert router.order(PROVIDERS, preferred='deepseek') == ['coze', 'deepseek']
+
+    router = ProviderRouter({'deepseek': 1, 'coze': 0})
+    router.stats['deepseek'].in_flight = 1
+    assert router.order(PROVIDERS, preferred='deepseek') == ['coze', 'deepseek']
+
+
+def test_order_skips_unconfigured():
+    router = _router(is_configured=lambda name: name == 'deepseek')
+    assert router.order(PROVIDERS, preferred='coze') == ['deepseek']
+
+
+def test_run_falls_back_on_error():
+    router = _router()
+    calls = []
+
+    async def call(provider):
+        calls.append(provider)
+        if provider == 'deepseek':
+            raise RuntimeError('boom')
+        return {'comment': provider}
+
+    provider, result = asyncio.run(router.run(PROVIDERS, call, preferred='deepseek'))
+    assert calls == ['deepseek', 'coze']
+    assert (provider, result) == ('coze', {'comment': 'coze'})
+    assert router.stats['deepseek'].failures == 1
+    assert router.stats['deepseek'].in_flight == 0
+
+
+def test_run_treats_empty_result_as_failure():
+    router = _router()
+
+    async def call(provider):
+        return None if provider == 'deepseek' else 'ok'
+
+    assert asyncio.run(router.run(PROVIDERS, call, preferred='deepseek')) == ('coze', 'ok')
+    assert router.stats['deepseek'].failures == 1
+
+
+def test_run_raises_last_error_when_all_fail():
+    router = _router()
+
+    async def call(provider):
+        raise RuntimeError(provider)
+
+    with pytest.raises(RuntimeError, match='coze'):
+        asyncio.run(router.run(PROVIDERS, call, preferred='deepseek'))
+
+
+def test_run_never_calls_unconfigured():
+    router = _router(is_configured=lambda name: name == 'coze')
+    calls = []
+
+    async def call(provider):
+        calls.append(provider)
+        return 'ok'
+
+    asyncio.run(router.run(PROVIDERS, call, preferred='deepseek'))
+    assert calls == ['coze']
+
+
+def test_registry_caches_unconfigured_provider(monkeypatch):
+    from app.services.registry import ServiceRegistry
+
+    registry = ServiceRegistry()
+    attempts = []
+
+    def create_coze():
+        attempts.append(1)
+        raise ValueError("COZE_API_KEY 环境变量未设置")
+
+    registry._factories['coze'] = create_coze
+    monkeypatch.setattr(registry, 'warm_up', lambda: None)
+    # 每次路由都会检查后端是否已配置，同一配置版本内只尝试构建一次
+    for _ in range(3):
+        assert registry.router.order(['coze']) == []
+        assert not registry.provider_configured('coze')
+    assert len(attempts) == 1
+
+    registry.reload()
+    assert not registry.provider_configured('coze')
+    assert len(attempts) == 2
@@ -0,0 +1,137 @@
+"""请求合并：相同键的并发调用只执行一次，取消与异常按调用方正确传递"""
+import asyncio
+
+from app.services.single_flight import SingleFlight
+
+
+class Upstream:
+    """可控的上游调用：记录调用次数，release 后返回结果"""
+
+    def __init__(self, error: Exception = None):
+        self.calls = 0
+        self.cancelled = False
+        self.error = error
+        self.released = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.released.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+        return f"result-{self.calls}"
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    async def main():
+        flight = SingleFlight()
+        upstream = Upstream()
+        waiters = [asyncio.ensure_future(flight.do('key', upstream)) for _ in range(10)]
+        await _settle()
+        upstream.released.set()
+        results = await asyncio.gather(*waiters)
+        return upstream, results, flight
+
+    upstream, results, flight = asyncio.run(main())
+    assert upstream.calls == 1
+    assert results == ['result-1'] * 10
+    assert flight._flights == {}
+
+
+def test_different_keys_run_separately():
+    async def main():
+        flight = SingleFlight()
+        upstream = Upstream()
+        upstream.released.set()
+        return upstream, await asyncio.gather(flight.do('a', upstream), flight.do('b', upstream))
+
+    upstream, results = asyncio.run(main())
+    assert upstream.calls == 2
+    assert sorted(results) == ['result-1', 'result-2']
+
+
+def test_cancelling_one_waiter_keeps_shared_call():
+    async def main():
+        flight = SingleFlight()
+        upstream = Upstream()
+        first = asyncio.ensure_future(flight.do('key', upstream))
+        second = asyncio.ensure_future(flight.do('key', upstream))
+        await _settle()
+        first.cancel()
+        await _settle()
+        upstream.released.set()
+        return upstream, first, await second
+
+    upstream, first, result = asyncio.run(main())
+    assert first.cancelled()
+    assert not upstream.cancelled
+    assert result == 'result-1'
+
+
+def test_cancelling_all_waiters_cancels_shared_call():
+    async def main():
+        flight = SingleFlight()
+        upstream = Upstream()
+        waiters = [asyncio.ensure_future(flight.do('key', upstream)) for _ in range(3)]
+        await _settle()
+        for waiter in waiters:
+            waiter.cancel()
+        await _settle()
+        # 之后到达的相同请求重新发起调用
+        upstream.released.set()
+        return upstream, await flight.do('key', upstream), flight
+
+    upstream, result, flight = asyncio.run(main())
+    assert upstream.cancelled
+    assert upstream.calls == 2
+    assert result == 'result-2'
+    assert flight._flights == {}
+
+
+def test_error_propagates_to_every_waiter():
+    async def main():
+        flight = SingleFlight()
+        upstream = Upstream(error=RuntimeError('boom'))
+        waiters = [asyncio.ensure_future(flight.do('key', upstream)) for _ in range(3)]
+        await _settle()
+        upstream.released.set()
+        return upstream, await asyncio.gather(*waiters, return_exceptions=True), flight
+
+    upstream, results, flight = asyncio.run(main())
+    assert upstream.calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    # 失败的调用不会留在表中，下一次请求重新发起
+    assert flight._flights == {}
+
+
+def test_disabled_runs_every_call():
+    async def main():
+        flight = SingleFlight(enabled=False)
+        upstream = Upstream()
+        upstream.released.set()
+        await asyncio.gather(*(flight.do('key', upstream) for _ in range(3)))
+        return upstream
+
+    assert asyncio.run(main()).calls == 3
+
+
+def test_len_counts_flights_in_progress():
+    async def main():
+        flight = SingleFlight()
+        upstream = Upstream()
+        waiters = [asyncio.ensure_future(flight.do(key, upstream)) for key in ('a', 'a', 'b')]
+        await _settle()
+        in_progress = len(flight)
+        upstream.released.set()
+        await asyncio.gather(*waiters)
+        return in_progress, len(flight)
+
+    assert asyncio.run(main()) == (2, 0)
@@ -0,0 +1,101 @@
+"""诗意卡片 SVG 清理：前端以 v-html 插入，输出中不得残留可执行内容"""
+from xml.etree import ElementTree as ET
+
+import pytest
+
+from app.services.svg_pipeline import clean_svg
+
+
+def _clean(body: str, attrs: str = 'viewBox="0 0 100 100"') -> str:
+    return clean_svg(f'<svg xmlns="http://www.w3.org/2000/svg" {attrs}>{body}</svg>')
+
+
+def _assert_safe(svg: str):
+    lowered = svg.lower()
+    for needle in ('<script', 'javascript:', 'foreignobject', ' on', 'http://evil', '@import', '<iframe'):
+        assert needle not in lowered.replace(' xmlns="http://www.w3.org/2000/svg"', ''), svg
+    ET.fromstring(svg)
+
+
+@pytest.mark.parametrize('body', [
+    '<script>alert(1)</script><rect width="10" height="10"/>',
+    '<g><script type="text/javascript">alert(1)</script></g>',
+    '<foreignObject width="10" height="10"><iframe src="http://evil"/></foreignObject>',
+    '<image href="http://evil/x.png" width="10" height="10"/>',
+    '<rect width="10" height="10" onclick="alert(1)" onmouseover="alert(2)"/>',
+    '<a href="javascript:alert(1)"><text>x</text></a>',
+    '<use href="http://evil/sprite.svg#icon"/>',
+    '<use xmlns:xlink="http://www.w3.org/1999/xlink" xlink:href="javascript:alert(1)"/>',
+    '<rect width="10" height="10" style="fill: url(http://evil/x)"/>',
+    '<rect width="10" height="10" fill="url(javascript:alert(1))"/>',
+    '<style>@import url(http://evil/x.css);</style>',
+    '<rect width="10" height="10" style="background: expression(alert(1))"/>',
+])
+def test_removes_executable_content(body):
+    _assert_safe(_clean(body))
+
+
+def test_onload_on_root_removed():
+    svg = _clean('<circle cx="5" cy="5" r="5"/>', attrs='viewBox="0 0 10 10" onload="alert(1)"')
+    _assert_safe(svg)
+    assert '<circle' in svg
+
+
+def test_keeps_local_references():
+    svg = _clean(
+        '<defs><linearGradient id="g"><stop offset="0" stop-color="#fff"/></linearGradient></defs>'
+        '<rect width="10" height="10" fill="url(#g)"/><use href="#g"/>'
+    )
+    assert 'fill="url(#g)"' in svg
+    assert 'href="#g"' in svg
+
+
+def test_rejects_entities():
+    svg = (
+        '<?xml version="1.0"?><!DOCTYPE svg [<!ENTITY x "boom">]>'
+        '<svg xmlns="http://www.w3.org/2000/svg"><text>&x;</text></svg>'
+    )
+    assert clean_svg(svg) == ''
+
+
+def test_rejects_non_svg_root():
+    assert clean_svg('<html><svg></svg></html>').startswith('<svg')
+    assert clean_svg('没有插图') == ''
+
+
+def test_extracts_svg_from_model_output():
+    svg = clean_svg('下面是插图：\n```svg\n<svg viewBox="0 0 10 10"><circle cx="5" cy="5" r="5"/></svg>\n```')
+    assert svg == '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 10 10"><circle cx="5" cy="5" r="5"/></svg>'
+
+
+def test_repairs_stray_ampersand():
+    svg = clean_svg('<svg viewBox="0 0 10 10"><text>风 & 月&nbsp;夜</text></svg>')
+    assert '<text>风 &amp; 月\xa0夜</text>' in svg
+
+
+def test_repairs_truncated_output():
+    # max_tokens 截断在属性中间：丢弃不完整的标签并补全未闭合的元素
+    svg = clean_svg('<svg viewBox="0 0 10 10"><g fill="red"><circle cx="5" cy="5" r="5"/><path d="M0 0 L1')
+    assert svg == '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 10 10"><g fill="red"><circle cx="5" cy="5" r="5"/></g></svg>'
+
+
+def test_repaired_output_is_still_sanitized():
+    _assert_safe(clean_svg('<svg viewBox="0 0 10 10"><g onclick="alert(1)"><script>alert(1)</script><rect x="1'))
+
+
+def test_unrecoverable_svg_dropped_with_warning(caplog):
+    with caplog.at_level('WARNING', logger='app.services.svg_pipeline'):
+        assert clean_svg('<svg viewBox="0 0 10 10"><<<g></svg>') == ''
+    assert '已丢弃插图' in caplog.text
+
+
+def test_finalize_flags_dropped_svg():
+    import asyncio
+    from app.main import _finalize_poetry
+
+    dropped = asyncio.run(_finalize_poetry(None, {'comment': '好', 'svg': '<svg><<<</svg>'}, None))
+    assert dropped['svg'] == '' and dropped['svg_dropped'] is True
+    kept = asyncio.run(_finalize_poetry(None, {'comment': '好', 'svg': '<svg viewBox="0 0 1 1"/>'}, None))
+    assert kept['svg'] and kept['svg_dropped'] is False
+    missing = asyncio.run(_finalize_poetry(None, {'comment': '好', 'svg': ''}, None))
+    assert missing['svg_dropped'] is False
@@ -0,0 +1,48 @@
+"""请求体大小限制：按 Content-Length 与实际接收字节数拒绝超限请求"""
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.services.upload_ingest import UploadSizeMiddleware
+
+LIMIT = 1000
+
+
+async def echo(request: Request):
+    body = await request.body()
+    return JSONResponse({'size': len(body)})
+
+
+def _client() -> TestClient:
+    app = Starlette(routes=[Route('/upload', echo, methods=['POST']), Route('/other', echo, methods=['POST'])])
+    app.add_middleware(UploadSizeMiddleware, limit_for=lambda scope: LIMIT if scope['path'] == '/upload' else None)
+    return TestClient(app)
+
+
+def _chunks(size: int, chunk: int = 256):
+    for start in range(0, size, chunk):
+        yield b'x' * min(chunk, size - start)
+
+
+def test_within_limit():
+    response = _client().post('/upload', content=b'x' * LIMIT)
+    assert response.status_code == 200
+    assert response.json() == {'size': LIMIT}
+
+
+def test_content_length_over_limit():
+    response = _client().post('/upload', content=b'x' * (LIMIT + 1))
+    assert response.status_code == 413
+
+
+def test_chunked_body_over_limit():
+    response = _client().post('/upload', content=_chunks(LIMIT * 4))
+    assert response.status_code == 413
+    assert response.json() == {'detail': '文件过大'}
+
+
+def test_unlimited_path():
+    response = _client().post('/other', content=_chunks(LIMIT * 4))
+    assert response.status_code == 200
@@ -96,9 +96,32 @@ export const useImageProcessing = () => {
     }
   }
 
+  /**
+   * 在服务端渲染诗意卡片
+   * @param {string} comment - 点评
+   * @param {string} svg - SVG 插图
+   * @returns {Promise<string>} 卡片图片的 data URL，服务端无法渲染时抛出错误
+   */
+  const renderPoetryCard = async (comment, svg) => {
+    const response = await axios.post(`${API_BASE_URL}/poetry-card`, {
+      comment: comment,
+      svg: svg,
+      format: 'png'
+    }, {
+      responseType: 'blob'
+    })
+    return new Promise((resolve, reject) => {
+      const reader = new FileReader()
+      reader.onload = () => resolve(reader.result)
+      reader.onerror = () => reject(reader.error)
+      reader.readAsDataURL(response.data)
+    })
+  }
+
   return {
     processImage,
     resizeImage,
-    processPoetry
+    processPoetry,
+    renderPoetryCard
   }
 } 
\ No newline at end of file